@@ -0,0 +1,62 @@
+# benchmarks/bench_messages.py
+"""
+Бенчмарк хранения сообщений: список словарей против MessageLog
+
+Запуск: python -m benchmarks.bench_messages
+
+Сравниваются:
+- память на N сообщений (tracemalloc, вместе с текстом);
+- копия истории перед сохранением (list.copy() против снимка);
+- проверка «к чату только добавили сообщения» перед update_chat.
+"""
+
+import time
+import tracemalloc
+from core.messages import MessageLog
+
+SIZES = (10_000, 200_000)
+REPEAT = 50
+
+
+def make_dicts(count):
+    return [{"role": "user" if i % 2 else "assistant", "content": f"сообщение {i}"}
+            for i in range(count)]
+
+
+def measure_memory(factory):
+    tracemalloc.start()
+    value = factory()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size
+
+
+def timed(func, repeat=REPEAT):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def main():
+    print(f"{'Сообщений':>10} {'Операция':<22} {'dict-список':>14} {'MessageLog':>14}")
+    print("-" * 64)
+    for size in SIZES:
+        dicts, dict_bytes = measure_memory(lambda: make_dicts(size))
+        log, log_bytes = measure_memory(lambda: MessageLog(make_dicts(size)))
+
+        print(f"{size:>10} {'память, МБ':<22} {dict_bytes / 2 ** 20:>14.1f} {log_bytes / 2 ** 20:>14.1f}")
+        print(f"{size:>10} {'копия, мс':<22} {timed(dicts.copy):>14.3f} {timed(log.snapshot):>14.3f}")
+
+        # Старая проверка префикса срезом против снимка того же буфера
+        stored_dicts, stored_log = dicts.copy(), log.snapshot()
+        dicts.append({"role": "user", "content": "новое"})
+        log.append({"role": "user", "content": "новое"})
+        count = len(stored_dicts)
+        print(f"{size:>10} {'проверка префикса, мс':<22} "
+              f"{timed(lambda: dicts[:count] == stored_dicts):>14.3f} "
+              f"{timed(lambda: log.startswith(stored_log)):>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
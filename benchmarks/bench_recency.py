@@ -0,0 +1,92 @@
+# benchmarks/bench_recency.py
+"""
+Бенчмарк последних чатов: полная сортировка против RecencyIndex
+
+Запуск: python -m benchmarks.bench_recency
+
+Сравниваются три операции над N чатами в RAM (без диска):
+- последние 15 чатов для сайдбара;
+- обновление чата после ответа (чат становится самым свежим);
+- обрезка истории до max_history.
+"""
+
+import datetime
+import random
+import time
+from core.recency_index import RecencyIndex
+
+SIZES = (10_000, 100_000)
+TOP = 15
+REPEAT = 50
+
+
+def make_chats(count):
+    start = datetime.datetime(2024, 1, 1)
+    chats = {}
+    for i in range(count):
+        chat_id = f"chat_{i}"
+        timestamp = (start + datetime.timedelta(seconds=random.randint(0, 10 ** 8))).isoformat()
+        chats[chat_id] = {"id": chat_id, "title": chat_id, "timestamp": timestamp}
+    return chats
+
+
+def timed(func, repeat=REPEAT):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) * 1000 / repeat
+
+
+def sorted_top(chats):
+    """Старый способ: сортировка всех чатов на каждый вызов"""
+    return sorted(chats.items(), key=lambda x: x[1].get("timestamp", ""), reverse=True)[:TOP]
+
+
+def main():
+    print(f"{'Чатов':>8} {'Операция':<24} {'sorted, мс':>12} {'индекс, мс':>12}")
+    print("-" * 60)
+    for size in SIZES:
+        chats = make_chats(size)
+        index = RecencyIndex()
+        build_ms = timed(lambda: index.sync({}) or index.sync(chats), repeat=1)
+
+        assert [cid for cid, _ in sorted_top(chats)] == index.newest(TOP)
+
+        print(f"{size:>8} {'построение индекса':<24} {'-':>12} {build_ms:>12.3f}")
+        print(f"{size:>8} {'последние ' + str(TOP):<24} "
+              f"{timed(lambda: sorted_top(chats)):>12.3f} {timed(lambda: index.newest(TOP)):>12.3f}")
+
+        # Обновление: ответ в случайном чате делает его самым свежим
+        ids = list(chats)
+        now = datetime.datetime(2030, 1, 1)
+
+        def touch():
+            nonlocal now
+            now += datetime.timedelta(seconds=1)
+            chat_id = random.choice(ids)
+            chats[chat_id]["timestamp"] = now.isoformat()
+            index.touch(chat_id, chats[chat_id]["timestamp"])
+
+        print(f"{size:>8} {'обновление + последние':<24} "
+              f"{timed(lambda: (touch(), sorted_top(chats))):>12.3f} "
+              f"{timed(lambda: (touch(), index.newest(TOP))):>12.3f}")
+
+        # Обрезка истории: убираем 1% самых старых
+        excess = size // 100
+        max_history = size - excess
+
+        def trim_sorted():
+            return dict(sorted(chats.items(), key=lambda x: x[1].get("timestamp", ""),
+                               reverse=True)[:max_history])
+
+        trim_sorted_ms = timed(trim_sorted, repeat=5)
+        start = time.perf_counter()
+        index.pop_oldest(excess)
+        trim_index_ms = (time.perf_counter() - start) * 1000
+
+        print(f"{size:>8} {'обрезка ' + str(excess) + ' чатов':<24} "
+              f"{trim_sorted_ms:>12.3f} {trim_index_ms:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# benchmarks/bench_renderer.py
+"""
+Бенчмарк вывода ответа: посимвольный type_writer против BatchedRenderer
+
+Запуск: python -m benchmarks.bench_renderer
+
+Вместо настоящего Tk используется поддельный Label, поэтому измеряется
+только стоимость на стороне Python (копирование строк, число configure
+и прокруток). Реальная стоимость перерисовки Tk пропорциональна числу
+вызовов configure/прокрутки, которое тоже выводится.
+"""
+
+import time
+from utils.renderer import BatchedRenderer
+
+SIZES = {"1 KB": 1024, "10 KB": 10 * 1024, "100 KB": 100 * 1024}
+CHUNK = 8  # символов в одной части потока (~2 токена)
+
+
+class FakeLabel:
+    def __init__(self):
+        self._text = ""
+        self.configures = 0
+
+    def cget(self, key):
+        return self._text
+
+    def configure(self, text):
+        self._text = text
+        self.configures += 1
+
+
+class FakeScheduler:
+    """Кадры прогоняются вручную через tick(), after() не нужен"""
+    def after(self, ms, func, *args):
+        pass
+
+
+def make_reply(size):
+    base = "Привет! Это тестовый ответ Jarvis с **разметкой** и кодом. "
+    return (base * (size // len(base) + 1))[:size]
+
+
+def bench_type_writer(text):
+    """Старый цикл: cget + configure + прокрутка на каждый символ"""
+    label = FakeLabel()
+    scrolls = 0
+    start = time.perf_counter()
+    for ch in text:
+        current = label.cget("text")
+        label.configure(text=current + ch)
+        scrolls += 1
+    return (time.perf_counter() - start) * 1000, label.configures, scrolls
+
+
+def bench_batched_stream(text, frames_per_chunk=0.25):
+    """Поток частей, которые копятся между кадрами"""
+    label = FakeLabel()
+    counter = {"scrolls": 0}
+
+    def on_frame():
+        counter["scrolls"] += 1
+
+    renderer = BatchedRenderer(FakeScheduler(), label, on_frame=on_frame)
+    chunks = [text[i:i + CHUNK] for i in range(0, len(text), CHUNK)]
+    per_frame = max(1, int(1 / frames_per_chunk))
+
+    start = time.perf_counter()
+    for i, chunk in enumerate(chunks):
+        renderer.feed(chunk)
+        if i % per_frame == 0:
+            renderer.tick()
+    renderer.finish()
+    while renderer.tick():
+        pass
+    return (time.perf_counter() - start) * 1000, label.configures, counter["scrolls"]
+
+
+def bench_batched_typewriter(text):
+    """Режим печатной машинки, но пакетами раз в кадр"""
+    label = FakeLabel()
+    counter = {"scrolls": 0}
+
+    def on_frame():
+        counter["scrolls"] += 1
+
+    renderer = BatchedRenderer(FakeScheduler(), label, on_frame=on_frame, cursor="")
+    renderer.typewrite(text, chars_per_second=100)
+
+    start = time.perf_counter()
+    while renderer.tick():
+        pass
+    return (time.perf_counter() - start) * 1000, label.configures, counter["scrolls"]
+
+
+def main():
+    print(f"{'Ответ':<8} {'Метод':<22} {'мс/ответ':>10} {'configure':>10} {'прокрутки':>10}")
+    print("-" * 64)
+    for name, size in SIZES.items():
+        text = make_reply(size)
+        for method, func in (
+            ("type_writer (старый)", bench_type_writer),
+            ("batched stream", bench_batched_stream),
+            ("batched typewriter", bench_batched_typewriter),
+        ):
+            ms, configures, scrolls = func(text)
+            print(f"{name:<8} {method:<22} {ms:>10.2f} {configures:>10} {scrolls:>10}")
+
+
+if __name__ == "__main__":
+    main()
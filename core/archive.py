@@ -0,0 +1,191 @@
+# core/archive.py
+"""
+Архив чатов: по строке JSON на чат, с необязательным сжатием gzip/zstd
+
+Архив читается и пишется потоком — в памяти одновременно держится
+только один чат, сколько бы их ни было в файле.
+"""
+
+import gzip
+import io
+import json
+import os
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from core.messages import json_default
+from utils.file_utils import fsync_directory
+
+# zstd — необязательная зависимость (pip install zstandard)
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+ARCHIVE_FORMAT = "jarvis-archive"
+ARCHIVE_VERSION = 1
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+class NotAnArchive(ValueError):
+    """Файл не является архивом чатов (например, старый экспорт одним JSON)"""
+
+
+def compression_for(path: str) -> Optional[str]:
+    """Сжатие по расширению файла: .gz -> gzip, .zst/.zstd -> zstd"""
+    lower = path.lower()
+    if lower.endswith(".gz"):
+        return "gzip"
+    if lower.endswith((".zst", ".zstd")):
+        return "zstd"
+    return None
+
+
+class ArchiveWriter:
+    def __init__(self, path: str, compression: Optional[str] = None):
+        """
+        Писатель архива (файл появляется атомарно при закрытии)
+
+        Args:
+            path: Путь к архиву
+            compression: None, "gzip" или "zstd" (по умолчанию — по расширению)
+        """
+        self.path = path
+        self.compression = compression or compression_for(path)
+        self._temp_path = f"{path}.tmp"
+        self._raw = open(self._temp_path, 'wb')
+
+        if self.compression == "gzip":
+            stream = gzip.GzipFile(fileobj=self._raw, mode='wb')
+        elif self.compression == "zstd":
+            if not ZSTD_AVAILABLE:
+                self._raw.close()
+                os.remove(self._temp_path)
+                raise RuntimeError("Для сжатия zstd установите: pip install zstandard")
+            stream = zstandard.ZstdCompressor().stream_writer(self._raw, closefd=False)
+        else:
+            stream = self._raw
+        self._text = io.TextIOWrapper(stream, encoding='utf-8', write_through=False)
+        self._closed = False
+
+    def write_header(self, meta: Dict[str, Any]):
+        """Первая строка архива: формат, версия и общие данные (настройки и т.п.)"""
+        self._write({"type": "header", "format": ARCHIVE_FORMAT, "version": ARCHIVE_VERSION, **meta})
+
+    def write_chat(self, chat: Dict[str, Any]):
+        """Записать один чат вместе с сообщениями"""
+        self._write({"type": "chat", "chat": chat})
+
+    def _write(self, record: Dict[str, Any]):
+        self._text.write(json.dumps(record, ensure_ascii=False, default=json_default))
+        self._text.write("\n")
+
+    def close(self, commit: bool = True):
+        """Закрыть архив; при commit=False недописанный файл удаляется"""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if self._raw is self._text.buffer:
+                self._text.flush()
+                self._text.detach()
+            else:
+                self._text.close()  # Дописывает хвост сжатого потока
+            self._raw.flush()
+            os.fsync(self._raw.fileno())
+        finally:
+            self._raw.close()
+
+        if commit:
+            os.replace(self._temp_path, self.path)
+            fsync_directory(self.path)
+        elif os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(commit=exc_type is None)
+
+
+class ArchiveReader:
+    def __init__(self, path: str):
+        """
+        Читатель архива (сжатие определяется по содержимому файла)
+
+        Raises:
+            NotAnArchive: Файл не начинается с заголовка архива
+        """
+        self.path = path
+        self.size = os.path.getsize(path)
+        self._raw = open(path, 'rb')
+
+        try:
+            magic = self._raw.read(4)
+            self._raw.seek(0)
+            if magic.startswith(GZIP_MAGIC):
+                stream = gzip.GzipFile(fileobj=self._raw, mode='rb')
+            elif magic == ZSTD_MAGIC:
+                if not ZSTD_AVAILABLE:
+                    raise RuntimeError("Для чтения архива zstd установите: pip install zstandard")
+                stream = zstandard.ZstdDecompressor().stream_reader(self._raw, closefd=False)
+            else:
+                stream = self._raw
+            self._text = io.TextIOWrapper(stream, encoding='utf-8')
+
+            first_line = self._text.readline()
+            try:
+                header = json.loads(first_line)
+            except ValueError:
+                header = None
+            if not isinstance(header, dict) or header.get("format") != ARCHIVE_FORMAT:
+                raise NotAnArchive(f"{path} не является архивом чатов")
+            if header.get("version", 0) > ARCHIVE_VERSION:
+                raise ValueError(f"Архив создан более новой версией (v{header.get('version')})")
+        except Exception:
+            self._raw.close()
+            raise
+
+        self.header = header
+
+    @property
+    def position(self) -> int:
+        """Сколько байт файла уже прочитано (для прогресса)"""
+        try:
+            return self._raw.tell()
+        except (ValueError, OSError):
+            return self.size
+
+    def chats(self, progress: Optional[Callable[[int, int], None]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Перебрать чаты архива по одному
+
+        Args:
+            progress: Вызывается после каждого чата: (прочитано байт, размер файла)
+        """
+        for line in self._text:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Оборванный хвост (архив дописан не до конца) — останавливаемся
+                print(f"Архив {self.path} обрывается, прочитано до {self.position} байт")
+                break
+            if record.get("type") == "chat":
+                yield record["chat"]
+                if progress:
+                    progress(self.position, self.size)
+
+    def close(self):
+        self._raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,274 @@
+# core/blobs.py
+"""
+Общие тексты сообщений с адресацией по хешу
+
+Длинные тексты (вставленные файлы, повторяющиеся системные промпты,
+перегенерированные ответы) хранятся один раз, а сообщения в файлах чатов
+ссылаются на них по хешу: {"role": ..., "blob": hash}. У каждого текста
+есть счетчик ссылок; когда последний ссылающийся чат удален, текст
+становится мусором и уходит при уплотнении файла.
+
+Файл — журнал строк JSON, счетчик текста равен сумме его изменений:
+    {"hash": h, "text": "...", "refs": n}   текст и первые ссылки
+    {"hash": h, "refs": n}                  изменение числа ссылок
+В RAM держатся только смещения и счетчики, тексты читаются по требованию.
+Запись идет под межпроцессной блокировкой хранилища; файл, переписанный
+другим процессом, перечитывается.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+from core.messages import SHARED_CONTENT_SIZE
+from utils.file_utils import atomic_write_bytes
+
+BLOB_CACHE_SIZE = 256  # Сколько недавно прочитанных текстов держать в RAM
+COMPACT_MIN_GARBAGE = 1024 * 1024  # Уплотняем, когда мусора больше этого и больше живых данных
+
+
+def content_hash(text: str) -> str:
+    """Хеш текста, по которому на него ссылаются сообщения"""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class BlobStore:
+    def __init__(self, path: str):
+        """
+        Таблица общих текстов (hash -> текст) со счетчиками ссылок
+
+        Args:
+            path: Файл таблицы
+        """
+        self.path = path
+        self._lock = threading.RLock()
+        self._offsets: Optional[Dict[str, int]] = None  # hash -> смещение строки с текстом
+        self._sizes: Dict[str, int] = {}  # hash -> длина строки с текстом (байт)
+        self._refs: Dict[str, int] = {}
+        self._live_bytes = 0
+        self._garbage_bytes = 0
+        self._signature: Optional[tuple] = None  # Отпечаток файла после нашего чтения/записи
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._index())
+
+    # ================= ЧТЕНИЕ =================
+
+    def unpack(self, entries: Iterable[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """Заменить ссылки в записях файла чата текстами"""
+        messages = []
+        for entry in entries:
+            if "blob" in entry:
+                messages.append({"role": entry.get("role", ""), "content": self.get(entry["blob"])})
+            else:
+                messages.append(entry)
+        return messages
+
+    def get(self, blob: str) -> str:
+        """Текст по хешу (пустая строка, если его нет)"""
+        with self._lock:
+            text = self._cache.get(blob)
+            if text is not None:
+                self._cache.move_to_end(blob)
+                return text
+
+            # Смещение могло устареть, если файл только что уплотнил другой процесс
+            for attempt in range(2):
+                offset = self._index().get(blob)
+                if offset is None:
+                    break
+                entry = self._read_line(offset)
+                if entry is not None and entry.get("hash") == blob and "text" in entry:
+                    text = entry["text"]
+                    self._cache[blob] = text
+                    if len(self._cache) > BLOB_CACHE_SIZE:
+                        self._cache.popitem(last=False)
+                    return text
+                self._offsets = None
+
+            print(f"Ошибка чтения общего текста {blob}: его нет в {self.path}")
+            return ""
+
+    def _read_line(self, offset: int) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                return json.loads(f.readline())
+        except (OSError, ValueError):
+            return None
+
+    def _index(self) -> Dict[str, int]:
+        """Смещения текстов (читаются при первом обращении и после записи другим процессом)"""
+        if self._offsets is None or self._file_signature() != self._signature:
+            self._read_index()
+        return self._offsets
+
+    def _read_index(self):
+        offsets, sizes, refs = {}, {}, {}
+        total = 0
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        blob = entry["hash"]
+                    except (ValueError, KeyError):
+                        # Оборванная строка (сбой во время записи) — пропускаем
+                        total += len(line)
+                        continue
+                    if "text" in entry:
+                        offsets[blob] = total
+                        sizes[blob] = len(line)
+                    refs[blob] = refs.get(blob, 0) + entry.get("refs", 0)
+                    total += len(line)
+
+        live = [blob for blob in offsets if refs.get(blob, 0) > 0]
+        self._offsets = {blob: offsets[blob] for blob in live}
+        self._sizes = {blob: sizes[blob] for blob in live}
+        self._refs = {blob: refs[blob] for blob in live}
+        self._live_bytes = sum(self._sizes.values())
+        self._garbage_bytes = total - self._live_bytes
+        self._cache = OrderedDict((blob, text) for blob, text in self._cache.items() if blob in self._offsets)
+        self._signature = self._file_signature()
+
+    def _file_signature(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    # ================= ЗАПИСЬ (под блокировкой хранилища) =================
+
+    def pack(self, messages: Iterable[Any]) -> List[Dict[str, str]]:
+        """
+        Подготовить сообщения к записи в файл чата
+
+        Длинные тексты заменяются ссылками, новые дописываются в таблицу,
+        счетчики ссылок растут. Таблица пишется раньше файла чата: после
+        сбоя лучше лишний текст, чем ссылка в никуда.
+
+        Args:
+            messages: Сообщения (словари или Message)
+
+        Returns:
+            Записи для файла чата
+        """
+        entries = []
+        texts: Dict[str, str] = {}
+        added: Dict[str, int] = {}
+        with self._lock:
+            offsets = self._index()
+            for message in messages:
+                role, content = message.get("role", ""), message.get("content", "")
+                if len(content) < SHARED_CONTENT_SIZE:
+                    entries.append({"role": role, "content": content})
+                    continue
+                blob = content_hash(content)
+                if blob not in offsets:
+                    texts[blob] = content
+                added[blob] = added.get(blob, 0) + 1
+                entries.append({"role": role, "blob": blob})
+
+            self._append(added, texts)
+        return entries
+
+    def release(self, entries: Iterable[Dict[str, Any]]):
+        """Освободить ссылки записей удаленного или переписанного файла чата"""
+        removed: Dict[str, int] = {}
+        for entry in entries:
+            if "blob" in entry:
+                removed[entry["blob"]] = removed.get(entry["blob"], 0) - 1
+        if not removed:
+            return
+
+        with self._lock:
+            self._index()
+            self._append({blob: count for blob, count in removed.items() if blob in self._refs}, {})
+            if self._garbage_bytes > max(self._live_bytes, COMPACT_MIN_GARBAGE):
+                self.compact()
+
+    def _append(self, deltas: Dict[str, int], texts: Dict[str, str]):
+        """Дописать изменения счетчиков (и новые тексты) одной записью"""
+        if not deltas:
+            return
+
+        chunks = []
+        offset = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        for blob, delta in deltas.items():
+            entry = {"hash": blob, "refs": delta}
+            if blob in texts:
+                entry["text"] = texts[blob]
+            line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+            chunks.append(line)
+
+            if blob in texts:
+                self._offsets[blob] = offset
+                self._sizes[blob] = len(line)
+                self._live_bytes += len(line)
+            else:
+                self._garbage_bytes += len(line)
+            self._refs[blob] = self._refs.get(blob, 0) + delta
+            offset += len(line)
+
+            if self._refs[blob] <= 0:
+                # Последняя ссылка ушла — текст становится мусором
+                del self._refs[blob]
+                del self._offsets[blob]
+                size = self._sizes.pop(blob)
+                self._live_bytes -= size
+                self._garbage_bytes += size
+                self._cache.pop(blob, None)
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, 'ab') as f:
+            f.writelines(chunks)
+            f.flush()
+            os.fsync(f.fileno())
+        self._signature = self._file_signature()
+
+    def compact(self):
+        """Переписать файл одними живыми текстами"""
+        with self._lock:
+            offsets = self._index()
+            chunks = []
+            new_offsets, offset = {}, 0
+            for blob in list(offsets):
+                entry = self._read_line(offsets[blob])
+                if entry is None or entry.get("hash") != blob:
+                    print(f"Ошибка уплотнения общих текстов: запись {blob} испорчена")
+                    continue
+                line = (json.dumps({"hash": blob, "text": entry["text"], "refs": self._refs[blob]},
+                                   ensure_ascii=False) + "\n").encode("utf-8")
+                chunks.append(line)
+                new_offsets[blob] = offset
+                self._sizes[blob] = len(line)
+                offset += len(line)
+
+            atomic_write_bytes(self.path, b"".join(chunks))
+            self._offsets = new_offsets
+            self._refs = {blob: self._refs[blob] for blob in new_offsets}
+            self._sizes = {blob: self._sizes[blob] for blob in new_offsets}
+            self._live_bytes = offset
+            self._garbage_bytes = 0
+            self._signature = self._file_signature()
+
+    def clear(self):
+        """Удалить все тексты"""
+        with self._lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self._offsets = {}
+            self._sizes = {}
+            self._refs = {}
+            self._live_bytes = 0
+            self._garbage_bytes = 0
+            self._cache.clear()
+            self._signature = None
@@ -0,0 +1,295 @@
+# core/cold_store.py
+"""
+Холодное хранилище: старые чаты, вытесненные из основной памяти
+
+Каждый чат лежит в отдельном сжатом файле (zstd, если установлен,
+иначе gzip), метаданные — в журнале каталога. Пока хранилище не
+понадобилось, оно ничего не читает; потом в RAM держится только каталог,
+а сообщения распаковываются по требованию. Поиск идет по отдельному
+индексу, который при первом обращении догоняет каталог.
+
+Хранилище могут делить несколько процессов: каталог меняется под
+межпроцессной блокировкой и перечитывается, если его изменил другой.
+"""
+
+import gzip
+import heapq
+import json
+import os
+import shutil
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import quote
+
+from core.archive import GZIP_MAGIC, ZSTD_MAGIC, ZSTD_AVAILABLE, zstandard
+from core.messages import json_default
+from core.search_index import SearchIndex
+from utils.file_utils import FileLock, atomic_write_bytes, atomic_write_text
+
+CATALOG_COMPACT_RATIO = 2  # Каталог переписывается, когда записей в нем вдвое больше, чем чатов
+INDEX_SAVE_EVERY = 50  # Индекс пишется на диск раз в столько изменений (остальное догонит sync)
+
+
+class ColdStore:
+    def __init__(self, directory: str = "memory_archive", max_chats: int = 50_000,
+                 compression: Optional[str] = None):
+        """
+        Инициализация холодного хранилища
+
+        Args:
+            directory: Каталог хранилища
+            max_chats: Сколько чатов хранить (самые старые сверх лимита удаляются)
+            compression: "zstd" или "gzip" для новых файлов (по умолчанию zstd, если установлен)
+        """
+        self.directory = directory
+        self.chats_dir = os.path.join(directory, "chats")
+        self.catalog_file = os.path.join(directory, "catalog.jsonl")
+        self.index_file = os.path.join(directory, "index")
+        self.max_chats = max_chats
+        self.compression = compression or ("zstd" if ZSTD_AVAILABLE else "gzip")
+
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(f"{directory}.lock")  # Рядом с каталогом: clear() удаляет его целиком
+        self._catalog: Optional[Dict[str, Dict[str, Any]]] = None  # chat_id -> метаданные
+        self._catalog_records = 0
+        self._catalog_signature: Optional[tuple] = None  # Отпечаток файла каталога после чтения/записи
+        self._index: Optional[SearchIndex] = None
+        self._index_changes = 0
+        self._index_synced = False  # Индекс сверен с текущим каталогом
+
+    # ================= КАТАЛОГ =================
+
+    def __len__(self) -> int:
+        return len(self._get_catalog())
+
+    def __contains__(self, chat_id: str) -> bool:
+        return chat_id in self._get_catalog()
+
+    def get(self, chat_id: str) -> Optional[Dict[str, Any]]:
+        """Метаданные архивного чата (без сообщений)"""
+        meta = self._get_catalog().get(chat_id)
+        return dict(meta, archived=True) if meta is not None else None
+
+    def recent(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Метаданные архивных чатов, новые первыми"""
+        with self._lock:
+            metas = self._get_catalog().values()
+            if limit is None:
+                chosen = sorted(metas, key=_timestamp, reverse=True)
+            else:
+                chosen = heapq.nlargest(limit, metas, key=_timestamp)
+            return [dict(meta, archived=True) for meta in chosen]
+
+    def _get_catalog(self) -> Dict[str, Dict[str, Any]]:
+        """Каталог читается с диска при первом обращении и после записи другим процессом"""
+        with self._lock:
+            if self._catalog is None or self._signature() != self._catalog_signature:
+                self._catalog = {}
+                self._catalog_records = 0
+                self._index_synced = False
+                if os.path.exists(self.catalog_file):
+                    with open(self.catalog_file, 'r', encoding='utf-8') as f:
+                        for line in f:
+                            try:
+                                self._apply(json.loads(line))
+                            except (ValueError, KeyError):
+                                # Оборванная запись (сбой во время записи) — пропускаем
+                                continue
+                            self._catalog_records += 1
+                self._catalog_signature = self._signature()
+            return self._catalog
+
+    def _signature(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.catalog_file)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def _apply(self, record: Dict[str, Any]):
+        op = record.get("op")
+        if op == "put":
+            self._catalog[record["chat"]["id"]] = record["chat"]
+        elif op == "remove":
+            self._catalog.pop(record["id"], None)
+
+    def _append_catalog(self, records: List[Dict[str, Any]]):
+        """Дописать изменения каталога (и применить их в RAM)"""
+        if not records:
+            return
+        for record in records:
+            self._apply(record)
+
+        os.makedirs(self.directory, exist_ok=True)
+        if self._catalog_records + len(records) > CATALOG_COMPACT_RATIO * len(self._catalog) + 100:
+            # Удалений накопилось много — переписываем каталог одними живыми чатами
+            text = "".join(json.dumps({"op": "put", "chat": meta}, ensure_ascii=False) + "\n"
+                           for meta in self._catalog.values())
+            atomic_write_text(self.catalog_file, text)
+            self._catalog_records = len(self._catalog)
+        else:
+            with open(self.catalog_file, 'a', encoding='utf-8') as f:
+                f.writelines(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+                f.flush()
+                os.fsync(f.fileno())
+            self._catalog_records += len(records)
+        self._catalog_signature = self._signature()
+
+    # ================= ЧАТЫ =================
+
+    def add(self, chats: Iterable[Dict[str, Any]]) -> List[str]:
+        """
+        Переложить чаты в хранилище
+
+        Args:
+            chats: Чаты вместе с сообщениями
+
+        Returns:
+            ID чатов, которые записаны на диск
+        """
+        with self._lock, self._file_lock:
+            catalog = self._get_catalog()
+            os.makedirs(self.chats_dir, exist_ok=True)
+
+            added, records = [], []
+            for chat in chats:
+                chat_id = chat["id"]
+                try:
+                    name = quote(chat_id, safe="") + (".json.zst" if self.compression == "zstd" else ".json.gz")
+                    data = json.dumps(chat, ensure_ascii=False, default=json_default).encode("utf-8")
+                    atomic_write_bytes(os.path.join(self.chats_dir, name), self._compress(data))
+                except Exception as e:
+                    print(f"Ошибка архивации чата {chat_id}: {e}")
+                    continue
+
+                old = catalog.get(chat_id)
+                if old is not None and old["file"] != name:
+                    self._remove_file(old["file"])
+
+                meta = {key: value for key, value in chat.items() if key != "messages"}
+                meta["message_count"] = len(chat.get("messages", []))
+                meta["file"] = name
+                records.append({"op": "put", "chat": meta})
+                added.append(chat_id)
+
+                if self._index is not None:
+                    self._index.index_chat(chat)
+                    self._index_changes += 1
+
+            self._append_catalog(records)
+
+            # Сверх лимита удаляем самые старые архивные чаты
+            excess = len(catalog) - self.max_chats
+            if excess > 0:
+                oldest = heapq.nsmallest(excess, catalog.values(), key=_timestamp)
+                self.remove([meta["id"] for meta in oldest])
+
+            self.save_index()
+            return added
+
+    def load_chat(self, chat_id: str) -> Optional[Dict[str, Any]]:
+        """Прочитать архивный чат целиком (с сообщениями)"""
+        with self._lock:
+            meta = self._get_catalog().get(chat_id)
+            if meta is None:
+                return None
+            path = os.path.join(self.chats_dir, meta["file"])
+
+        try:
+            with open(path, 'rb') as f:
+                chat = json.loads(self._decompress(f.read()).decode("utf-8"))
+        except (OSError, ValueError) as e:
+            print(f"Ошибка чтения архивного чата {chat_id}: {e}")
+            return None
+        chat.pop("file", None)
+        return chat
+
+    def load_messages(self, chat_id: str) -> List[Dict[str, str]]:
+        """Сообщения архивного чата"""
+        chat = self.load_chat(chat_id)
+        return chat.get("messages", []) if chat else []
+
+    def remove(self, chat_ids: Iterable[str]):
+        """Удалить чаты из хранилища"""
+        with self._lock, self._file_lock:
+            catalog = self._get_catalog()
+            records = []
+            for chat_id in chat_ids:
+                meta = catalog.get(chat_id)
+                if meta is None:
+                    continue
+                self._remove_file(meta["file"])
+                records.append({"op": "remove", "id": chat_id})
+                if self._index is not None:
+                    self._index.remove_chat(chat_id)
+                    self._index_changes += 1
+            self._append_catalog(records)
+
+    def clear(self):
+        """Удалить все архивные чаты"""
+        with self._lock, self._file_lock:
+            if os.path.isdir(self.directory):
+                shutil.rmtree(self.directory)
+            self._catalog = {}
+            self._catalog_records = 0
+            self._catalog_signature = None
+            if self._index is not None:
+                self._index.clear()
+            self._index_changes = 0
+
+    def _remove_file(self, name: str):
+        path = os.path.join(self.chats_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.compression == "zstd":
+            return zstandard.ZstdCompressor(level=10).compress(data)
+        return gzip.compress(data, compresslevel=6)
+
+    def _decompress(self, data: bytes) -> bytes:
+        # Сжатие определяем по содержимому: файлы могли записаться до установки zstd
+        if data.startswith(ZSTD_MAGIC):
+            if not ZSTD_AVAILABLE:
+                raise RuntimeError("Для чтения архивного чата установите: pip install zstandard")
+            return zstandard.ZstdDecompressor().decompress(data)
+        if data.startswith(GZIP_MAGIC):
+            return gzip.decompress(data)
+        return data
+
+    # ================= ПОИСК =================
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[str]:
+        """Найти архивные чаты по запросу (ID по убыванию релевантности)"""
+        with self._lock:
+            catalog = self._get_catalog()
+            index = self._get_index()
+            if not self._index_synced:
+                # Каталог перечитан (его менял другой процесс) — догоняем индекс
+                self._index_changes += index.sync(catalog)
+                self._index_synced = True
+            return index.search(query, catalog, limit)
+
+    def save_index(self, force: bool = False):
+        """Записать индекс, если накопилось достаточно изменений"""
+        with self._lock:
+            if self._index is None or not self._index_changes:
+                return
+            if force or self._index_changes >= INDEX_SAVE_EVERY:
+                os.makedirs(self.directory, exist_ok=True)
+                if self._index.save():
+                    self._index_changes = 0
+
+    def _get_index(self) -> SearchIndex:
+        """Индекс загружается при первом поиске и догоняет каталог"""
+        if self._index is None:
+            self._index = SearchIndex(self.index_file, lock=self._lock, loader=self.load_messages)
+            self._index.load()
+            self._index_changes = self._index.sync(self._get_catalog())
+            self._index_synced = True
+            self.save_index(force=True)
+        return self._index
+
+
+def _timestamp(meta: Dict[str, Any]) -> str:
+    return meta.get("timestamp", "")
@@ -0,0 +1,192 @@
+# core/context.py
+"""
+Окно контекста: промпт из истории чата в пределах бюджета токенов
+
+Последние реплики идут дословно, более ранние — сводкой (сохраненной
+или собранной из первых фраз реплик), закрепленные факты попадают в
+системное сообщение всегда. Так время разбора промпта не растет вместе
+с чатом, а модель помнит, о чем шла речь.
+
+Токены считаются приблизительно — по байтам UTF-8 (около 4 байт на
+токен для латиницы, 2 символа для кириллицы): без токенизатора модели
+и за один проход по строке.
+"""
+
+import math
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+DEFAULT_BUDGET = 4096  # Токенов на промпт
+REPLY_RESERVE = 1024  # Сверх бюджета оставляем место под ответ модели
+BYTES_PER_TOKEN = 4
+MESSAGE_OVERHEAD = 4  # Служебные токены на одно сообщение (роль, разделители)
+SUMMARY_SHARE = 0.25  # Доля бюджета на сводку ранней части беседы
+DIGEST_CHARS = 160  # Сколько символов реплики берется в сводку без модели
+PINNED_HEADER = "\n\nPinned facts:\n"
+EARLIER_HEADER = "\n\nEarlier in this conversation:\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """Приблизительное число токенов в тексте"""
+    if not text:
+        return 0
+    return math.ceil(len(text.encode("utf-8")) / BYTES_PER_TOKEN)
+
+
+def message_tokens(message: Dict[str, Any]) -> int:
+    """Приблизительное число токенов сообщения вместе со служебными"""
+    return estimate_tokens(message.get("content", "")) + MESSAGE_OVERHEAD
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    """Обрезать текст примерно до tokens токенов (начало сохраняется)"""
+    if estimate_tokens(text) <= tokens:
+        return text
+    if tokens <= 0:
+        return ""
+    # Кодируем и режем по байтам (оставив место под «…»), отбрасывая разрезанный символ
+    cut = text.encode("utf-8")[:tokens * BYTES_PER_TOKEN - len("…".encode("utf-8"))]
+    return cut.decode("utf-8", errors="ignore").rstrip() + "…"
+
+
+class ContextWindow:
+    def __init__(self, budget: int = DEFAULT_BUDGET, summary_share: float = SUMMARY_SHARE,
+                 digest_chars: int = DIGEST_CHARS):
+        """
+        Сборщик промпта в пределах бюджета токенов
+
+        Args:
+            budget: Токенов на весь промпт (системное сообщение + история)
+            summary_share: Доля бюджета на сводку, если история целиком не помещается
+            digest_chars: Длина реплики в сводке, собранной без модели
+        """
+        self.budget = budget
+        self.summary_share = summary_share
+        self.digest_chars = digest_chars
+
+    @property
+    def num_ctx(self) -> int:
+        """Размер контекста для модели: промпт плюс место под ответ"""
+        return self.budget + REPLY_RESERVE
+
+    def build(self, history: Sequence[Dict[str, Any]], system_prompt: str = "",
+              pinned: Iterable[str] = (), summary: Optional[str] = None,
+              summarized: int = 0) -> List[Dict[str, str]]:
+        """
+        Собрать сообщения для модели
+
+        Args:
+            history: Сообщения чата (словари или Message), последнее — текущий вопрос
+            system_prompt: Системный промпт
+            pinned: Закрепленные факты — попадают в промпт всегда
+            summary: Готовая сводка начала беседы
+            summarized: Сколько первых сообщений history покрывает summary
+
+        Returns:
+            Сообщения в пределах бюджета: системное, затем недавние реплики дословно
+        """
+        history = [message for message in history if message.get("role") != "system"]
+        system = self._system(system_prompt, pinned)
+
+        available = self.budget - estimate_tokens(system) - MESSAGE_OVERHEAD
+        if summary and self._fit_recent(history, 0, available) == 0:
+            # Вся история помещается дословно — сводка не нужна
+            summary = None
+        summarized = min(summarized, len(history)) if summary else 0
+
+        # Сначала пробуем уместить все, что не покрыто сводкой
+        summary_tokens = 0
+        if summary:
+            summary_tokens = min(estimate_tokens(EARLIER_HEADER + summary), int(self.budget * self.summary_share))
+        start = self._fit_recent(history, summarized, available - summary_tokens)
+        if start > summarized:
+            # Не поместилось — под сводку отводим постоянную долю бюджета
+            summary_tokens = int(self.budget * self.summary_share)
+            start = self._fit_recent(history, summarized, available - summary_tokens)
+
+        recent = [{"role": message.get("role", ""), "content": message.get("content", "")}
+                  for message in history[start:]]
+        if recent and sum(map(message_tokens, recent)) > available - summary_tokens:
+            # Даже одна последняя реплика не влезает — обрезаем ее
+            recent[-1]["content"] = truncate_to_tokens(
+                recent[-1]["content"], available - summary_tokens - MESSAGE_OVERHEAD)
+
+        earlier = self._summary_text(history, summary, summarized, start,
+                                     summary_tokens - estimate_tokens(EARLIER_HEADER))
+        if earlier:
+            system += EARLIER_HEADER + earlier
+
+        messages = [{"role": "system", "content": system}] if system else []
+        return messages + recent
+
+    def window_start(self, history: Sequence[Dict[str, Any]], system_prompt: str = "",
+                     pinned: Iterable[str] = ()) -> int:
+        """
+        С какого сообщения build() возьмет историю дословно
+
+        Все, что раньше, попадет в промпт только через сводку (0 — история
+        помещается целиком и сводка не нужна).
+        """
+        history = [message for message in history if message.get("role") != "system"]
+        available = self.budget - estimate_tokens(self._system(system_prompt, pinned)) - MESSAGE_OVERHEAD
+        if self._fit_recent(history, 0, available) == 0:
+            return 0
+        return self._fit_recent(history, 0, available - int(self.budget * self.summary_share))
+
+    @property
+    def summary_tokens(self) -> int:
+        """Сколько токенов промпта занимает сводка, если история не помещается"""
+        return int(self.budget * self.summary_share) - estimate_tokens(EARLIER_HEADER)
+
+    def fit(self, messages: Sequence[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """Уложить в бюджет готовый список сообщений (системные сообщения сохраняются)"""
+        if sum(map(message_tokens, messages)) <= self.budget:
+            return [{"role": message.get("role", ""), "content": message.get("content", "")}
+                    for message in messages]
+        system = "\n\n".join(message.get("content", "") for message in messages
+                             if message.get("role") == "system")
+        return self.build(messages, system)
+
+    def _system(self, system_prompt: str, pinned: Iterable[str]) -> str:
+        """Системное сообщение вместе с закрепленными фактами"""
+        pinned = [fact for fact in pinned if fact]
+        if pinned:
+            return system_prompt + PINNED_HEADER + "\n".join(f"- {fact}" for fact in pinned)
+        return system_prompt
+
+    def _fit_recent(self, history: Sequence[Dict[str, Any]], stop: int, tokens: int) -> int:
+        """Индекс, с которого реплики после stop помещаются в tokens (последняя — всегда)"""
+        start = len(history)
+        used = 0
+        while start > stop:
+            cost = message_tokens(history[start - 1])
+            if used + cost > tokens and start < len(history):
+                break
+            used += cost
+            start -= 1
+        return start
+
+    def _summary_text(self, history: Sequence[Dict[str, Any]], summary: Optional[str],
+                      summarized: int, start: int, tokens: int) -> str:
+        """Сводка всего, что не вошло дословно: готовая сводка плюс первые фразы остальных реплик"""
+        if tokens <= 0 or (not summary and start == 0):
+            return ""
+
+        lines = []
+        used = 0
+        # Реплики между сводкой и недавней частью — от новых к старым, пока есть место
+        for message in reversed(history[summarized:start]):
+            role = "User" if message.get("role") == "user" else "Assistant"
+            text = " ".join(message.get("content", "").split())
+            if len(text) > self.digest_chars:
+                text = text[:self.digest_chars].rstrip() + "…"
+            line = f"{role}: {text}"
+            cost = estimate_tokens(line) + 1
+            if used + cost > tokens:
+                break
+            lines.append(line)
+            used += cost
+        lines.reverse()
+
+        if summary:
+            lines.insert(0, truncate_to_tokens(summary, tokens - used - 1))
+        return "\n".join(lines)
@@ -0,0 +1,194 @@
+# core/messages.py
+"""
+Компактное представление сообщений чата
+
+Message — неизменяемое сообщение на __slots__ (роль интернируется,
+поэтому тысячи сообщений делят одну строку "assistant"; так же в одном
+экземпляре живут длинные тексты — вставленные файлы, повторяющиеся
+промпты). MessageLog —
+список сообщений только для добавления: снимки делят общий буфер и
+создаются за O(1), копирование происходит, только если снимок дописать
+не тем, что уже лежит в буфере.
+"""
+
+import sys
+import weakref
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+SHARED_CONTENT_SIZE = 256  # Тексты от этой длины хранятся в одном экземпляре (в RAM и на диске)
+
+# Длинный текст -> живое сообщение с ним. Не sys.intern: с Python 3.12
+# интернированные строки бессмертны, а вставленный файл должен
+# освобождаться вместе с последним сообщением
+_shared_contents: "weakref.WeakValueDictionary[str, Message]" = weakref.WeakValueDictionary()
+
+class Message:
+    __slots__ = ("role", "content", "__weakref__")
+
+    def __init__(self, role: str, content: str):
+        object.__setattr__(self, "role", sys.intern(role or ""))
+        content = content or ""
+        object.__setattr__(self, "content", content)
+        if len(content) >= SHARED_CONTENT_SIZE:
+            # Такой же текст уже есть в памяти — берем его экземпляр
+            shared = _shared_contents.setdefault(content, self)
+            if shared is not self:
+                object.__setattr__(self, "content", shared.content)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Message неизменяемо — создайте новое сообщение")
+
+    # Чтение как у словаря {"role": ..., "content": ...}, чтобы старый код работал без изменений
+
+    def __getitem__(self, key: str) -> str:
+        if key == "role":
+            return self.role
+        if key == "content":
+            return self.content
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key == "role":
+            return self.role
+        if key == "content":
+            return self.content
+        return default
+
+    def __contains__(self, key: str) -> bool:
+        return key in ("role", "content")
+
+    def keys(self):
+        return ("role", "content")
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"role": self.role, "content": self.content}
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Message):
+            return self.role == other.role and self.content == other.content
+        if isinstance(other, dict):
+            return other == self.to_dict()
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self.role, self.content))
+
+    def __repr__(self):
+        return f"Message({self.role!r}, {self.content[:40]!r})"
+
+
+MessageLike = Union[Message, Dict[str, str]]
+
+def to_message(message: MessageLike) -> Message:
+    """Привести сообщение (словарь или Message) к Message"""
+    if isinstance(message, Message):
+        return message
+    return Message(message.get("role", ""), message.get("content", ""))
+
+def json_default(obj: Any) -> Any:
+    """Для json.dumps(default=...): сообщения пишутся на диск обычными словарями"""
+    if isinstance(obj, Message):
+        return obj.to_dict()
+    if isinstance(obj, MessageLog):
+        return [message.to_dict() for message in obj]
+    raise TypeError(f"{type(obj).__name__} не сериализуется в JSON")
+
+
+class MessageLog:
+    __slots__ = ("_items", "_length")
+
+    def __init__(self, messages: Optional[Iterable[MessageLike]] = None):
+        """
+        Список сообщений только для добавления
+
+        Args:
+            messages: Начальные сообщения; из другого MessageLog берется снимок за O(1)
+        """
+        if isinstance(messages, MessageLog):
+            self._items = messages._items
+            self._length = messages._length
+        else:
+            self._items: List[Message] = [to_message(m) for m in messages or ()]
+            self._length = len(self._items)
+
+    def snapshot(self) -> "MessageLog":
+        """Неизменный снимок текущего состояния за O(1)"""
+        return MessageLog(self)
+
+    copy = snapshot
+
+    def head(self, count: int) -> "MessageLog":
+        """Снимок первых count сообщений за O(1)"""
+        head = MessageLog(self)
+        head._length = max(0, min(count, self._length))
+        return head
+
+    def append(self, message: MessageLike):
+        message = to_message(message)
+        if self._length < len(self._items):
+            if self._items[self._length] is message:
+                # Другой снимок уже дописал это же сообщение — просто сдвигаемся
+                self._length += 1
+                return
+            # Буфер ушел дальше другим путем — копируем свою часть
+            self._items = self._items[:self._length]
+        self._items.append(message)
+        self._length += 1
+
+    def extend(self, messages: Iterable[MessageLike]):
+        for message in messages:
+            self.append(message)
+
+    def startswith(self, prefix: Iterable[MessageLike]) -> bool:
+        """
+        Начинается ли этот список с prefix
+
+        Снимки одного буфера совпадают до длины более короткого: append
+        сдвигается по буферу, только если следующее сообщение то же самое,
+        а иначе копирует свою часть. Поэтому для них проверка — O(1), а
+        сообщения сравниваются только у чужих буферов и обычных списков.
+        """
+        if isinstance(prefix, MessageLog):
+            if prefix._items is self._items:
+                return prefix._length <= self._length
+        else:
+            prefix = list(prefix)
+        if len(prefix) > self._length:
+            return False
+        return all(a is b or a == b for a, b in zip(self._items, prefix))
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[Message]:
+        items = self._items
+        for i in range(self._length):
+            yield items[i]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            items = self._items
+            return [items[i] for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("индекс вне списка сообщений")
+        return self._items[index]
+
+    def __bool__(self) -> bool:
+        return self._length > 0
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, MessageLog) and other._items is self._items:
+            return other._length == self._length
+        try:
+            return len(other) == self._length and all(a == b for a, b in zip(self, other))
+        except TypeError:
+            return NotImplemented
+
+    def to_list(self) -> List[Dict[str, str]]:
+        """Обычный список словарей (для JSON и внешних API)"""
+        return [message.to_dict() for message in self]
+
+    def __repr__(self):
+        return f"MessageLog({self._length} сообщений)"
@@ -0,0 +1,130 @@
+# core/migrations.py
+"""
+Миграции схемы памяти
+
+Два уровня:
+- документ (память целиком) — дешевые изменения структуры, выполняются
+  при загрузке и не обходят сообщения;
+- чат — выполняются лениво, когда чат впервые понадобился, или фоном
+  (memory.migrate_all). Перезаписывать всю историю при запуске не нужно.
+
+Версия документа хранится в memory_data["schema_version"], версия чата —
+в chat["schema"] (чаты без нее — версии 1). Новая миграция регистрируется
+декоратором с номером версии, до которой она поднимает данные.
+"""
+
+import datetime
+from typing import Any, Callable, Dict
+
+from core.statistics import count_totals, empty_statistics
+
+DOCUMENT_VERSION = 2
+CHAT_VERSION = 2
+
+_document_steps: Dict[int, Callable[[Dict[str, Any]], None]] = {}
+_chat_steps: Dict[int, Callable[[Dict[str, Any]], None]] = {}
+
+def document_migration(version: int):
+    """Зарегистрировать миграцию документа до версии version"""
+    def register(func):
+        _document_steps[version] = func
+        return func
+    return register
+
+def chat_migration(version: int):
+    """Зарегистрировать миграцию чата до версии version (меняет только метаданные)"""
+    def register(func):
+        _chat_steps[version] = func
+        return func
+    return register
+
+def upgrade_document(memory_data: Dict[str, Any]) -> bool:
+    """
+    Поднять документ до текущей версии
+
+    Returns:
+        True, если что-то изменилось и документ нужно сохранить
+    """
+    current = memory_data.get("schema_version", 0)
+    if current >= DOCUMENT_VERSION:
+        return False
+
+    for version in range(current + 1, DOCUMENT_VERSION + 1):
+        step = _document_steps.get(version)
+        if step:
+            step(memory_data)
+        memory_data["schema_version"] = version
+    return True
+
+def needs_upgrade(chat: Dict[str, Any]) -> bool:
+    """Устарела ли схема чата"""
+    return chat.get("schema", 1) < CHAT_VERSION
+
+def upgrade_chat(chat: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Поднять чат до текущей версии (сам чат не меняется)
+
+    Returns:
+        Изменившиеся поля метаданных, включая "schema"
+    """
+    upgraded = {key: value for key, value in chat.items() if key != "messages"}
+    for version in range(upgraded.get("schema", 1) + 1, CHAT_VERSION + 1):
+        step = _chat_steps.get(version)
+        if step:
+            step(upgraded)
+        upgraded["schema"] = version
+    return {key: value for key, value in upgraded.items() if key not in chat or chat[key] != value}
+
+# ================= МИГРАЦИИ ДОКУМЕНТА =================
+
+@document_migration(1)
+def _history_to_chats(memory_data: Dict[str, Any]):
+    """Самый первый формат: список бесед "history" вместо словаря чатов"""
+    if "history" not in memory_data:
+        return
+    history = memory_data.pop("history")
+    if "chats" in memory_data:
+        return
+
+    # ID не зависят от даты запуска: пока снимок не записан, миграция
+    # может повториться и должна дать те же чаты
+    stamp = (memory_data.get("statistics", {}).get("last_active") or "")[:10].replace("-", "") or "legacy"
+    now = datetime.datetime.now().isoformat()
+
+    memory_data["chats"] = {}
+    for i, chat in enumerate(history):
+        chat_id = f"chat_{i}_{stamp}"
+        first_message = next((msg["content"] for msg in chat if msg["role"] == "user"), "")
+        title = first_message[:40] + "..." if len(first_message) > 40 else first_message
+
+        memory_data["chats"][chat_id] = {
+            "id": chat_id,
+            "title": title if title else "Беседа",
+            "timestamp": now,
+            "messages": chat,
+            "think_mode": False,
+            "schema": CHAT_VERSION
+        }
+
+    memory_data["statistics"] = empty_statistics()
+    memory_data["statistics"].update(count_totals(memory_data["chats"]))
+    memory_data["statistics"]["last_active"] = now
+
+@document_migration(2)
+def _running_statistics(memory_data: Dict[str, Any]):
+    """Статистика старого формата считалась при каждой записи — пересчитываем один раз"""
+    stats = memory_data.setdefault("statistics", empty_statistics())
+    if "daily_messages" in stats:
+        return
+    for key, value in empty_statistics().items():
+        stats.setdefault(key, value)
+    stats.update(count_totals(memory_data.get("chats", {})))
+
+# ================= МИГРАЦИИ ЧАТОВ =================
+
+@chat_migration(2)
+def _chat_defaults(chat: Dict[str, Any]):
+    """Чаты старых версий и старых экспортов могли прийти без части метаданных"""
+    chat.setdefault("title", "Беседа")
+    chat.setdefault("think_mode", False)
+    chat.setdefault("timestamp", "")
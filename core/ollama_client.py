@@ -4,23 +4,186 @@
 """
 
 import json
+import threading
+import time
 import requests
-from typing import Dict, List, Any, Optional, Generator
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from requests.adapters import HTTPAdapter
+from typing import Dict, List, Any, Optional, Generator, Iterator, Union, Tuple
 from markdown_parser import parse_markdown
+from core.context import ContextWindow
+from core.messages import Message
+from core.response_cache import ResponseCache, request_key
+from core.semantic_cache import EMBEDDING_MODEL, SemanticCache, semantic_query, semantic_scope
+
+# Таймауты по эндпоинтам: (подключение, чтение) в секундах
+DEFAULT_TIMEOUTS = {
+    "chat": (3.05, 60),
+    "tags": (3.05, 5),
+    "embeddings": (3.05, 30),
+    "pull": (3.05, 300),
+}
+REPLAY_CHUNK = 64  # Символов в одной части ответа, отдаваемого из кэша
+EMBED_WORKERS = 2  # Потоков для эмбеддингов вопросов (параллельно с генерацией)
+
+class Generation:
+    """
+    Ответ модели, который можно прервать
+
+    Итерируется так же, как раньше генератор: части ответа по мере
+    прихода. cancel() из любого потока рвет HTTP-поток — Ollama, увидев
+    разрыв, прекращает генерацию и освобождает слот, а итерация просто
+    заканчивается (без текста ошибки).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._response: Optional[requests.Response] = None
+        self._chunks: Iterator[str] = iter(())
+        self.timing: Optional[Dict[str, float]] = None  # {"first_token": ..., "total": ...} после успешного ответа
+        self.cacheable = False  # Ответ искался в кэше и может в него попасть
+        self.cached: Optional[str] = None  # "exact" или "semantic", если ответ взят из кэша
+
+    def __iter__(self) -> Iterator[str]:
+        return self
+
+    def __next__(self) -> str:
+        return next(self._chunks)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Прервать генерацию (можно вызывать из любого потока и повторно)"""
+        with self._lock:
+            self._cancelled.set()
+            response, self._response = self._response, None
+        if response is not None:
+            _abort(response)
+
+    def _attach(self, response: requests.Response) -> bool:
+        """Запомнить открытый поток; False, если генерацию уже отменили"""
+        with self._lock:
+            if self.cancelled:
+                return False
+            self._response = response
+            return True
+
+    def _detach(self):
+        with self._lock:
+            self._response = None
+
+
+def _abort(response: requests.Response):
+    """Разорвать соединение потокового ответа, даже если другой поток сейчас читает из него"""
+    try:
+        # shutdown() будит заблокированное чтение; close() сам по себе этого не делает
+        if hasattr(response.raw, "shutdown"):
+            response.raw.shutdown()
+        response.close()
+    except Exception:
+        pass
+
+
+def _error_message(error: Exception) -> str:
+    """Текст ответа вместо ошибки запроса"""
+    if isinstance(error, requests.exceptions.ConnectionError):
+        return "❌ Ошибка подключения к Ollama\nУбедитесь, что Ollama запущен: `ollama serve`"
+    if isinstance(error, requests.exceptions.Timeout):
+        return "⏱️ Время ожидания истекло\nПопробуйте еще раз"
+    return f"⚠️ Ошибка: {str(error)}"
+
 
 class OllamaClient:
-    def __init__(self, base_url: str = "http://localhost:11434", model: str = "llama3"):
+    def __init__(self, base_url: str = "http://localhost:11434", model: str = "llama3",
+                 pool_size: int = 4, keep_alive: bool = True,
+                 timeouts: Optional[Dict[str, Union[float, Tuple[float, float]]]] = None,
+                 context_tokens: Optional[int] = None,
+                 num_ctx: Optional[int] = None,
+                 cache: Optional[ResponseCache] = None,
+                 semantic_cache: Optional[SemanticCache] = None):
         """
         Инициализация клиента Ollama
         
         Args:
             base_url: URL сервера Ollama
             model: Название модели
+            pool_size: Максимум соединений в пуле
+            keep_alive: Держать соединения открытыми между запросами
+            timeouts: Таймауты по эндпоинтам (chat, tags, pull)
+            context_tokens: Бюджет промпта в токенах (None — отправлять историю целиком)
+            num_ctx: Размер контекста модели, если промпт в бюджет укладывает вызывающий
+                (по умолчанию — из context_tokens)
+            cache: Кэш готовых ответов (None — каждый ответ генерируется заново)
+            semantic_cache: Кэш ответов по смыслу вопроса (None — только точные совпадения)
         """
         self.base_url = base_url
         self.model = model
         self.chat_url = f"{base_url}/api/chat"
         self.generate_url = f"{base_url}/api/generate"
+        self.keep_alive = keep_alive
+        self.timeouts = {**DEFAULT_TIMEOUTS, **(timeouts or {})}
+        self.context = ContextWindow(context_tokens) if context_tokens else None
+        self.num_ctx = num_ctx or (self.context.num_ctx if self.context is not None else None)
+        self.cache = cache
+        self.semantic_cache = semantic_cache
+        self._missing_models = set()  # Эмбеддинг-модели, которых нет на сервере
+        self._failing_models = set()  # Эмбеддинг-модели, об ошибке которых уже сообщили
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        
+        # Один пул соединений на клиент; urllib3-пул потокобезопасен,
+        # а сами сессии держим по одной на поток
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=False)
+        self._local = threading.local()
+    
+    def _session(self) -> requests.Session:
+        """Получить сессию текущего потока, работающую через общий пул"""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("http://", self._adapter)
+            session.mount("https://", self._adapter)
+            if not self.keep_alive:
+                session.headers["Connection"] = "close"
+            self._local.session = session
+        return session
+    
+    def _request(self, method: str, endpoint: str, path: str, **kwargs) -> requests.Response:
+        """Выполнить запрос к Ollama через пул соединений"""
+        kwargs.setdefault("timeout", self.timeouts.get(endpoint))
+        return self._session().request(method, f"{self.base_url}{path}", **kwargs)
+    
+    def close(self):
+        """Дождаться фоновых эмбеддингов и закрыть все соединения пула"""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        self._adapter.close()
+    
+    def _background(self) -> ThreadPoolExecutor:
+        """Потоки для эмбеддингов, которые не должны задерживать ответ"""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=EMBED_WORKERS, thread_name_prefix="ollama-embed")
+            return self._executor
+    
+    def _embed_wait(self) -> float:
+        """Сколько ждать вектор вопроса перед запросом к модели (секунды)"""
+        timeout = self.timeouts.get("embeddings")
+        return timeout[0] if isinstance(timeout, tuple) else timeout
+    
+    @property
+    def last_timing(self) -> Optional[Dict[str, float]]:
+        """
+        Время последнего ответа в текущем потоке (секунды)
+        
+        {"first_token": ..., "total": ...} или None, если ответ завершился ошибкой
+        """
+        return getattr(self._local, "last_timing", None)
 
     def _messages_to_prompt(self, messages: List[Dict[str, str]]) -> str:
         parts = []
@@ -40,26 +203,48 @@ class OllamaClient:
     
     def generate_response(self, messages: List[Dict[str, str]], 
                          think_mode: bool = False, 
-                         stream: bool = True) -> Generator[str, None, None]:
+                         stream: bool = True,
+                         model: Optional[str] = None,
+                         use_cache: bool = True,
+                         cacheable: bool = True) -> Generation:
         """
         Сгенерировать ответ от модели
         
+        Запрос уходит при первой итерации — в том потоке, который читает ответ.
+        
         Args:
             messages: История сообщений
             think_mode: Режим размышлений
             stream: Потоковый режим
+            model: Модель для этого запроса (по умолчанию — модель клиента)
+            use_cache: Можно ли взять ответ из кэша (False — сгенерировать заново)
+            cacheable: Можно ли кэшировать ответ (False для вопросов, ответ на которые устаревает)
             
-        Yields:
-            Части ответа
+        Returns:
+            Generation: итерируется частями ответа, cancel() прерывает генерацию
         """
+        generation = Generation()
+        generation.cacheable = cacheable and (self.cache is not None or self.semantic_cache is not None)
+        generation._chunks = self._stream_chat(generation, messages, think_mode, stream,
+                                               model or self.model, use_cache, cacheable)
+        return generation
+    
+    def _stream_chat(self, generation: Generation, messages: List[Dict[str, str]],
+                     think_mode: bool, stream: bool, model: str,
+                     use_cache: bool, cacheable: bool) -> Generator[str, None, None]:
         system_prompt = f"You are Jarvis — smart, charismatic. Style: short, clear.\nThink: {think_mode}"
         
-        # Добавляем системное сообщение если его нет
+        # Добавляем системное сообщение если его нет (не меняя список вызывающего)
+        messages = [msg.to_dict() if isinstance(msg, Message) else msg for msg in messages]
         if not any(msg.get("role") == "system" for msg in messages):
-            messages.insert(0, {"role": "system", "content": system_prompt})
+            messages = [{"role": "system", "content": system_prompt}] + messages
+        
+        # Длинная история не должна растягивать разбор промпта без предела
+        if self.context is not None:
+            messages = self.context.fit(messages)
         
         payload = {
-            "model": self.model,
+            "model": model,
             "messages": messages,
             "stream": stream,
             "options": {
@@ -68,28 +253,158 @@ class OllamaClient:
                 "top_k": 40
             }
         }
+        if self.num_ctx:
+            # Иначе сервер обрежет промпт по своему размеру контекста
+            payload["options"]["num_ctx"] = self.num_ctx
         
+        self._local.last_timing = None
+        start = time.perf_counter()
+        first_token = None
+        
+        if generation.cancelled:
+            return
+        
+        # Тот же вопрос уже отвечен — отдаем ответ теми же частями, что и поток
+        key = request_key(payload) if self.cache is not None and cacheable else None
+        query = semantic_query(payload) if self.semantic_cache is not None and cacheable else None
+        scope = semantic_scope(payload, self.semantic_cache.model) if query is not None else None
+        pending: Optional[Future] = None  # Вектор вопроса, который не дождались
+        embedding = None
+        if use_cache:
+            cached = self.cache.get(key) if key is not None else None
+            if cached is not None:
+                yield from self._replay(generation, cached, "exact", start)
+                return
+            if query is not None and self.semantic_cache.has_scope(scope):
+                # Перефразированный вопрос ищем до запроса к /api/chat: попадание
+                # не должно занимать модель. Вектор ждем не дольше подключения
+                # к серверу — при задержке отвечает модель, а вектор пойдет в кэш
+                pending = self._background().submit(self.embed, query, self.semantic_cache.model)
+                try:
+                    embedding, pending = pending.result(timeout=self._embed_wait()), None
+                except FutureTimeoutError:
+                    pass
+                if generation.cancelled:
+                    return
+                cached = self.semantic_cache.find(scope, embedding) if embedding is not None else None
+                if cached is not None:
+                    yield from self._replay(generation, cached, "semantic", start)
+                    return
+        
+        if generation.cancelled:
+            return
+        
+        parts = []
         try:
-            response = requests.post(self.chat_url, json=payload, stream=True, timeout=60)
-            response.raise_for_status()
-            
-            for line in response.iter_lines():
-                if not line:
-                    continue
+            with self._request("POST", "chat", "/api/chat", json=payload, stream=True) as response:
+                if not generation._attach(response):
+                    _abort(response)
+                    return
+                response.raise_for_status()
                 
-                try:
-                    data = json.loads(line.decode())
-                    if "message" in data and "content" in data["message"]:
-                        yield data["message"]["content"]
-                except json.JSONDecodeError:
-                    continue
+                for line in response.iter_lines():
+                    if generation.cancelled:
+                        return
+                    if not line:
+                        continue
+                    
+                    try:
+                        data = json.loads(line.decode())
+                        if "message" in data and "content" in data["message"]:
+                            if first_token is None:
+                                first_token = time.perf_counter() - start
+                            parts.append(data["message"]["content"])
+                            yield data["message"]["content"]
+                    except json.JSONDecodeError:
+                        continue
+            
+            if generation.cancelled:
+                return
+            total = time.perf_counter() - start
+            generation.timing = {"first_token": first_token if first_token is not None else total,
+                                 "total": total}
+            self._local.last_timing = generation.timing
+            
+            # В кэш попадают только полные ответы: не прерванные и не ошибки
+            if parts:
+                text = "".join(parts)
+                if key is not None:
+                    self.cache.put(key, text)
+                if query is not None:
+                    if embedding is not None:
+                        self.semantic_cache.add(scope, query, embedding, text)
+                    elif pending is not None:
+                        # Вектор, которого не дождались, запомнит ответ, когда будет готов
+                        pending.add_done_callback(lambda future: self._remember(scope, query, text, future))
+                    else:
+                        # Ответ уже отдан — вектор для кэша считаем в фоне
+                        self._background().submit(self._remember, scope, query, text)
                     
-        except requests.exceptions.ConnectionError:
-            yield "❌ Ошибка подключения к Ollama\nУбедитесь, что Ollama запущен: `ollama serve`"
-        except requests.exceptions.Timeout:
-            yield "⏱️ Время ожидания истекло\nПопробуйте еще раз"
         except Exception as e:
-            yield f"⚠️ Ошибка: {str(e)}"
+            # Соединение, оборванное отменой, — не ошибка
+            if not generation.cancelled:
+                yield _error_message(e)
+        finally:
+            generation._detach()
+    
+    def _replay(self, generation: Generation, text: str, layer: str, start: float) -> Generator[str, None, None]:
+        """Отдать ответ из кэша частями, как поток"""
+        for i in range(0, len(text), REPLAY_CHUNK):
+            if generation.cancelled:
+                return
+            yield text[i:i + REPLAY_CHUNK]
+        total = time.perf_counter() - start
+        generation.cached = layer
+        generation.timing = {"first_token": total, "total": total}
+        self._local.last_timing = generation.timing
+    
+    def _remember(self, scope: str, query: str, text: str, pending: Optional[Future] = None):
+        """Запомнить ответ в кэше по смыслу (в фоновом потоке; pending — уже посчитанный вектор)"""
+        embedding = pending.result() if pending is not None else self.embed(query, self.semantic_cache.model)
+        if embedding is not None:
+            self.semantic_cache.add(scope, query, embedding, text)
+    
+    def embed(self, text: str, model: Optional[str] = None) -> Optional[List[float]]:
+        """
+        Эмбеддинг текста
+        
+        Args:
+            text: Текст
+            model: Эмбеддинг-модель (по умолчанию — модель кэша по смыслу)
+            
+        Returns:
+            Вектор или None, если модель недоступна или запрос не удался
+        """
+        model = model or (self.semantic_cache.model if self.semantic_cache is not None else EMBEDDING_MODEL)
+        if model in self._missing_models:
+            return None
+        try:
+            response = self._request("POST", "embeddings", "/api/embeddings",
+                                     json={"model": model, "prompt": text})
+            if response.status_code == 404:
+                # Модель не скачана — не спрашиваем ее на каждом сообщении
+                self._missing_models.add(model)
+                print(f"⚠️ Эмбеддинг-модель {model} недоступна: ollama pull {model}")
+                return None
+            response.raise_for_status()
+            embedding = response.json().get("embedding") or None
+            self._failing_models.discard(model)
+            return embedding
+        except Exception as e:
+            # Сервер недоступен — сообщаем один раз, а не на каждом сообщении
+            if model not in self._failing_models:
+                self._failing_models.add(model)
+                print(f"Ошибка получения эмбеддинга: {e}")
+            return None
+    
+    def cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Попадания в кэши ответов с запуска процесса: {"exact": ..., "semantic": ...}"""
+        stats = {}
+        if self.cache is not None:
+            stats["exact"] = self.cache.stats()
+        if self.semantic_cache is not None:
+            stats["semantic"] = self.semantic_cache.stats()
+        return stats
     
     def generate_complete_response(self, messages: List[Dict[str, str]], 
                                   think_mode: bool = False) -> str:
@@ -108,7 +423,7 @@ class OllamaClient:
     def test_connection(self) -> bool:
         """Проверить соединение с Ollama"""
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
+            response = self._request("GET", "tags", "/api/tags")
             return response.status_code == 200
         except:
             return False
@@ -116,7 +431,7 @@ class OllamaClient:
     def get_available_models(self) -> List[str]:
         """Получить список доступных моделей"""
         try:
-            response = requests.get(f"{self.base_url}/api/tags", timeout=5)
+            response = self._request("GET", "tags", "/api/tags")
             if response.status_code == 200:
                 data = response.json()
                 return [model["name"] for model in data.get("models", [])]
@@ -127,24 +442,20 @@ class OllamaClient:
     def pull_model(self, model_name: str) -> Generator[str, None, None]:
         """Загрузить модель"""
         try:
-            response = requests.post(
-                f"{self.base_url}/api/pull",
-                json={"name": model_name},
-                stream=True,
-                timeout=300
-            )
-            response.raise_for_status()
-            
-            for line in response.iter_lines():
-                if not line:
-                    continue
+            with self._request("POST", "pull", "/api/pull",
+                               json={"name": model_name}, stream=True) as response:
+                response.raise_for_status()
                 
-                try:
-                    data = json.loads(line.decode())
-                    if "status" in data:
-                        yield data["status"]
-                except:
-                    continue
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    
+                    try:
+                        data = json.loads(line.decode())
+                        if "status" in data:
+                            yield data["status"]
+                    except:
+                        continue
                     
         except Exception as e:
             yield f"Ошибка загрузки модели: {str(e)}"
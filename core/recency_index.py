@@ -0,0 +1,85 @@
+# core/recency_index.py
+"""
+Порядок чатов по времени последней активности
+"""
+
+import bisect
+from typing import Any, Dict, List, Tuple
+
+class RecencyIndex:
+    def __init__(self):
+        """Инициализация индекса (пары (timestamp, chat_id) по возрастанию)"""
+        self._entries: List[Tuple[str, str]] = []
+        self._timestamps: Dict[str, str] = {}  # chat_id -> timestamp
+
+    def __len__(self) -> int:
+        return len(self._timestamps)
+
+    def __contains__(self, chat_id: str) -> bool:
+        return chat_id in self._timestamps
+
+    def touch(self, chat_id: str, timestamp: str):
+        """Добавить чат или обновить время его активности"""
+        timestamp = timestamp or ""
+        old = self._timestamps.get(chat_id)
+        if old == timestamp:
+            return
+        if old is not None:
+            self._discard(old, chat_id)
+
+        self._timestamps[chat_id] = timestamp
+        # Обычно чат становится самым свежим — вставка в конец списка
+        bisect.insort(self._entries, (timestamp, chat_id))
+
+    def remove(self, chat_id: str):
+        """Убрать чат из индекса"""
+        old = self._timestamps.pop(chat_id, None)
+        if old is not None:
+            self._discard(old, chat_id)
+
+    def clear(self):
+        """Очистить индекс"""
+        self._entries.clear()
+        self._timestamps.clear()
+
+    def sync(self, chats: Dict[str, Dict[str, Any]]) -> bool:
+        """
+        Привести индекс в соответствие с чатами
+
+        Returns:
+            True, если индекс пришлось перестроить
+        """
+        if len(chats) == len(self._timestamps) and all(
+            self._timestamps.get(chat_id) == (chat.get("timestamp") or "")
+            for chat_id, chat in chats.items()
+        ):
+            return False
+
+        self._timestamps = {chat_id: chat.get("timestamp") or "" for chat_id, chat in chats.items()}
+        self._entries = sorted((timestamp, chat_id) for chat_id, timestamp in self._timestamps.items())
+        return True
+
+    def newest(self, limit: int) -> List[str]:
+        """ID самых свежих чатов, новые первыми (O(limit))"""
+        if limit <= 0:
+            return []
+        return [chat_id for _, chat_id in reversed(self._entries[-limit:])]
+
+    def oldest(self, count: int) -> List[str]:
+        """ID самых старых чатов, старые первыми (O(count))"""
+        if count <= 0:
+            return []
+        return [chat_id for _, chat_id in self._entries[:count]]
+
+    def pop_oldest(self, count: int) -> List[str]:
+        """Убрать самые старые чаты из индекса и вернуть их ID (одним срезом)"""
+        chat_ids = self.oldest(count)
+        del self._entries[:len(chat_ids)]
+        for chat_id in chat_ids:
+            del self._timestamps[chat_id]
+        return chat_ids
+
+    def _discard(self, timestamp: str, chat_id: str):
+        index = bisect.bisect_left(self._entries, (timestamp, chat_id))
+        if index < len(self._entries) and self._entries[index] == (timestamp, chat_id):
+            del self._entries[index]
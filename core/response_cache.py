@@ -0,0 +1,239 @@
+# core/response_cache.py
+"""
+Кэш готовых ответов модели по точному совпадению запроса
+
+Ключ — хеш модели, сообщений и параметров генерации: одинаковый вопрос
+в одинаковом контексте (приветствие, пример из стартового экрана,
+повторенный вопрос) отдается из кэша за миллисекунды вместо повторной
+генерации. Записи живут не дольше ttl, кэш ограничен числом записей и
+суммарным размером текстов; сверх лимита вытесняются давно не
+использованные.
+
+На диске — журнал строк JSON {"key", "text", "created"}, который
+читается при первом обращении и переписывается живыми записями, когда
+вытесненных становится больше, чем живых. Журнал могут делить несколько
+процессов: запись идет под межпроцессной блокировкой, а файл, дописанный
+другим процессом, перечитывается.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from utils.file_utils import FileLock, atomic_write_text
+
+RESPONSE_CACHE_ENTRIES = 500
+RESPONSE_CACHE_BYTES = 8 * 1024 * 1024  # Суммарный размер текстов ответов
+RESPONSE_CACHE_TTL = 7 * 24 * 3600  # Секунд; None — без ограничения
+COMPACT_MIN_BYTES = 256 * 1024  # Журнал меньше этого не переписываем
+
+# Начала слов в вопросах, ответ на которые устаревает сам собой, — такие ответы не кэшируются
+TIME_SENSITIVE_WORDS = (
+    "сейчас", "сегодня", "завтра", "вчера", "время", "времени", "дата", "дату", "погод",
+    "курс", "новост", "последн", "now", "today", "tonight", "tomorrow", "yesterday",
+    "time", "date", "weather", "news", "latest", "current",
+)
+
+
+def is_time_sensitive(text: str) -> bool:
+    """Зависит ли ответ на вопрос от текущего момента"""
+    return any(word.startswith(TIME_SENSITIVE_WORDS) for word in re.findall(r"\w+", text.lower()))
+
+
+def request_key(payload: Dict[str, Any]) -> str:
+    """Ключ запроса к /api/chat: модель, сообщения и параметры генерации"""
+    data = {key: payload.get(key) for key in ("model", "messages", "options")}
+    text = json.dumps(data, ensure_ascii=False, sort_keys=True)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class ResponseCache:
+    # Поля записи, которые живут только в RAM и не пишутся в журнал
+    _transient = ("size",)
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = RESPONSE_CACHE_ENTRIES,
+                 max_bytes: int = RESPONSE_CACHE_BYTES, ttl: Optional[float] = RESPONSE_CACHE_TTL):
+        """
+        Инициализация кэша ответов
+
+        Args:
+            path: Файл журнала (None — кэш только в RAM)
+            max_entries: Сколько ответов хранить
+            max_bytes: Суммарный размер текстов ответов (байт UTF-8)
+            ttl: Сколько секунд ответ остается годным (None — без ограничения)
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(f"{path}.lock") if path else None
+        self._entries: Optional["OrderedDict[str, Dict[str, Any]]"] = None  # От давно использованных к недавним
+        self._bytes = 0
+        self._file_bytes = 0
+        self._signature: Optional[tuple] = None  # Отпечаток файла после нашего чтения/записи
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._get_entries())
+
+    def get(self, key: str) -> Optional[str]:
+        """Текст ответа по ключу (None — промах или запись устарела)"""
+        with self._lock:
+            entries = self._get_entries()
+            entry = entries.get(key)
+            if entry is not None and self._expired(entry):
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            entries.move_to_end(key)
+            self.hits += 1
+            return entry["text"]
+
+    def put(self, key: str, text: str):
+        """Запомнить ответ (слишком большой для кэша не запоминается)"""
+        self._store({"key": key, "text": text, "created": time.time()})
+
+    def _store(self, entry: Dict[str, Any]):
+        """Добавить запись в RAM и в журнал"""
+        size = len(entry["text"].encode("utf-8"))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if self._file_lock is None:
+                self._add(self._get_entries(), entry, size)
+                self._evict()
+                return
+            try:
+                with self._file_lock:
+                    self._add(self._get_entries(), entry, size)
+                    self._evict()
+                    self._append(entry)
+            except OSError as e:
+                print(f"Ошибка записи кэша ответов: {e}")
+
+    def clear(self):
+        """Удалить все ответы"""
+        with self._lock:
+            if self._file_lock is not None:
+                with self._file_lock:
+                    if os.path.exists(self.path):
+                        os.remove(self.path)
+            self._entries = OrderedDict()
+            self._bytes = 0
+            self._file_bytes = 0
+            self._signature = None
+
+    @property
+    def hit_rate(self) -> float:
+        """Доля запросов, отданных из кэша"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """Попадания и промахи с запуска процесса"""
+        with self._lock:
+            return {"entries": len(self._entries or ()), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hit_rate, 3)}
+
+    # ================= ЗАПИСИ В RAM =================
+
+    def _get_entries(self) -> "OrderedDict[str, Dict[str, Any]]":
+        """Записи читаются при первом обращении и после записи в файл другим процессом"""
+        if self._entries is None or (self.path and self._file_signature() != self._signature):
+            self._read()
+        return self._entries
+
+    def _add(self, entries: "OrderedDict[str, Dict[str, Any]]", entry: Dict[str, Any], size: int):
+        if entry["key"] in entries:
+            self._drop(entry["key"])
+        item = {key: value for key, value in entry.items() if key != "key"}
+        item["size"] = size
+        entries[entry["key"]] = item
+        self._bytes += size
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry["size"]
+
+    def _evict(self):
+        """Вытеснить давно не использованные записи сверх лимитов"""
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            self._drop(next(iter(self._entries)))
+
+    def _expired(self, entry: Dict[str, Any]) -> bool:
+        return self.ttl is not None and time.time() - entry["created"] > self.ttl
+
+    # ================= ФАЙЛ =================
+
+    def _read(self):
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._file_bytes = 0
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, 'rb') as f:
+                    for line in f:
+                        self._file_bytes += len(line)
+                        try:
+                            entry = json.loads(line)
+                            self._add(self._entries, entry, len(entry["text"].encode("utf-8")))
+                        except (ValueError, KeyError, AttributeError):
+                            # Оборванная строка (сбой во время записи) — пропускаем
+                            continue
+            except OSError as e:
+                print(f"Ошибка чтения кэша ответов: {e}")
+
+        for key in [key for key, entry in self._entries.items() if self._expired(entry)]:
+            self._drop(key)
+        # Порядок использования на диске не хранится: недавними считаются поздние записи
+        self._evict()
+        self._signature = self._file_signature()
+
+    def _append(self, entry: Dict[str, Any]):
+        """Дописать запись в журнал (или переписать его живыми записями)"""
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        if self._file_bytes + len(line) > max(2 * self._bytes, COMPACT_MIN_BYTES):
+            # Вытесненных и устаревших записей больше, чем живых
+            text = "".join(json.dumps(self._record(key, item), ensure_ascii=False) + "\n"
+                           for key, item in self._entries.items())
+            atomic_write_text(self.path, text)
+            self._file_bytes = len(text.encode("utf-8"))
+        else:
+            with open(self.path, 'ab') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._file_bytes += len(line)
+        self._signature = self._file_signature()
+
+    def _record(self, key: str, item: Dict[str, Any]) -> Dict[str, Any]:
+        """Строка журнала для записи в RAM"""
+        record = {"key": key}
+        record.update((name, value) for name, value in item.items() if name not in self._transient)
+        return record
+
+    def _file_signature(self) -> Optional[tuple]:
+        if not self.path:
+            return None
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
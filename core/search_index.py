@@ -0,0 +1,286 @@
+# core/search_index.py
+"""
+Инвертированный индекс для полнотекстового поиска по чатам
+"""
+
+import bisect
+import json
+import math
+import os
+import re
+import threading
+from typing import Callable, Dict, List, Any, Optional, Tuple
+
+from utils.file_utils import atomic_write_text
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+TITLE_WEIGHT = 3  # Совпадение в заголовке весит больше, чем в тексте
+MIN_PREFIX = 2  # Короче — ищем только точное совпадение, иначе префикс раскрывается в слишком много слов
+
+def normalize(text: str) -> str:
+    """Привести текст к виду для поиска (регистр, ё → е)"""
+    return text.casefold().replace("ё", "е")
+
+def tokenize(text: str) -> List[str]:
+    """Разбить текст на слова (кириллица и латиница)"""
+    return TOKEN_RE.findall(normalize(text))
+
+
+class SearchIndex:
+    VERSION = 1
+
+    def __init__(self, index_file: Optional[str] = "memory.index",
+                 lock: Optional[threading.RLock] = None,
+                 loader: Optional[Callable[[str], List[Dict[str, str]]]] = None):
+        """
+        Инициализация индекса
+
+        Args:
+            index_file: Файл, в котором индекс хранится между запусками
+            lock: Блокировка, под которой индекс обновляется
+            loader: Читает сообщения чата, которые не загружены в RAM
+        """
+        self.index_file = index_file
+        self._lock = lock or threading.RLock()
+        self._loader = loader
+        self._postings: Dict[str, Dict[str, int]] = {}  # слово -> {chat_id: вес}
+        self._chat_terms: Dict[str, Dict[str, int]] = {}  # chat_id -> {слово: вес}
+        self._fingerprints: Dict[str, Tuple[str, int]] = {}  # chat_id -> (timestamp, сообщений)
+        self._vocabulary: List[str] = []  # Отсортированные слова для префиксного поиска
+
+    # ================= ОБНОВЛЕНИЕ =================
+
+    def index_chat(self, chat: Dict[str, Any]):
+        """Проиндексировать чат целиком (заменяет прежние данные)"""
+        chat_id = chat["id"]
+        self.remove_chat(chat_id)
+
+        terms: Dict[str, int] = {}
+        for token in tokenize(chat.get("title", "")):
+            terms[token] = terms.get(token, 0) + TITLE_WEIGHT
+        for message in self._messages(chat):
+            for token in tokenize(message.get("content", "")):
+                terms[token] = terms.get(token, 0) + 1
+
+        self._add_terms(chat_id, terms)
+        self._fingerprints[chat_id] = self._fingerprint(chat)
+
+    def add_messages(self, chat: Dict[str, Any], messages: List[Dict[str, str]]):
+        """Дописать в индекс новые сообщения чата"""
+        chat_id = chat["id"]
+        if chat_id not in self._chat_terms:
+            self.index_chat(chat)
+            return
+
+        terms: Dict[str, int] = {}
+        for message in messages:
+            for token in tokenize(message.get("content", "")):
+                terms[token] = terms.get(token, 0) + 1
+
+        self._add_terms(chat_id, terms)
+        self._fingerprints[chat_id] = self._fingerprint(chat)
+
+    def remove_chat(self, chat_id: str):
+        """Убрать чат из индекса"""
+        terms = self._chat_terms.pop(chat_id, None)
+        self._fingerprints.pop(chat_id, None)
+        if not terms:
+            return
+
+        for term in terms:
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(chat_id, None)
+            if not posting:
+                del self._postings[term]
+                index = bisect.bisect_left(self._vocabulary, term)
+                if index < len(self._vocabulary) and self._vocabulary[index] == term:
+                    del self._vocabulary[index]
+
+    def clear(self):
+        """Очистить индекс"""
+        self._postings.clear()
+        self._chat_terms.clear()
+        self._fingerprints.clear()
+        self._vocabulary.clear()
+
+    def sync(self, chats: Dict[str, Dict[str, Any]]) -> int:
+        """
+        Привести индекс в соответствие с чатами
+
+        Переиндексируются только новые и изменившиеся чаты.
+
+        Returns:
+            Количество переиндексированных чатов
+        """
+        for chat_id in [cid for cid in self._chat_terms if cid not in chats]:
+            self.remove_chat(chat_id)
+
+        changed = 0
+        for chat_id, chat in chats.items():
+            if self._fingerprints.get(chat_id) != self._fingerprint(chat):
+                self.index_chat(chat)
+                changed += 1
+        return changed
+
+    def _add_terms(self, chat_id: str, terms: Dict[str, int]):
+        chat_terms = self._chat_terms.setdefault(chat_id, {})
+        for term, weight in terms.items():
+            chat_terms[term] = chat_terms.get(term, 0) + weight
+            posting = self._postings.get(term)
+            if posting is None:
+                posting = self._postings[term] = {}
+                bisect.insort(self._vocabulary, term)
+            posting[chat_id] = posting.get(chat_id, 0) + weight
+
+    def _fingerprint(self, chat: Dict[str, Any]) -> Tuple[str, int]:
+        count = len(chat["messages"]) if "messages" in chat else chat.get("message_count", 0)
+        return (chat.get("timestamp", ""), count)
+
+    def _messages(self, chat: Dict[str, Any]) -> List[Dict[str, str]]:
+        """Сообщения чата: из RAM, а если они не загружены — с диска"""
+        if "messages" in chat:
+            return chat["messages"]
+        if self._loader and chat.get("message_count"):
+            return self._loader(chat["id"])
+        return []
+
+    # ================= ПОИСК =================
+
+    def search(self, query: str, chats: Dict[str, Dict[str, Any]],
+               limit: Optional[int] = None) -> List[str]:
+        """
+        Найти чаты по запросу
+
+        Слова запроса ищутся все сразу (И). Последнее слово и слова со
+        звездочкой (`прог*`) ищутся по префиксу. Текст в кавычках ищется
+        как фраза.
+
+        Args:
+            query: Строка запроса
+            chats: Чаты (для проверки фраз и сортировки по времени)
+            limit: Максимум результатов
+
+        Returns:
+            ID чатов по убыванию релевантности
+        """
+        phrases = [tokenize(p) for p in re.findall(r'"([^"]+)"', query)]
+        phrases = [p for p in phrases if p]
+        rest = re.sub(r'"[^"]*"', " ", query)
+
+        terms: List[Tuple[str, bool]] = []  # (слово, по префиксу)
+        for phrase in phrases:
+            terms.extend((token, False) for token in phrase)
+
+        words = rest.split()
+        for i, word in enumerate(words):
+            tokens = tokenize(word)
+            for j, token in enumerate(tokens):
+                is_last = i == len(words) - 1 and j == len(tokens) - 1
+                prefix = (word.endswith("*") or (is_last and not rest.endswith(" "))) \
+                    and len(token) >= MIN_PREFIX
+                terms.append((token, prefix))
+
+        if not terms:
+            return []
+
+        total = max(1, len(self._chat_terms))
+        scores: Optional[Dict[str, float]] = None
+
+        for term, prefix in terms:
+            matches = self._match(term, prefix)
+            if not matches:
+                return []
+
+            term_scores: Dict[str, float] = {}
+            for matched_term in matches:
+                posting = self._postings[matched_term]
+                idf = math.log(1 + total / len(posting))
+                for chat_id, weight in posting.items():
+                    term_scores[chat_id] = term_scores.get(chat_id, 0.0) + weight * idf
+
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {cid: score + term_scores[cid] for cid, score in scores.items() if cid in term_scores}
+            if not scores:
+                return []
+
+        ranked = sorted(
+            scores,
+            key=lambda cid: (scores[cid], chats.get(cid, {}).get("timestamp", "")),
+            reverse=True
+        )
+
+        if phrases:
+            # Фразы проверяем по тексту лениво, в порядке релевантности
+            patterns = [
+                re.compile(r"(?<!\w)" + r"\W+".join(map(re.escape, phrase)) + r"(?!\w)")
+                for phrase in phrases
+            ]
+            found = []
+            for cid in ranked:
+                if cid in chats and self._contains_phrases(chats[cid], patterns):
+                    found.append(cid)
+                    if limit and len(found) >= limit:
+                        break
+            return found
+
+        return ranked[:limit] if limit else ranked
+
+    def _match(self, term: str, prefix: bool) -> List[str]:
+        if not prefix:
+            return [term] if term in self._postings else []
+        start = bisect.bisect_left(self._vocabulary, term)
+        end = bisect.bisect_left(self._vocabulary, term + "\uffff")
+        return self._vocabulary[start:end]
+
+    def _contains_phrases(self, chat: Dict[str, Any], patterns: List[re.Pattern]) -> bool:
+        texts = [chat.get("title", "")] + [m.get("content", "") for m in self._messages(chat)]
+        normalized = [normalize(text) for text in texts]
+        return all(any(pattern.search(text) for text in normalized) for pattern in patterns)
+
+    # ================= ХРАНЕНИЕ =================
+
+    def load(self) -> bool:
+        """Загрузить индекс из файла"""
+        if not self.index_file or not os.path.exists(self.index_file):
+            return False
+
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") != self.VERSION:
+                return False
+        except Exception as e:
+            print(f"Ошибка загрузки индекса: {e}")
+            return False
+
+        self.clear()
+        self._chat_terms = data.get("terms", {})
+        for chat_id, terms in self._chat_terms.items():
+            for term, weight in terms.items():
+                self._postings.setdefault(term, {})[chat_id] = weight
+        self._vocabulary = sorted(self._postings)
+        self._fingerprints = {cid: tuple(fp) for cid, fp in data.get("fingerprints", {}).items()}
+        return True
+
+    def save(self) -> bool:
+        """Сохранить индекс в файл"""
+        if not self.index_file:
+            return False
+
+        try:
+            # Сериализуем под блокировкой, а на диск пишем уже без нее
+            with self._lock:
+                text = json.dumps({
+                    "version": self.VERSION,
+                    "fingerprints": self._fingerprints,
+                    "terms": self._chat_terms
+                }, ensure_ascii=False)
+            atomic_write_text(self.index_file, text)
+            return True
+        except Exception as e:
+            print(f"Ошибка сохранения индекса: {e}")
+            return False
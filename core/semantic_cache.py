@@ -0,0 +1,178 @@
+# core/semantic_cache.py
+"""
+Кэш ответов по смыслу вопроса
+
+Вопрос переводится в вектор эмбеддинг-моделью Ollama (/api/embeddings),
+и если среди прежних вопросов есть близкий по косинусной мере (не ниже
+порога), отдается сохраненный ответ — перефразированный вопрос не
+генерируется заново. Сравнение идет одним умножением матрицы векторов
+на вектор запроса (NumPy).
+
+Кэшируются только самостоятельные вопросы — без предыдущих реплик в
+запросе: уточнение вроде «а почему?» значит разное в разных беседах.
+Все остальное (модель, системный промпт, параметры) должно совпадать
+точно — это «область» записи, близость ищется только внутри нее.
+
+Журнал, лимиты и срок жизни — те же, что у кэша точных совпадений.
+"""
+
+import base64
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+from core.response_cache import (RESPONSE_CACHE_BYTES, RESPONSE_CACHE_ENTRIES,
+                                 RESPONSE_CACHE_TTL, ResponseCache)
+
+# NumPy — необязательная зависимость (pip install numpy)
+try:
+    import numpy
+    NUMPY_AVAILABLE = True
+except ImportError:
+    numpy = None
+    NUMPY_AVAILABLE = False
+
+EMBEDDING_MODEL = "nomic-embed-text"
+SIMILARITY_THRESHOLD = 0.92  # Косинусная близость, начиная с которой вопросы считаются одинаковыми
+
+
+def semantic_query(payload: Dict[str, Any]) -> Optional[str]:
+    """Вопрос, по смыслу которого можно искать ответ (None — запрос зависит от предыдущих реплик)"""
+    dialog = [message for message in payload.get("messages", []) if message.get("role") != "system"]
+    if len(dialog) != 1 or dialog[0].get("role") != "user":
+        return None
+    return dialog[0].get("content", "").strip() or None
+
+
+def semantic_scope(payload: Dict[str, Any], embedding_model: str) -> str:
+    """Все, кроме вопроса, что влияет на ответ: модель, системный промпт и параметры"""
+    data = {
+        "model": payload.get("model"),
+        "system": [message.get("content", "") for message in payload.get("messages", [])
+                   if message.get("role") == "system"],
+        "options": payload.get("options"),
+        "embedding_model": embedding_model,
+    }
+    text = json.dumps(data, ensure_ascii=False, sort_keys=True)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class SemanticCache(ResponseCache):
+    # Нормированный вектор собирается из embedding при чтении
+    _transient = ("size", "vector")
+
+    def __init__(self, path: Optional[str] = None, model: str = EMBEDDING_MODEL,
+                 threshold: float = SIMILARITY_THRESHOLD, max_entries: int = RESPONSE_CACHE_ENTRIES,
+                 max_bytes: int = RESPONSE_CACHE_BYTES, ttl: Optional[float] = RESPONSE_CACHE_TTL):
+        """
+        Инициализация кэша по смыслу
+
+        Args:
+            path: Файл журнала (None — кэш только в RAM)
+            model: Эмбеддинг-модель Ollama
+            threshold: Минимальная косинусная близость вопросов для попадания
+            max_entries: Сколько ответов хранить
+            max_bytes: Суммарный размер текстов ответов (байт UTF-8)
+            ttl: Сколько секунд ответ остается годным (None — без ограничения)
+        """
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("Для кэша по смыслу установите: pip install numpy")
+        super().__init__(path, max_entries, max_bytes, ttl)
+        self.model = model
+        self.threshold = threshold
+        self._matrices: Optional[Dict[str, Any]] = None  # Область -> (ключи, матрица векторов)
+
+    def find(self, scope: str, embedding: Sequence[float]) -> Optional[str]:
+        """
+        Ответ на самый близкий по смыслу прежний вопрос
+
+        Args:
+            scope: Область запроса (semantic_scope)
+            embedding: Вектор вопроса
+
+        Returns:
+            Текст ответа или None, если близкого вопроса нет
+        """
+        query = _normalize(embedding)
+        with self._lock:
+            entries = self._get_entries()
+            keys, matrix = self._index().get(scope, ((), None))
+            best = None
+            if matrix is not None and query is not None and matrix.shape[1] == query.shape[0]:
+                scores = matrix @ query
+                position = int(numpy.argmax(scores))
+                if scores[position] >= self.threshold:
+                    best = keys[position]
+
+            entry = entries.get(best) if best is not None else None
+            if entry is not None and self._expired(entry):
+                self._drop(best)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            entries.move_to_end(best)
+            self.hits += 1
+            return entry["text"]
+
+    def has_scope(self, scope: str) -> bool:
+        """Есть ли в области хоть один ответ (иначе искать нечего и вектор вопроса не нужен)"""
+        with self._lock:
+            self._get_entries()
+            return scope in self._index()
+
+    def add(self, scope: str, query: str, embedding: Sequence[float], text: str):
+        """Запомнить ответ на вопрос"""
+        vector = numpy.asarray(embedding, dtype=numpy.float32)
+        key = hashlib.blake2b(f"{scope}\n{query}".encode("utf-8"), digest_size=16).hexdigest()
+        self._store({
+            "key": key,
+            "scope": scope,
+            "query": query,
+            "embedding": base64.b64encode(vector.tobytes()).decode("ascii"),
+            "text": text,
+            "created": time.time()
+        })
+
+    # ================= ИНДЕКС =================
+
+    def _add(self, entries: "OrderedDict[str, Dict[str, Any]]", entry: Dict[str, Any], size: int):
+        super()._add(entries, entry, size)
+        item = entries[entry["key"]]
+        if "vector" not in item:
+            try:
+                item["vector"] = _normalize(numpy.frombuffer(base64.b64decode(entry["embedding"]),
+                                                             dtype=numpy.float32))
+            except (KeyError, ValueError):
+                item["vector"] = None
+        self._matrices = None
+
+    def _drop(self, key: str):
+        super()._drop(key)
+        self._matrices = None
+
+    def _index(self) -> Dict[str, Any]:
+        """Матрицы векторов по областям (пересобираются после изменений)"""
+        if self._matrices is None:
+            groups: Dict[str, List[Any]] = {}
+            for key, item in self._entries.items():
+                if item.get("vector") is not None:
+                    groups.setdefault(item.get("scope"), []).append((key, item["vector"]))
+            self._matrices = {}
+            for scope, rows in groups.items():
+                # Векторы другой размерности (сменили модель) в матрицу не попадают
+                size = rows[-1][1].shape[0]
+                rows = [(key, vector) for key, vector in rows if vector.shape[0] == size]
+                self._matrices[scope] = ([key for key, _ in rows], numpy.stack([vector for _, vector in rows]))
+        return self._matrices
+
+
+def _normalize(embedding: Sequence[float]) -> Optional[Any]:
+    """Вектор единичной длины (None для нулевого)"""
+    vector = numpy.asarray(embedding, dtype=numpy.float32)
+    norm = float(numpy.linalg.norm(vector))
+    if vector.ndim != 1 or norm == 0.0:
+        return None
+    return vector / norm
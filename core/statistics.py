@@ -0,0 +1,128 @@
+# core/statistics.py
+"""
+Статистика памяти: счетчики, которые обновляются с каждым изменением
+"""
+
+from typing import Any, Dict, Optional
+
+def empty_statistics() -> Dict[str, Any]:
+    """Пустой блок статистики"""
+    return {
+        "total_chats": 0,
+        "total_messages": 0,
+        "last_active": None,
+        "daily_messages": {},  # "ГГГГ-ММ-ДД" -> новых сообщений за день
+        "latency": {},  # модель -> суммы времени ответа
+        "cache": {}  # "exact" / "semantic" / "miss" -> число ответов
+    }
+
+def message_count(chat: Dict[str, Any]) -> int:
+    """Количество сообщений в чате (загружены они или нет)"""
+    if "messages" in chat:
+        return len(chat["messages"])
+    return chat.get("message_count", 0)
+
+def apply_statistics(memory_data: Dict[str, Any], record: Dict[str, Any]):
+    """
+    Обновить счетчики по одному изменению
+
+    Вызывается до применения изменения к чатам — нужны прежние значения.
+    """
+    stats = memory_data.setdefault("statistics", empty_statistics())
+    chats = memory_data.get("chats", {})
+    op = record.get("op")
+
+    # Счетчики ответов копятся в RAM и попадают на диск вместе с ближайшим изменением
+    for counter in record.get("counters", ()):
+        apply_statistics(memory_data, counter)
+
+    if op == "put_chat":
+        chat = record["chat"]
+        old = chats.get(chat["id"])
+        if old is None:
+            stats["total_chats"] = stats.get("total_chats", 0) + 1
+        added = message_count(chat) - (message_count(old) if old is not None else 0)
+        _add_messages(stats, added, chat.get("timestamp"))
+
+    elif op == "update_chat":
+        old = chats.get(record["id"])
+        if old is None:
+            return
+        old_count = message_count(old)
+        if "message_count" in record:
+            # Запись из журнала: сообщений в ней нет, только их итоговое число
+            added = record["message_count"] - old_count
+        else:
+            added = len(record["messages"]) - old_count if "messages" in record else 0
+            added += len(record.get("append", []))
+        _add_messages(stats, added, record.get("timestamp"))
+
+    elif op == "delete_chat":
+        old = chats.get(record["id"])
+        if old is not None:
+            stats["total_chats"] = max(0, stats.get("total_chats", 0) - 1)
+            stats["total_messages"] = max(0, stats.get("total_messages", 0) - message_count(old))
+
+    elif op == "clear_chats":
+        stats["total_chats"] = 0
+        stats["total_messages"] = 0
+
+    elif op == "add_latency":
+        model = stats.setdefault("latency", {}).setdefault(record["model"], {
+            "count": 0, "first_token_sum": 0.0, "total_sum": 0.0, "total_max": 0.0
+        })
+        model["count"] += 1
+        model["first_token_sum"] += record.get("first_token", 0.0)
+        model["total_sum"] += record.get("total", 0.0)
+        model["total_max"] = max(model["total_max"], record.get("total", 0.0))
+
+    elif op == "add_cache_lookup":
+        cache = stats.setdefault("cache", {})
+        layer = record.get("layer") or "miss"
+        cache[layer] = cache.get(layer, 0) + 1
+
+    if record.get("timestamp"):
+        stats["last_active"] = record["timestamp"]
+
+def _add_messages(stats: Dict[str, Any], added: int, timestamp: Optional[str]):
+    stats["total_messages"] = max(0, stats.get("total_messages", 0) + added)
+    if added > 0 and timestamp:
+        # Активность по дням не уменьшается при удалении чатов
+        daily = stats.setdefault("daily_messages", {})
+        day = timestamp[:10]
+        daily[day] = daily.get(day, 0) + added
+
+def count_totals(chats: Dict[str, Dict[str, Any]]) -> Dict[str, int]:
+    """Пересчитать итоги по чатам (O(число чатов), сообщения не читаются)"""
+    return {
+        "total_chats": len(chats),
+        "total_messages": sum(message_count(chat) for chat in chats.values())
+    }
+
+def cache_summary(stats: Dict[str, Any]) -> Dict[str, Any]:
+    """Доля ответов из кэша: всего и по слоям (точное совпадение, по смыслу)"""
+    cache = stats.get("cache", {})
+    total = sum(cache.values())
+    if not total:
+        return {}
+    return {
+        "responses": total,
+        "hit_rate": round((cache.get("exact", 0) + cache.get("semantic", 0)) / total, 3),
+        "exact_rate": round(cache.get("exact", 0) / total, 3),
+        "semantic_rate": round(cache.get("semantic", 0) / total, 3)
+    }
+
+def latency_summary(stats: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    """Средние времена ответа по моделям (секунды)"""
+    summary = {}
+    for model, data in stats.get("latency", {}).items():
+        count = data.get("count", 0)
+        if not count:
+            continue
+        summary[model] = {
+            "responses": count,
+            "avg_first_token": round(data.get("first_token_sum", 0.0) / count, 3),
+            "avg_total": round(data.get("total_sum", 0.0) / count, 3),
+            "max_total": round(data.get("total_max", 0.0), 3)
+        }
+    return summary
@@ -0,0 +1,854 @@
+# core/storage.py
+"""
+Хранилища памяти Jarvis: JSON (снимок + журнал) и SQLite
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Any, Optional, Tuple
+from urllib.parse import quote, unquote
+
+from core.blobs import BlobStore, content_hash
+from core.messages import SHARED_CONTENT_SIZE, MessageLog
+from core.statistics import apply_statistics
+from utils.file_utils import FileLock, atomic_write_text, backup_paths, rotate_backups
+
+def apply_record(memory_data: Dict[str, Any], record: Dict[str, Any]):
+    """Применить одно изменение (запись журнала) к памяти в RAM"""
+    op = record.get("op")
+    chats = memory_data.setdefault("chats", {})
+    apply_statistics(memory_data, record)
+
+    if op == "put_chat":
+        # Копия, чтобы последующие изменения чата не меняли саму запись.
+        # Запись из журнала несет только метаданные — сообщения остаются на диске
+        chat = dict(record["chat"])
+        if "messages" in chat:
+            chat["messages"] = MessageLog(chat["messages"])  # Снимок за O(1), если пришел MessageLog
+            chat["message_count"] = len(chat["messages"])
+        chats[chat["id"]] = chat
+
+    elif op == "update_chat":
+        chat = chats.get(record["id"])
+        if chat is None:
+            return
+        if "messages" in record:
+            chat["messages"] = MessageLog(record["messages"])
+            chat["message_count"] = len(chat["messages"])
+        if "append" in record:
+            if "messages" in chat:
+                if not isinstance(chat["messages"], MessageLog):
+                    chat["messages"] = MessageLog(chat["messages"])
+                chat["messages"].extend(record["append"])
+                chat["message_count"] = len(chat["messages"])
+            else:
+                chat["message_count"] = chat.get("message_count", 0) + len(record["append"])
+        for key in ("title", "think_mode", "timestamp", "message_count", "summary", "summarized"):
+            if key in record:
+                chat[key] = record[key]
+
+    elif op == "upgrade_chat":
+        # Ленивая миграция схемы чата: меняются только метаданные
+        chat = chats.get(record["id"])
+        if chat is not None:
+            chat.update(record["fields"])
+
+    elif op == "delete_chat":
+        chats.pop(record["id"], None)
+
+    elif op == "clear_chats":
+        memory_data["chats"] = {}
+
+    elif op == "set_setting":
+        memory_data.setdefault("settings", {})[record["key"]] = record["value"]
+
+def rebase(memory_data: Dict[str, Any], records: List[Dict[str, Any]]):
+    """
+    Применить свои еще не записанные изменения к данным, перечитанным с диска
+
+    Так изменения другого процесса не затираются: его версия берется
+    за основу, а наши изменения ложатся поверх, как записи журнала.
+    """
+    for record in records:
+        # Итоговое число сообщений считалось по прежним данным — пересчитываем
+        apply_record(memory_data, {key: value for key, value in record.items() if key != "message_count"})
+        if record.get("op") == "update_chat" and "message_count" in record:
+            chat = memory_data.get("chats", {}).get(record["id"])
+            if chat is not None:
+                record["message_count"] = chat.get("message_count", 0)
+
+
+class JsonStorage:
+    def __init__(self, memory_file: str = "memory.json", journal_file: str = "memory.journal",
+                 compact_records: int = 200, lock: Optional[threading.RLock] = None,
+                 backups: int = 3, chats_dir: str = "memory_chats",
+                 on_reload: Optional[Callable[[Dict[str, Any]], None]] = None):
+        """
+        Хранилище в виде JSON-снимка и журнала изменений
+
+        Снимок и журнал содержат только метаданные чатов, сообщения каждого
+        чата лежат в отдельном файле в chats_dir и читаются по требованию.
+        Длинные тексты сообщений хранятся один раз в общей таблице
+        (chats_dir/blobs.log), файлы чатов ссылаются на них по хешу.
+
+        Несколько процессов (GUI и голосовой цикл) могут работать с одними
+        файлами: запись идет под межпроцессной блокировкой, а каждая запись
+        на диск увеличивает номер версии. Если перед записью оказалось, что
+        файлы менял кто-то другой, данные перечитываются, свои незаписанные
+        изменения применяются поверх (rebase) и результат отдается в on_reload.
+
+        Args:
+            memory_file: Файл снимка
+            journal_file: Журнал изменений после последнего снимка
+            compact_records: После стольких записей журнал сворачивается в снимок
+            lock: Блокировка, под которой меняется память в RAM
+            backups: Сколько прошлых снимков хранить для восстановления
+            chats_dir: Каталог с сообщениями чатов (по файлу на чат)
+            on_reload: Получает данные после слияния с изменениями другого процесса
+        """
+        self.memory_file = memory_file
+        self.journal_file = journal_file
+        self.compact_records = compact_records
+        self.backups = backups
+        self.chats_dir = chats_dir
+        self.blobs = BlobStore(os.path.join(chats_dir, "blobs.log"))
+        self._memory_lock = lock or threading.RLock()
+        self._journal_records = 0
+        self._journal_seq = 0  # Номер последней примененной записи
+        self._snapshot_seq = 0  # Номер последней записи, вошедшей в снимок
+        self._shard_seq = 0  # Номер последней записи, сообщения которой уже в файлах чатов
+        self._needs_snapshot = False  # Снимок в старом формате — переписать при первой возможности
+        self._lock = threading.Lock()  # Порядок операций с файлами
+        self.on_reload = on_reload
+        self._file_lock = FileLock(f"{memory_file}.lock")  # Порядок между процессами
+        self._version = 0  # Версия данных на диске, с которой мы синхронны
+        self._signature: Optional[Tuple] = None  # Отпечаток файлов после нашей последней записи
+        self._unwritten: List[Dict[str, Any]] = []  # Примененные в RAM, но еще не записанные изменения
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Загрузить снимок и догнать его журналом (None, если данных нет)"""
+        with self._lock, self._file_lock:
+            data = self._read_disk()
+            self._signature = self._disk_signature()
+        if data is None:
+            return None
+
+        # Номера записей этого процесса продолжают номера с диска
+        self._journal_seq = max(self._journal_seq, data.get("journal_seq", 0), self._version)
+        self._snapshot_seq = self._shard_seq = self._journal_seq
+        self._split_inline_messages(data)
+        return data
+
+    @property
+    def version(self) -> int:
+        """Номер версии данных на диске (растет с каждой записью любого процесса)"""
+        return self._version
+
+    def _read_disk(self) -> Optional[Dict[str, Any]]:
+        """Снимок, догнанный журналом, — в том виде, в каком он сейчас на диске"""
+        if not os.path.exists(self.memory_file) and not os.path.exists(self.journal_file):
+            self._journal_records = 0
+            return None
+
+        data = {}
+        if os.path.exists(self.memory_file):
+            try:
+                data = self._read_snapshot(self.memory_file)
+            except (OSError, ValueError) as e:
+                print(f"Ошибка чтения {self.memory_file}: {e}")
+                data = self._recover()
+
+        # Снимки старого формата версии не знают — ее заменяет номер записи
+        self._version = data.pop("version", data.get("journal_seq", 0))
+        self._replay_journal(data)
+        return data
+
+    def _disk_signature(self) -> Tuple:
+        """Отпечаток снимка и журнала: меняется при любой записи, чьей бы она ни была"""
+        signature = []
+        for path in (self.memory_file, self.journal_file):
+            try:
+                stat = os.stat(path)
+                signature.append((stat.st_ino, stat.st_size, stat.st_mtime_ns))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _catch_up(self) -> bool:
+        """
+        Подтянуть изменения другого процесса (вызывается под файловой блокировкой)
+
+        Returns:
+            True, если файлы менял кто-то другой и данные были перечитаны
+        """
+        if self._signature is None or self._disk_signature() == self._signature:
+            return False
+
+        data = self._read_disk() or {}
+        with self._memory_lock:
+            rebase(data, self._unwritten)
+            if self.on_reload:
+                self.on_reload(data)
+        self._signature = self._disk_signature()
+        return True
+
+    def _forget_written(self, records: List[Dict[str, Any]]):
+        written = {id(record) for record in records}
+        with self._memory_lock:
+            self._unwritten = [record for record in self._unwritten if id(record) not in written]
+
+    def load_messages(self, chat_id: str) -> List[Dict[str, str]]:
+        """Прочитать сообщения одного чата"""
+        return self.blobs.unpack(self._read_shard(self._shard_path(chat_id)))
+
+    def _read_snapshot(self, path: str) -> Dict[str, Any]:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError("снимок не является объектом JSON")
+        return data
+
+    def _recover(self) -> Dict[str, Any]:
+        """
+        Восстановиться из последней исправной резервной копии снимка
+
+        Испорченный файл не удаляется, а откладывается в сторону, чтобы
+        следующая запись его не затерла. Журнал затем применяется поверх
+        копии — пропадают только изменения между копией и испорченным снимком.
+        """
+        corrupt_file = f"{self.memory_file}.corrupt-{time.strftime('%Y%m%d-%H%M%S')}"
+        try:
+            os.replace(self.memory_file, corrupt_file)
+            print(f"Испорченный снимок сохранен как {corrupt_file}")
+        except OSError as e:
+            print(f"Не удалось отложить испорченный снимок: {e}")
+
+        for path in backup_paths(self.memory_file, self.backups):
+            if not os.path.exists(path):
+                continue
+            try:
+                data = self._read_snapshot(path)
+            except (OSError, ValueError) as e:
+                print(f"Резервная копия {path} тоже испорчена: {e}")
+                continue
+            print(f"Память восстановлена из {path}")
+            return data
+
+        raise ValueError(f"нет исправных копий {self.memory_file}")
+
+    def _split_inline_messages(self, data: Dict[str, Any]):
+        """Вынести сообщения из снимка старого формата в файлы чатов"""
+        for chat in data.get("chats", {}).values():
+            if "messages" not in chat:
+                continue
+            messages = chat.pop("messages")
+            chat["message_count"] = len(messages)
+            self._needs_snapshot = True
+
+            # Файл чата новее любого снимка старого формата — его не трогаем
+            if not os.path.exists(self._shard_path(chat["id"])):
+                self._write_shard(chat["id"], messages)
+
+    def save(self, memory_data: Dict[str, Any]) -> bool:
+        """Записать полный снимок и очистить журнал"""
+        with self._lock, self._file_lock:
+            # Снимок заменит все на диске — сначала забираем чужие изменения
+            self._catch_up()
+
+            # Сериализуем под блокировкой памяти, а на диск пишем уже без нее
+            with self._memory_lock:
+                self._version += 1
+                memory_data["journal_seq"] = self._journal_seq
+                snapshot_seq = self._journal_seq
+                chats = memory_data.get("chats", {})
+                snapshot = dict(memory_data)
+                snapshot["chats"] = {
+                    chat_id: {key: value for key, value in chat.items() if key != "messages"}
+                    for chat_id, chat in chats.items()
+                }
+                # У чатов с сообщениями в RAM (миграция, импорт) счетчик мог не завестись
+                for chat_id, chat in chats.items():
+                    if "messages" in chat:
+                        snapshot["chats"][chat_id]["message_count"] = len(chat["messages"])
+                loaded = [(chat_id, list(chat["messages"]))
+                          for chat_id, chat in chats.items() if "messages" in chat]
+                snapshot["version"] = self._version
+                text = json.dumps(snapshot, ensure_ascii=False, indent=2)
+
+            # Чаты, которых еще нет на диске (миграция, импорт), записываем целиком.
+            # Остальные файлы чатов фоновый писатель поддерживает сам
+            for chat_id, messages in loaded:
+                if not os.path.exists(self._shard_path(chat_id)):
+                    self._write_shard(chat_id, messages)
+            self._remove_shards(keep=set(snapshot["chats"]))
+
+            # Прежний снимок становится резервной копией, новый
+            # появляется атомарно — обрезанного файла на диске не бывает
+            rotate_backups(self.memory_file, self.backups)
+            atomic_write_text(self.memory_file, text)
+
+            # Снимок содержит все изменения — журнал больше не нужен
+            self._snapshot_seq = snapshot_seq
+            self._needs_snapshot = False
+            self._truncate_journal()
+            self._signature = self._disk_signature()
+
+            # Вошедшие в снимок изменения уже на диске — при слиянии их не повторяем
+            with self._memory_lock:
+                self._unwritten = [record for record in self._unwritten if record["seq"] > snapshot_seq]
+        return True
+
+    def prepare(self, memory_data: Dict[str, Any], record: Dict[str, Any]):
+        """Пронумеровать изменение и применить его в RAM (под блокировкой памяти)"""
+        self._journal_seq += 1
+        record["seq"] = self._journal_seq
+        apply_record(memory_data, record)
+        memory_data["journal_seq"] = self._journal_seq
+        self._unwritten.append(record)
+
+        # В журнал сообщения не попадают, поэтому запоминаем их число
+        if record.get("op") == "update_chat":
+            chat = memory_data.get("chats", {}).get(record["id"])
+            if chat is not None:
+                record["message_count"] = chat.get("message_count", 0)
+
+    def write(self, records: List[Dict[str, Any]]):
+        """Дописать пачку изменений в журнал (O(размер изменений))"""
+        with self._lock, self._file_lock:
+            self._catch_up()
+
+            # Сначала сообщения: журнал не должен ссылаться на то, чего нет на диске.
+            # При повторе неудачной пачки уже записанное не дописываем второй раз
+            for record in records:
+                if record["seq"] > self._shard_seq:
+                    self._write_messages(record)
+                    self._shard_seq = record["seq"]
+
+            # Записи, уже вошедшие в снимок, в журнал писать не нужно.
+            # Каждая запись журнала получает следующий номер версии
+            lines = []
+            for record in records:
+                if record["seq"] > self._snapshot_seq:
+                    self._version += 1
+                    entry = dict(self._journal_entry(record), version=self._version)
+                    lines.append(json.dumps(entry, ensure_ascii=False) + "\n")
+            if lines:
+                with open(self.journal_file, 'a', encoding='utf-8') as f:
+                    f.writelines(lines)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._journal_records += len(lines)
+                self._signature = self._disk_signature()
+
+        self._forget_written(records)
+
+    def needs_compaction(self) -> bool:
+        """Пора ли свернуть журнал в снимок"""
+        return self._needs_snapshot or self._journal_records >= self.compact_records
+
+    def clear(self):
+        """Удалить все данные"""
+        with self._lock, self._file_lock:
+            for path in [self.memory_file] + backup_paths(self.memory_file, self.backups):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._remove_shards(keep=set())
+            self._truncate_journal()
+            self._signature = self._disk_signature()
+            with self._memory_lock:
+                self._unwritten = []
+
+    def _replay_journal(self, memory_data: Dict[str, Any]) -> int:
+        """Применить записи журнала к загруженному снимку (версия снимка — в self._version)"""
+        self._journal_records = 0
+        if not os.path.exists(self.journal_file):
+            return 0
+
+        # Записи, уже вошедшие в снимок (сбой до удаления журнала), пропускаем.
+        # Записи старого формата без версии сравниваются по номеру
+        snapshot_version = self._version
+
+        count = 0
+        with open(self.journal_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    version = record.get("version", record.get("seq", 0))
+                    if version <= snapshot_version:
+                        continue
+                    apply_record(memory_data, record)
+                    self._version = max(self._version, version)
+                    count += 1
+                except (ValueError, KeyError):
+                    # Оборванная запись (сбой во время записи) — пропускаем
+                    continue
+
+        self._journal_records = count
+        return count
+
+    def _truncate_journal(self):
+        """Очистить журнал после записи снимка"""
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+        self._journal_records = 0
+
+    # ================= ФАЙЛЫ ЧАТОВ =================
+
+    def _shard_path(self, chat_id: str) -> str:
+        return os.path.join(self.chats_dir, quote(chat_id, safe="") + ".jsonl")
+
+    def _read_shard(self, path: str) -> List[Dict[str, str]]:
+        """Записи файла чата как есть (длинные тексты — ссылками)"""
+        if not os.path.exists(path):
+            return []
+
+        entries = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # Оборванная строка (сбой во время дописывания) — пропускаем
+                    continue
+        return entries
+
+    def _write_shard(self, chat_id: str, messages: List[Dict[str, str]]):
+        os.makedirs(self.chats_dir, exist_ok=True)
+        path = self._shard_path(chat_id)
+        old_entries = self._read_shard(path)
+        text = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in self.blobs.pack(messages))
+        atomic_write_text(path, text)
+        # Ссылки прежней версии освобождаем, когда новая уже на диске
+        self.blobs.release(old_entries)
+
+    def _append_shard(self, chat_id: str, messages: List[Dict[str, str]]):
+        os.makedirs(self.chats_dir, exist_ok=True)
+        entries = self.blobs.pack(messages)
+        with open(self._shard_path(chat_id), 'a', encoding='utf-8') as f:
+            f.writelines(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _remove_shard(self, chat_id: str):
+        path = self._shard_path(chat_id)
+        if os.path.exists(path):
+            entries = self._read_shard(path)
+            os.remove(path)
+            self.blobs.release(entries)
+
+    def _remove_shards(self, keep: set):
+        """Удалить файлы чатов, которых больше нет в памяти"""
+        if not keep:
+            # Чатов не осталось — ссылок на общие тексты тоже
+            self.blobs.clear()
+        if not os.path.isdir(self.chats_dir):
+            return
+        for name in os.listdir(self.chats_dir):
+            if not name.endswith(".jsonl"):
+                continue
+            chat_id = unquote(name[:-len(".jsonl")])
+            if not keep:
+                os.remove(os.path.join(self.chats_dir, name))
+            elif chat_id not in keep:
+                self._remove_shard(chat_id)
+
+    def _write_messages(self, record: Dict[str, Any]):
+        """Перенести изменение сообщений из записи в файл чата"""
+        op = record.get("op")
+
+        if op == "put_chat":
+            self._write_shard(record["chat"]["id"], record["chat"].get("messages", []))
+
+        elif op == "update_chat":
+            if "messages" in record:
+                self._write_shard(record["id"], record["messages"])
+            if record.get("append"):
+                self._append_shard(record["id"], record["append"])
+
+        elif op == "delete_chat":
+            self._remove_shard(record["id"])
+
+        elif op == "clear_chats":
+            self._remove_shards(keep=set())
+
+    def _journal_entry(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """Запись для журнала — без текста сообщений"""
+        op = record.get("op")
+        if op == "put_chat":
+            chat = {key: value for key, value in record["chat"].items() if key != "messages"}
+            chat["message_count"] = len(record["chat"].get("messages", []))
+            return dict(record, chat=chat)
+        if op == "update_chat":
+            return {key: value for key, value in record.items() if key not in ("messages", "append")}
+        return record
+
+
+class SqliteStorage:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS chats (
+            id TEXT PRIMARY KEY,
+            title TEXT NOT NULL DEFAULT '',
+            timestamp TEXT NOT NULL DEFAULT '',
+            think_mode INTEGER NOT NULL DEFAULT 0,
+            schema INTEGER NOT NULL DEFAULT 1,
+            summary TEXT NOT NULL DEFAULT '',
+            summarized INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_chats_timestamp ON chats(timestamp);
+        CREATE TABLE IF NOT EXISTS messages (
+            chat_id TEXT NOT NULL REFERENCES chats(id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            blob TEXT,
+            PRIMARY KEY (chat_id, position)
+        );
+        CREATE TABLE IF NOT EXISTS blobs (
+            hash TEXT PRIMARY KEY,
+            content TEXT NOT NULL,
+            refs INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+
+    # Счетчики ссылок на общие тексты ведет сама база: так их не собьет
+    # ни каскадное удаление, ни запись из другого процесса
+    BLOB_SCHEMA = """
+        CREATE INDEX IF NOT EXISTS idx_messages_blob ON messages(blob) WHERE blob IS NOT NULL;
+        CREATE TRIGGER IF NOT EXISTS blob_ref AFTER INSERT ON messages WHEN NEW.blob IS NOT NULL
+        BEGIN
+            UPDATE blobs SET refs = refs + 1 WHERE hash = NEW.blob;
+        END;
+        CREATE TRIGGER IF NOT EXISTS blob_unref AFTER DELETE ON messages WHEN OLD.blob IS NOT NULL
+        BEGIN
+            UPDATE blobs SET refs = refs - 1 WHERE hash = OLD.blob;
+            DELETE FROM blobs WHERE hash = OLD.blob AND refs <= 0;
+        END;
+    """
+
+    def __init__(self, db_file: str = "memory.db", lock: Optional[threading.RLock] = None,
+                 on_reload: Optional[Callable[[Dict[str, Any]], None]] = None):
+        """
+        Хранилище в SQLite (режим WAL)
+
+        Блокировку между процессами дает сама SQLite; каждая транзакция
+        записи увеличивает версию в таблице meta. Длинные тексты сообщений
+        хранятся один раз в таблице blobs, сообщения ссылаются на них по хешу. Если версия в базе не та,
+        что мы видели, данные перечитываются, свои незаписанные изменения
+        применяются поверх (rebase) и результат отдается в on_reload.
+
+        Args:
+            db_file: Файл базы данных
+            lock: Блокировка, под которой меняется память в RAM
+            on_reload: Получает данные после слияния с изменениями другого процесса
+        """
+        self.db_file = db_file
+        self._memory_lock = lock or threading.RLock()
+        self._local = threading.local()
+        self._statistics: Optional[str] = None  # Статистика, еще не записанная в базу
+        self.on_reload = on_reload
+        self._version = 0  # Версия данных в базе, с которой мы синхронны
+        self._seq = 0  # Номер последнего изменения в RAM
+        self._saved_seq = 0  # Изменения с номером до этого уже записаны полным сохранением
+        self._unwritten: List[Dict[str, Any]] = []  # Примененные в RAM, но еще не записанные изменения
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+            # Базы до версионирования чатов: колонки schema еще нет
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(chats)")}
+            if "schema" not in columns:
+                conn.execute("ALTER TABLE chats ADD COLUMN schema INTEGER NOT NULL DEFAULT 1")
+            if "summary" not in columns:
+                conn.execute("ALTER TABLE chats ADD COLUMN summary TEXT NOT NULL DEFAULT ''")
+                conn.execute("ALTER TABLE chats ADD COLUMN summarized INTEGER NOT NULL DEFAULT 0")
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(messages)")}
+            if "blob" not in columns:
+                conn.execute("ALTER TABLE messages ADD COLUMN blob TEXT")
+                self._share_contents(conn)
+            conn.executescript(self.BLOB_SCHEMA)
+
+    def _share_contents(self, conn: sqlite3.Connection):
+        """Один раз при обновлении базы: вынести длинные тексты в общую таблицу"""
+        conn.create_function("content_hash", 1, content_hash, deterministic=True)
+        conn.execute(
+            """
+            INSERT INTO blobs (hash, content, refs)
+            SELECT content_hash(content), content, COUNT(*) FROM messages
+            WHERE length(content) >= ? GROUP BY content_hash(content)
+            """,
+            (SHARED_CONTENT_SIZE,)
+        )
+        conn.execute(
+            "UPDATE messages SET blob = content_hash(content), content = '' WHERE length(content) >= ?",
+            (SHARED_CONTENT_SIZE,)
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        """Соединение текущего потока (sqlite3 не делит соединения между потоками)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Загрузить память из базы (None, если база пуста)"""
+        return self._read(self._connect())
+
+    @property
+    def version(self) -> int:
+        """Номер версии данных в базе (растет с каждой транзакцией записи любого процесса)"""
+        return self._version
+
+    def _read(self, conn: sqlite3.Connection) -> Optional[Dict[str, Any]]:
+        meta = {key: json.loads(value) for key, value in conn.execute("SELECT key, value FROM meta")}
+        self._version = meta.pop("version", 0)
+        settings = {key: json.loads(value) for key, value in conn.execute("SELECT key, value FROM settings")}
+        chat_rows = conn.execute("""
+            SELECT c.id, c.title, c.timestamp, c.think_mode, c.schema, c.summary, c.summarized,
+                   (SELECT COUNT(*) FROM messages m WHERE m.chat_id = c.id)
+            FROM chats c
+        """).fetchall()
+
+        if not meta and not settings and not chat_rows:
+            return None
+
+        # Сообщения читаются по требованию (load_messages)
+        chats = {}
+        for chat_id, title, timestamp, think_mode, schema, summary, summarized, message_count in chat_rows:
+            chats[chat_id] = {
+                "id": chat_id,
+                "title": title,
+                "timestamp": timestamp,
+                "think_mode": bool(think_mode),
+                "schema": schema,
+                "message_count": message_count
+            }
+            if summary:
+                chats[chat_id]["summary"] = summary
+                chats[chat_id]["summarized"] = summarized
+
+        data = dict(meta)
+        data["settings"] = settings
+        data["chats"] = chats
+        return data
+
+    def load_messages(self, chat_id: str) -> List[Dict[str, str]]:
+        """Прочитать сообщения одного чата"""
+        return [
+            {"role": role, "content": content}
+            for role, content in self._connect().execute(
+                """
+                SELECT m.role, COALESCE(b.content, m.content) FROM messages m
+                LEFT JOIN blobs b ON b.hash = m.blob
+                WHERE m.chat_id = ? ORDER BY m.position
+                """,
+                (chat_id,)
+            )
+        ]
+
+    def save(self, memory_data: Dict[str, Any]) -> bool:
+        """Полностью записать память одной транзакцией"""
+        # Собираем строки под блокировкой памяти, а в базу пишем уже без нее.
+        # Сообщения переписываем только у чатов, загруженных в RAM
+        conn = self._connect()
+        with conn:
+            # Блокировку записи берем сразу: между сверкой версии и записью никто не вклинится
+            conn.execute("BEGIN IMMEDIATE")
+            self._catch_up(conn)
+
+            with self._memory_lock:
+                saved_seq = self._seq
+                pending = list(self._unwritten)
+                chats = [dict(chat, messages=list(chat["messages"])) if "messages" in chat else dict(chat)
+                         for chat in memory_data.get("chats", {}).values()]
+                settings = [(key, json.dumps(value, ensure_ascii=False))
+                            for key, value in memory_data.get("settings", {}).items()]
+                meta = [(key, json.dumps(value, ensure_ascii=False))
+                        for key, value in memory_data.items() if key not in ("chats", "settings")]
+
+            # Незаписанные изменения — сначала построчно: у невыгруженных
+            # чатов сообщений в RAM нет, и полная запись их бы не покрыла
+            for record in pending:
+                self._write_record(conn, record)
+
+            keep = {chat["id"] for chat in chats}
+            removed = [(chat_id,) for (chat_id,) in conn.execute("SELECT id FROM chats") if chat_id not in keep]
+            conn.executemany("DELETE FROM messages WHERE chat_id = ?", removed)
+            conn.executemany("DELETE FROM chats WHERE id = ?", removed)
+            conn.execute("DELETE FROM settings")
+            conn.execute("DELETE FROM meta")
+
+            for chat in chats:
+                if "messages" in chat:
+                    self._put_chat(conn, chat)
+                else:
+                    self._put_chat_meta(conn, chat)
+
+            conn.executemany("INSERT INTO settings (key, value) VALUES (?, ?)", settings)
+            conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", meta)
+            self._bump_version(conn)
+
+        # Фоновый писатель эти изменения повторно не запишет
+        with self._memory_lock:
+            self._saved_seq = saved_seq
+            self._unwritten = [record for record in self._unwritten if record["seq"] > saved_seq]
+        return True
+
+    def prepare(self, memory_data: Dict[str, Any], record: Dict[str, Any]):
+        """Применить изменение в RAM (под блокировкой памяти)"""
+        self._seq += 1
+        record["seq"] = self._seq
+        apply_record(memory_data, record)
+        # Счетчики статистики пишутся вместе с пачкой изменений
+        self._statistics = json.dumps(memory_data.get("statistics", {}), ensure_ascii=False)
+        self._unwritten.append(record)
+
+    def write(self, records: List[Dict[str, Any]]):
+        """Записать пачку изменений одной транзакцией, трогая только затронутые строки"""
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._catch_up(conn)
+
+            statistics = self._statistics
+            for record in records:
+                if record["seq"] > self._saved_seq:
+                    self._write_record(conn, record)
+            if statistics is not None:
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('statistics', ?)", (statistics,))
+            self._bump_version(conn)
+
+        written = {id(record) for record in records}
+        with self._memory_lock:
+            self._unwritten = [record for record in self._unwritten if id(record) not in written]
+
+    def _catch_up(self, conn: sqlite3.Connection) -> bool:
+        """
+        Подтянуть изменения другого процесса (внутри транзакции записи)
+
+        Returns:
+            True, если базу менял кто-то другой и данные были перечитаны
+        """
+        row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if (json.loads(row[0]) if row else 0) == self._version:
+            return False
+
+        data = self._read(conn) or {}
+        with self._memory_lock:
+            rebase(data, self._unwritten)
+            if self.on_reload:
+                self.on_reload(data)
+            self._statistics = json.dumps(data.get("statistics", {}), ensure_ascii=False)
+        return True
+
+    def _bump_version(self, conn: sqlite3.Connection):
+        self._version += 1
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (json.dumps(self._version),))
+
+    def _write_record(self, conn: sqlite3.Connection, record: Dict[str, Any]):
+        op = record.get("op")
+
+        if op == "put_chat":
+            self._put_chat(conn, record["chat"])
+
+        elif op == "update_chat":
+            chat_id = record["id"]
+            if "messages" in record:
+                conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+                self._insert_messages(conn, chat_id, record["messages"], 0)
+            if "append" in record:
+                start = conn.execute(
+                    "SELECT COALESCE(MAX(position) + 1, 0) FROM messages WHERE chat_id = ?",
+                    (chat_id,)
+                ).fetchone()[0]
+                self._insert_messages(conn, chat_id, record["append"], start)
+            for key in ("title", "think_mode", "timestamp", "summary", "summarized"):
+                if key in record:
+                    value = int(record[key]) if key == "think_mode" else record[key]
+                    conn.execute(f"UPDATE chats SET {key} = ? WHERE id = ?", (value, chat_id))
+
+        elif op == "upgrade_chat":
+            for key in ("title", "think_mode", "timestamp", "schema"):
+                if key in record["fields"]:
+                    value = record["fields"][key]
+                    value = int(value) if key == "think_mode" else value
+                    conn.execute(f"UPDATE chats SET {key} = ? WHERE id = ?", (value, record["id"]))
+
+        elif op == "delete_chat":
+            conn.execute("DELETE FROM messages WHERE chat_id = ?", (record["id"],))
+            conn.execute("DELETE FROM chats WHERE id = ?", (record["id"],))
+
+        elif op == "clear_chats":
+            conn.execute("DELETE FROM messages")
+            conn.execute("DELETE FROM chats")
+
+        elif op == "set_setting":
+            conn.execute(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                (record["key"], json.dumps(record["value"], ensure_ascii=False))
+            )
+
+    def needs_compaction(self) -> bool:
+        """SQLite пишет изменения на месте — сворачивать нечего"""
+        return False
+
+    def clear(self):
+        """Удалить все данные"""
+        conn = self._connect()
+        with conn:
+            for table in ("messages", "blobs", "chats", "settings", "meta"):
+                conn.execute(f"DELETE FROM {table}")
+            self._bump_version(conn)
+        with self._memory_lock:
+            self._unwritten = []
+
+    def _put_chat(self, conn: sqlite3.Connection, chat: Dict[str, Any]):
+        self._put_chat_meta(conn, chat)
+        conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat["id"],))
+        self._insert_messages(conn, chat["id"], chat.get("messages", []), 0)
+
+    def _put_chat_meta(self, conn: sqlite3.Connection, chat: Dict[str, Any]):
+        # UPSERT, а не REPLACE: замена строки удалила бы сообщения каскадом
+        conn.execute(
+            """
+            INSERT INTO chats (id, title, timestamp, think_mode, schema, summary, summarized)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                title = excluded.title, timestamp = excluded.timestamp,
+                think_mode = excluded.think_mode, schema = excluded.schema,
+                summary = excluded.summary, summarized = excluded.summarized
+            """,
+            (chat["id"], chat.get("title", ""), chat.get("timestamp", ""), int(chat.get("think_mode", False)),
+             chat.get("schema", 1), chat.get("summary", ""), chat.get("summarized", 0))
+        )
+
+    def _insert_messages(self, conn: sqlite3.Connection, chat_id: str,
+                         messages: List[Dict[str, str]], start: int):
+        rows, blobs = [], {}
+        for i, msg in enumerate(messages):
+            content = msg.get("content", "")
+            if len(content) >= SHARED_CONTENT_SIZE:
+                # Текст — в общую таблицу (если его там нет), ссылку считает триггер
+                blob = content_hash(content)
+                blobs[blob] = content
+                rows.append((chat_id, start + i, msg.get("role", ""), "", blob))
+            else:
+                rows.append((chat_id, start + i, msg.get("role", ""), content, None))
+
+        conn.executemany("INSERT OR IGNORE INTO blobs (hash, content) VALUES (?, ?)", blobs.items())
+        conn.executemany(
+            "INSERT INTO messages (chat_id, position, role, content, blob) VALUES (?, ?, ?, ?, ?)", rows
+        )
@@ -0,0 +1,169 @@
+# core/summarizer.py
+"""
+Фоновая сводка ранней части длинных чатов
+
+Когда чат перестает помещаться в бюджет промпта, реплики, выпавшие из
+окна, пересказываются моделью (можно отдельной, более дешевой) и сводка
+сохраняется вместе с чатом. Сводка наращивается: в модель уходят только
+прежняя сводка и новые выпавшие реплики, а не вся история. Пока окно не
+сдвинулось хотя бы на min_turns реплик, модель не вызывается.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from core.context import (MESSAGE_OVERHEAD, ContextWindow, estimate_tokens,
+                          message_tokens, truncate_to_tokens)
+
+SUMMARY_MIN_TURNS = 4  # Сколько реплик должно выпасть из окна, чтобы обновить сводку
+
+SUMMARY_INSTRUCTION = (
+    "You maintain a running summary of a conversation between a user and an assistant. "
+    "Update the current summary with the new turns. Keep facts, names, numbers, decisions "
+    "and open questions; drop greetings and small talk. Write in the language of the "
+    "conversation, under {words} words. Reply with the updated summary only."
+)
+SUMMARY_PROMPT = "Current summary:\n{summary}\n\nNew turns:\n{turns}"
+
+
+class Summarizer:
+    def __init__(self, store: Any, client: Any, window: ContextWindow,
+                 model: Optional[str] = None, min_turns: int = SUMMARY_MIN_TURNS):
+        """
+        Инициализация фоновой сводки
+
+        Args:
+            store: Общая память (MemoryStore)
+            client: Клиент Ollama
+            window: Окно контекста, по которому собирается промпт
+            model: Модель для сводки (по умолчанию — модель клиента)
+            min_turns: Сколько реплик должно выпасть из окна, чтобы обновить сводку
+        """
+        self.store = store
+        self.client = client
+        self.window = window
+        self.model = model
+        self.min_turns = min_turns
+
+        self._cond = threading.Condition()
+        self._pending: "OrderedDict[str, Tuple[str, Tuple[str, ...]]]" = OrderedDict()
+        self._generation = None  # Текущий запрос к модели (прерывается в stop)
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+    def schedule(self, chat_id: str, system_prompt: str = "", pinned: Iterable[str] = ()):
+        """
+        Проверить чат и при необходимости обновить сводку (не блокирует вызывающий поток)
+
+        Args:
+            chat_id: ID чата
+            system_prompt: Системный промпт, с которым чат уходит в модель
+            pinned: Закрепленные факты — они тоже занимают место в промпте
+        """
+        with self._cond:
+            if self._stopped:
+                return
+            # Повторная постановка заменяет прежнюю: чат проверяется один раз
+            self._pending.pop(chat_id, None)
+            self._pending[chat_id] = (system_prompt, tuple(pinned))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="chat-summarizer", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Прервать текущую сводку и остановить поток"""
+        with self._cond:
+            self._stopped = True
+            self._pending.clear()
+            generation = self._generation
+            self._cond.notify_all()
+        if generation is not None:
+            generation.cancel()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                chat_id, (system_prompt, pinned) = self._pending.popitem(last=False)
+
+            try:
+                self._summarize(chat_id, system_prompt, pinned)
+            except Exception as e:
+                print(f"Ошибка сводки чата {chat_id}: {e}")
+
+    def _summarize(self, chat_id: str, system_prompt: str, pinned: Sequence[str]):
+        # Архивные чаты сводкой не обновляем — get_chat вернул бы их в память
+        if not self.store.has_chat(chat_id):
+            return
+        chat = self.store.get_chat(chat_id)
+        if chat is None:
+            return
+
+        messages = [message for message in list(chat.get("messages", []))
+                    if message.get("role") != "system"]
+        position = chat.get("summarized", 0)
+        summary = chat.get("summary", "") if position else ""
+        target = self.window.window_start(messages, system_prompt, pinned)
+        if target - position < self.min_turns:
+            return
+
+        summary_tokens = self.window.summary_tokens
+        instruction = SUMMARY_INSTRUCTION.format(words=max(summary_tokens // 2, 50))
+        # Запрос должен уместиться в окно клиента целиком, вместе с местом под новую сводку
+        limit = (self.window.budget - estimate_tokens(instruction) - 2 * MESSAGE_OVERHEAD
+                 - estimate_tokens(SUMMARY_PROMPT.format(summary="(empty)", turns="")) - summary_tokens)
+
+        # Длинный хвост пересказываем по частям, сохраняя сводку после каждой
+        while position < target:
+            end, used = position, 0
+            while end < target:
+                cost = message_tokens(messages[end])
+                if end > position and used + cost > limit:
+                    break
+                used += cost
+                end += 1
+
+            updated = self._update(instruction, summary, messages[position:end], limit)
+            if updated is None:
+                return
+            if not self.store.set_chat_summary(chat_id, updated, end, expected=position):
+                # Чат переписали или удалили, пока модель думала
+                return
+            summary, position = updated, end
+
+    def _update(self, instruction: str, summary: str, turns: Sequence[Dict[str, Any]],
+                tokens: int) -> Optional[str]:
+        """Новая сводка от модели (None, если запрос прерван или завершился ошибкой)"""
+        lines = []
+        for message in turns:
+            role = "User" if message.get("role") == "user" else "Assistant"
+            lines.append(f"{role}: {message.get('content', '')}")
+        turns_text = truncate_to_tokens("\n".join(lines), tokens)
+
+        prompt = SUMMARY_PROMPT.format(summary=summary or "(empty)", turns=turns_text)
+        request: List[Dict[str, str]] = [{"role": "system", "content": instruction},
+                                         {"role": "user", "content": prompt}]
+
+        with self._cond:
+            if self._stopped:
+                return None
+            # Похожие куски разных бесед — не повод отдать чужую сводку из кэша
+            generation = self.client.generate_response(request, stream=True, model=self.model, cacheable=False)
+            self._generation = generation
+        try:
+            text = "".join(generation)
+        finally:
+            with self._cond:
+                self._generation = None
+
+        # Без времени ответа генерация прервана или вместо сводки пришел текст ошибки
+        if generation.timing is None or not text.strip():
+            return None
+        return truncate_to_tokens(text.strip(), self.window.summary_tokens)
@@ -0,0 +1,117 @@
+# core/writer.py
+"""
+Фоновая запись изменений на диск со склейкой по времени
+"""
+
+import threading
+import time
+from typing import Any, Callable, List, Optional
+
+class BackgroundWriter:
+    def __init__(self, write: Callable[[List[Any]], None],
+                 after_write: Optional[Callable[[], None]] = None,
+                 delay: float = 0.5):
+        """
+        Инициализация фонового писателя
+
+        Args:
+            write: Записывает пачку накопившихся изменений (вызывается в фоновом потоке)
+            after_write: Вызывается после каждой записанной пачки (например, сворачивание журнала)
+            delay: Окно склейки в секундах — изменения за это время пишутся одной пачкой
+        """
+        self._write = write
+        self._after_write = after_write
+        self.delay = delay
+
+        self._cond = threading.Condition()
+        self._pending: List[Any] = []
+        self._first_pending = 0.0
+        self._busy = False
+        self._flush_requested = False
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, item: Any):
+        """Добавить изменение в очередь записи (не блокирует вызывающий поток)"""
+        with self._cond:
+            if not self._pending:
+                self._first_pending = time.monotonic()
+            self._pending.append(item)
+            self._ensure_thread()
+            self._cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Дождаться записи всех изменений
+
+        Returns:
+            True, если все записано до истечения таймаута
+        """
+        if threading.current_thread() is self._thread:
+            # Из потока записи (after_write) ждать некого: пачка уже записана,
+            # а новые изменения ждали бы этот же поток
+            return not self._pending
+
+        with self._cond:
+            if not self._pending and not self._busy:
+                return True
+            self._flush_requested = True
+            self._ensure_thread()
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """Записать все изменения и остановить поток"""
+        flushed = self.flush(timeout)
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        return flushed
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name="memory-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopped:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+
+                # Ждем окно склейки, если только нас не торопят
+                deadline = self._first_pending + self.delay
+                while not self._flush_requested and not self._stopped:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                batch = self._pending
+                self._pending = []
+                self._busy = True
+
+            failed = False
+            try:
+                self._write(batch)
+                if self._after_write:
+                    self._after_write()
+            except Exception as e:
+                print(f"Ошибка фоновой записи: {e}")
+                failed = True
+
+            with self._cond:
+                if failed:
+                    # Возвращаем пачку в начало очереди и пробуем позже
+                    self._pending[:0] = batch
+                    self._first_pending = time.monotonic()
+                else:
+                    self._flush_requested = False
+                self._busy = False
+                self._cond.notify_all()
+
+            if failed:
+                time.sleep(self.delay)
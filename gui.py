@@ -1,16 +1,23 @@
 # gui.py (исправленная версия со всеми улучшениями)
-import json
 import threading
-import requests
 import os
-import datetime
 import uuid
 import customtkinter as ctk
 import tkinter as tk
 from tkinter import messagebox, filedialog
 from voice import speak, toggle_voice
 from markdown_parser import parse_markdown
-from memory import load_memory, save_memory
+from memory import (get_memory_store, add_chat, update_chat, clear_chats, set_setting, flush_memory, get_chat,
+                    get_recent_chats, record_latency, record_cache_lookup)
+from core.context import DEFAULT_BUDGET, ContextWindow
+from core.ollama_client import OllamaClient
+from core.response_cache import ResponseCache, is_time_sensitive
+from core.semantic_cache import NUMPY_AVAILABLE, EMBEDDING_MODEL, SIMILARITY_THRESHOLD, SemanticCache
+from core.summarizer import Summarizer
+from core.messages import MessageLog
+from utils.renderer import BatchedRenderer
+from utils.transcript import ChatTranscript
+from utils.sidebar import SidebarList
 
 # Глобальная проверка доступности библиотек для голосового ввода
 VOICE_RECOGNITION_AVAILABLE = False
@@ -44,9 +51,23 @@ if VOICE_RECOGNITION_AVAILABLE and SOUNDDEVICE_AVAILABLE and SCIPY_AVAILABLE:
 else:
     print("⚠️ Голосовой ввод недоступен (установите все зависимости)")
 
-OLLAMA_URL = "http://localhost:11434/api/chat"
+OLLAMA_BASE_URL = "http://localhost:11434"
 MODEL = "llama3"
 
+# Вывод ответа: "stream" — по мере генерации, "typewriter" — посимвольно после генерации
+RENDER_MODE = "stream"
+RENDER_FPS = 60
+TYPEWRITER_CPS = 100  # символов в секунду в режиме печатной машинки
+
+# Бюджет промпта в токенах: недавние реплики дословно, ранние — сводкой
+CONTEXT_TOKENS = DEFAULT_BUDGET
+SUMMARY_MODEL = None  # Модель для сводок ранней части чата (None — основная модель)
+
+# Готовые ответы на точно такие же запросы отдаются из кэша, а не генерируются заново
+RESPONSE_CACHE_FILE = "response_cache.jsonl"
+# Перефразированные вопросы узнаются по эмбеддингам (нужны numpy и эмбеддинг-модель в Ollama)
+SEMANTIC_CACHE_FILE = "semantic_cache.jsonl"
+
 # Цветовые схемы
 LIGHT_THEME = {
     "PRIMARY_COLOR": "#10a37f",
@@ -96,9 +117,34 @@ class JarvisApp(ctk.CTk):
         self.scipy_available = SCIPY_AVAILABLE
         self.voice_input_available = VOICE_INPUT_AVAILABLE
         
-        # Загружаем память
-        self.memory = load_memory()
+        # Общая память процесса (та же, что у менеджера истории, экспорта и импорта)
+        self.memory_store = get_memory_store()
+        self.memory = self.memory_store.data
+        self.history_refresh_pending = False
         self.current_theme = self.memory.get("settings", {}).get("theme", "light")
+        self.render_mode = self.memory.get("settings", {}).get("render_mode", RENDER_MODE)
+        
+        # Промпт собирается из истории чата в пределах бюджета токенов
+        context_tokens = self.memory.get("settings", {}).get("context_tokens", CONTEXT_TOKENS)
+        self.context = ContextWindow(context_tokens)
+        
+        # Клиент Ollama с общим пулом keep-alive соединений
+        settings = self.memory.get("settings", {})
+        cache = None
+        if settings.get("response_cache", True):
+            cache = ResponseCache(RESPONSE_CACHE_FILE)
+        semantic_cache = None
+        if settings.get("semantic_cache", True) and NUMPY_AVAILABLE:
+            semantic_cache = SemanticCache(SEMANTIC_CACHE_FILE,
+                                           model=settings.get("embedding_model", EMBEDDING_MODEL),
+                                           threshold=settings.get("semantic_threshold", SIMILARITY_THRESHOLD))
+        # Бюджет промпта соблюдает self.context — клиент историю повторно не обрезает
+        self.ollama = OllamaClient(OLLAMA_BASE_URL, model=MODEL, timeouts={"chat": (3.05, 30)},
+                                   num_ctx=self.context.num_ctx, cache=cache, semantic_cache=semantic_cache)
+        
+        # Реплики, выпавшие из окна, пересказываются в фоне — промпт не растет с чатом
+        summary_model = self.memory.get("settings", {}).get("summary_model", SUMMARY_MODEL)
+        self.summarizer = Summarizer(self.memory_store, self.ollama, self.context, model=summary_model)
         
         # Устанавливаем тему
         self.colors = LIGHT_THEME if self.current_theme == "light" else DARK_THEME
@@ -122,7 +168,7 @@ class JarvisApp(ctk.CTk):
         
         # Переменные
         self.think_mode = False
-        self.current_chat = []
+        self.current_chat = MessageLog()
         self.current_chat_id = None
         self.sidebar_visible = True
         self.chat_buttons = {}
@@ -130,6 +176,7 @@ class JarvisApp(ctk.CTk):
         self.is_streaming = False
         self.is_jarvis_speaking = False  # Флаг что Jarvis говорит
         self.thinking_animation_active = False  # Флаг анимации мышления
+        self.active_generations = {}  # Незавершенные ответы модели: Generation -> рендерер (или None)
         
         # Центрируем окно
         self.center_window()
@@ -137,8 +184,9 @@ class JarvisApp(ctk.CTk):
         # Создаем интерфейс
         self.create_widgets()
         
-        # Загружаем историю
+        # Загружаем историю и обновляем ее при любых изменениях памяти
         self.load_chat_history()
+        self.unsubscribe_memory = self.memory_store.subscribe(self.on_memory_changed)
         
         # Настраиваем закрытие
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
@@ -219,6 +267,15 @@ class JarvisApp(ctk.CTk):
         self.chat_list_scroll.pack(fill="both", expand=True)
         self.chat_list_scroll._parent_canvas.configure(highlightthickness=0)
         
+        # Строки списка обновляются по разнице, а не пересоздаются
+        self.chat_list = SidebarList(
+            self.chat_list_scroll,
+            create_row=self.create_chat_row,
+            update_row=self.update_chat_row,
+            signature=lambda chat_data: chat_data.get("title", "Беседа"),
+            create_empty=self.create_empty_history_label
+        )
+        
         # Нижняя часть сайдбара
         bottom_frame = ctk.CTkFrame(self.sidebar, fg_color="transparent")
         bottom_frame.pack(side="bottom", fill="x", padx=12, pady=16)
@@ -329,22 +386,14 @@ class JarvisApp(ctk.CTk):
         self.upload_btn.pack(side="left", padx=5)
         
         # ================= CHAT CONTAINER =================
-        # Сразу создаем scrollable frame для чата
-        self.chat_scroll = ctk.CTkScrollableFrame(
+        # Лента сообщений: виджеты создаются только для видимой области
+        self.transcript = ChatTranscript(
             self.main_frame,
-            fg_color=self.colors["CHAT_BG"],
+            self.colors,
             scrollbar_button_color="#c1c1c1" if self.current_theme == "light" else "#4b5563",
             scrollbar_button_hover_color="#a1a1a1" if self.current_theme == "light" else "#374151"
         )
-        self.chat_scroll.pack(fill="both", expand=True, padx=20, pady=(10, 0))
-        self.chat_scroll._parent_canvas.configure(highlightthickness=0)
-        
-        # Контейнер для сообщений внутри скролла
-        self.chat_container = ctk.CTkFrame(
-            self.chat_scroll,
-            fg_color=self.colors["CHAT_BG"]
-        )
-        self.chat_container.pack(fill="both", expand=True)
+        self.transcript.pack(fill="both", expand=True, padx=20, pady=(10, 0))
         
         # Приветственное сообщение
         self.show_welcome_message()
@@ -543,8 +592,10 @@ class JarvisApp(ctk.CTk):
         )
     
     def stop_jarvis_speech(self):
-        """Остановить речь Jarvis"""
+        """Остановить речь Jarvis и генерацию ответа (уже выведенная часть остается в чате)"""
         from voice import stop_speech
+        for generation in self.active_generations:
+            generation.cancel()
         stop_speech()
         self.is_jarvis_speaking = False
         self.stop_speech_btn.configure(state="disabled")
@@ -719,10 +770,7 @@ class JarvisApp(ctk.CTk):
             self.colors = LIGHT_THEME
         
         # Сохраняем тему
-        if "settings" not in self.memory:
-            self.memory["settings"] = {}
-        self.memory["settings"]["theme"] = self.current_theme
-        save_memory(self.memory)
+        set_setting(self.memory, "theme", self.current_theme)
         
         # Обновляем кнопку темы
         self.theme_btn.configure(
@@ -741,7 +789,7 @@ class JarvisApp(ctk.CTk):
         current_chat_data = {
             "id": self.current_chat_id,
             "title": self.chat_title.cget("text"),
-            "messages": self.current_chat.copy(),
+            "messages": self.current_chat.snapshot(),
             "think_mode": self.think_mode
         } if self.current_chat else None
         
@@ -776,18 +824,17 @@ class JarvisApp(ctk.CTk):
         """Показать приветственное сообщение"""
         try:
             welcome_frame = ctk.CTkFrame(
-                self.chat_container,
-                fg_color="transparent",
+                self.transcript.canvas,
+                fg_color=self.colors["CHAT_BG"],
                 height=200
             )
-            welcome_frame.pack(fill="x", pady=(50, 0))
             
             ctk.CTkLabel(
                 welcome_frame,
                 text="👋 Hello! I`m Jarvis",
                 font=("Segoe UI", 28, "bold"),
                 text_color=self.colors["TEXT_PRIMARY"]
-            ).pack(pady=(0, 10))
+            ).pack(pady=(50, 10))
             
             ctk.CTkLabel(
                 welcome_frame,
@@ -811,189 +858,30 @@ class JarvisApp(ctk.CTk):
                     text_color=self.colors["TEXT_SECONDARY"]
                 ).pack(pady=(10, 0))
             
-            # Прокручиваем к началу
-            self.update_scroll_position()
+            # Приветствие исчезает с первым сообщением
+            self.transcript.set_placeholder(welcome_frame)
             
         except tk.TclError:
             pass
     
     def add_user_message(self, text):
         """Добавить сообщение пользователя (справа)"""
-        try:
-            # Удаляем приветственное сообщение
-            for widget in self.chat_container.winfo_children():
-                try:
-                    if widget.winfo_class() == "CTkFrame" and len(widget.winfo_children()) > 0:
-                        first_child = widget.winfo_children()[0]
-                        if first_child.winfo_class() == "CTkLabel":
-                            child_text = first_child.cget("text")
-                            if "👋 Привет! Я Jarvis" in child_text:
-                                widget.destroy()
-                                break
-                except:
-                    continue
-            
-            # Создаем контейнер для сообщения
-            message_frame = ctk.CTkFrame(
-                self.chat_container,
-                fg_color="transparent"
-            )
-            message_frame.pack(fill="x", pady=(10, 5), padx=20)
-            
-            # Контейнер для выравнивания (справа)
-            align_frame = ctk.CTkFrame(message_frame, fg_color="transparent")
-            align_frame.pack(side="right", anchor="e")
-            
-            # Аватар пользователя
-            avatar_frame = ctk.CTkFrame(align_frame, fg_color="transparent", width=40)
-            avatar_frame.pack(side="right", padx=(10, 0))
-            
-            ctk.CTkLabel(
-                avatar_frame,
-                text="👤",
-                font=("Segoe UI", 20),
-                text_color=self.colors["TEXT_PRIMARY"],
-                width=30,
-                height=30
-            ).pack()
-            
-            # Фрейм сообщения пользователя (правая сторона, синий цвет)
-            text_frame = ctk.CTkFrame(
-                align_frame, 
-                fg_color=self.colors["USER_BUBBLE"],  # синий цвет для пользователя
-                corner_radius=12,
-                border_width=0
-            )
-            text_frame.pack(side="right")
-            
-            # Текст сообщения
-            text_label = ctk.CTkLabel(
-                text_frame,
-                text=text,
-                wraplength=500,
-                justify="left",
-                font=("Segoe UI", 13),
-                text_color=self.colors["USER_TEXT"],  # белый текст на синем фоне
-                padx=16,
-                pady=12
-            )
-            text_label.pack(anchor="w")
-            
-            # Прокручиваем к новому сообщению
-            self.update_scroll_position()
-            
-        except tk.TclError:
-            pass
+        return self.transcript.add_message("user", text)
     
-    def add_ai_message(self, text=""):
+    def add_ai_message(self, text="", live=False):
         """Добавить сообщение AI (слева)"""
-        try:
-            # Создаем контейнер для сообщения
-            message_frame = ctk.CTkFrame(
-                self.chat_container,
-                fg_color="transparent"
-            )
-            message_frame.pack(fill="x", pady=(5, 10), padx=20)
-            
-            # Контейнер для выравнивания (слева)
-            align_frame = ctk.CTkFrame(message_frame, fg_color="transparent")
-            align_frame.pack(side="left", anchor="w")
-            
-            # Аватар Jarvis
-            avatar_frame = ctk.CTkFrame(align_frame, fg_color="transparent", width=40)
-            avatar_frame.pack(side="left", padx=(0, 10))
-            
-            ctk.CTkLabel(
-                avatar_frame,
-                text="🤖",
-                font=("Segoe UI", 20),
-                text_color=self.colors["TEXT_PRIMARY"],
-                width=30,
-                height=30
-            ).pack()
-            
-            # Фрейм сообщения AI (левая сторона)
-            text_frame = ctk.CTkFrame(
-                align_frame, 
-                fg_color=self.colors["AI_BUBBLE"],
-                corner_radius=12,
-                border_width=0
-            )
-            text_frame.pack(side="left")
-            
-            # Текст сообщения
-            text_label = ctk.CTkLabel(
-                text_frame,
-                text=text,
-                wraplength=500,
-                justify="left",
-                font=("Segoe UI", 13),
-                text_color=self.colors["AI_TEXT"],
-                padx=16,
-                pady=12
-            )
-            text_label.pack(anchor="w")
-            
-            # Прокручиваем к новому сообщению
-            self.update_scroll_position()
-            
-            return text_label
-            
-        except tk.TclError:
-            return None
+        return self.transcript.add_message("assistant", text, live=live)
     
     def show_thinking_animation(self):
         """Показать анимацию мышления"""
         self.thinking_animation_active = True
         
-        # Создаем контейнер для сообщения
-        message_frame = ctk.CTkFrame(
-            self.chat_container,
-            fg_color="transparent"
-        )
-        message_frame.pack(fill="x", pady=(5, 10), padx=20)
-        
-        # Контейнер для выравнивания (слева)
-        align_frame = ctk.CTkFrame(message_frame, fg_color="transparent")
-        align_frame.pack(side="left", anchor="w")
-        
-        # Аватар Jarvis
-        avatar_frame = ctk.CTkFrame(align_frame, fg_color="transparent", width=40)
-        avatar_frame.pack(side="left", padx=(0, 10))
-        
-        ctk.CTkLabel(
-            avatar_frame,
-            text="🤖",
-            font=("Segoe UI", 20),
-            text_color=self.colors["TEXT_PRIMARY"],
-            width=30,
-            height=30
-        ).pack()
-        
-        # Фрейм сообщения AI (левая сторона)
-        text_frame = ctk.CTkFrame(
-            align_frame, 
-            fg_color=self.colors["AI_BUBBLE"],
-            corner_radius=12,
-            border_width=0
-        )
-        text_frame.pack(side="left")
-        
         # Индикатор мышления
-        thinking_label = ctk.CTkLabel(
-            text_frame,
-            text="Думаю",
-            wraplength=500,
-            justify="left",
-            font=("Segoe UI", 13, "italic"),
-            text_color=self.colors["AI_TEXT"],
-            padx=16,
-            pady=12
-        )
-        thinking_label.pack(anchor="w")
+        thinking_label = self.transcript.add_message("thinking", "Думаю", live=True)
         
         # Запускаем анимацию
-        self.animate_thinking(thinking_label)
+        if thinking_label:
+            self.animate_thinking(thinking_label)
         
         return thinking_label
     
@@ -1010,52 +898,12 @@ class JarvisApp(ctk.CTk):
     
     def update_scroll_position(self):
         """Обновить позицию прокрутки"""
-        try:
-            # Ждем обновления виджетов
-            self.update_idletasks()
-            
-            # Прокручиваем вниз
-            self.chat_scroll._parent_canvas.yview_moveto(1.0)
-            
-            # Обновляем видимость скроллбара
-            self.update_scrollbar_visibility()
-            
-        except:
-            pass
-    
-    def update_scrollbar_visibility(self):
-        """Обновить видимость скроллбара"""
-        try:
-            # Получаем размеры
-            canvas = self.chat_scroll._parent_canvas
-            scrollable_height = self.chat_container.winfo_height()
-            visible_height = self.chat_scroll.winfo_height()
-            
-            # Если контент помещается в видимую область, скрываем скроллбар
-            if scrollable_height <= visible_height:
-                canvas.configure(yscrollcommand=None)
-            else:
-                # Показываем скроллбар
-                scrollbar = self.chat_scroll._parent_canvas._scrollbar_y
-                if scrollbar:
-                    canvas.configure(yscrollcommand=scrollbar.set)
-                    
-        except:
-            pass
+        self.transcript.scroll_to_bottom()
     
     def show_chat_messages(self, messages):
         """Показать сообщения из истории"""
-        for msg in messages:
-            try:
-                if msg["role"] == "user":
-                    self.add_user_message(msg["content"])
-                elif msg["role"] == "assistant":
-                    self.add_ai_message(msg["content"])
-            except:
-                continue
-        
-        # Прокручиваем к последнему сообщению
-        self.update_scroll_position()
+        # Лента хранит модель всех сообщений и создает виджеты только для видимых
+        self.transcript.set_messages(messages)
     
     def send_message(self):
         """Отправить сообщение"""
@@ -1076,67 +924,176 @@ class JarvisApp(ctk.CTk):
                 thinking_label = self.show_thinking_animation()
             
             # Показываем индикатор загрузки (слева)
-            ai_label = self.add_ai_message("▌")
+            ai_label = self.add_ai_message("▌", live=True)
+            if not ai_label:
+                return
+            
+            # Модель видит беседу целиком: недавние реплики дословно, ранние — сводкой
+            chat = self.memory.get("chats", {}).get(self.current_chat_id) or {}
+            messages = self.context.build(self.current_chat, self.system_prompt(), pinned=self.pinned_facts(),
+                                          summary=chat.get("summary"), summarized=chat.get("summarized", 0))
+            
+            # Запрос уйдет из фонового потока, а прервать его можно отсюда:
+            # кнопкой остановки, новым чатом или переходом в другой чат
+            # Ответ на вопрос о текущем моменте (время, погода, новости) быстро устаревает
+            generation = self.ollama.generate_response(messages, think_mode=self.think_mode,
+                                                       cacheable=not is_time_sensitive(text))
+            
+            renderer = None
+            if self.render_mode != "typewriter":
+                # Потоковый режим: части ответа копятся в буфере рендерера,
+                # а главный поток выводит их раз в кадр
+                renderer = BatchedRenderer(
+                    self, ai_label,
+                    fps=RENDER_FPS,
+                    on_frame=lambda: self.on_render_frame(thinking_label),
+                    on_done=lambda reply: self.on_stream_done(ai_label, reply, generation),
+                    transform=parse_markdown
+                )
+                renderer.start()
+            
+            self.active_generations[generation] = renderer
+            self.stop_speech_btn.configure(state="normal")
             
             # Отправляем запрос
             threading.Thread(
                 target=self.get_ai_response,
-                args=(text, ai_label, thinking_label),
+                args=(generation, renderer, ai_label, thinking_label),
                 daemon=True
             ).start()
             
         except Exception as e:
             print(f"Ошибка отправки сообщения: {e}")
     
-    def get_ai_response(self, text, ai_label, thinking_label):
-        """Получить ответ от AI"""
-        system_prompt = f"You are Jarvis — smart, charismatic. Style: short, clear.\nThink: {self.think_mode}"
-        
-        payload = {
-            "model": MODEL,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": text}
-            ],
-            "stream": True
-        }
+    def system_prompt(self):
+        """Системный промпт текущего чата"""
+        return f"You are Jarvis — smart, charismatic. Style: short, clear.\nThink: {self.think_mode}"
+    
+    def pinned_facts(self):
+        """Факты, которые модель должна помнить в любом чате (предпочтения пользователя)"""
+        preferences = self.memory.get("user_preferences", {})
+        return [f"{key}: {value}" for key, value in preferences.items()]
+    
+    def get_ai_response(self, generation, renderer, ai_label, thinking_label):
+        """Получить ответ от AI (в фоновом потоке)"""
+        if renderer is None:
+            # Старый режим: ждем весь ответ, затем печатаем посимвольно
+            full_reply = parse_markdown("".join(generation))
+            try:
+                self.after(0, self.show_typewriter_reply, generation, ai_label, thinking_label, full_reply)
+            except:
+                pass
+            return
         
-        full_reply = ""
+        # Ошибки соединения клиент возвращает текстом ответа; после отмены
+        # итерация просто заканчивается
+        for chunk in generation:
+            renderer.feed(chunk)
         
+        renderer.finish()
+    
+    def cancel_generations(self):
+        """Прервать все ответы и отбросить их незавершенный вывод (смена чата, закрытие окна)"""
+        for generation, renderer in self.active_generations.items():
+            generation.cancel()
+            if renderer is not None:
+                renderer.cancel()
+        self.active_generations.clear()
+        self.hide_thinking_animation()
+    
+    def record_response_timing(self, generation):
+        """Записать в статистику время ответа модели и попадание в кэш (ошибки и прерванные ответы не учитываются)"""
+        timing = generation.timing
+        if not timing:
+            return
+        if generation.cacheable:
+            record_cache_lookup(self.memory, generation.cached)
+        if not generation.cached:
+            record_latency(self.memory, self.ollama.model, timing["first_token"], timing["total"])
+    
+    def on_render_frame(self, thinking_label):
+        """Обновление после кадра рендерера: убрать анимацию мышления и прокрутить"""
+        if self.thinking_animation_active:
+            self.hide_thinking_label(thinking_label)
+        self.update_scroll_position()
+    
+    def on_stream_done(self, ai_label, reply, generation):
+        """Завершение потокового вывода"""
+        if self.active_generations.pop(generation, None) is None:
+            return
         try:
-            with requests.post(OLLAMA_URL, json=payload, stream=True, timeout=30) as r:
-                r.raise_for_status()
-                for line in r.iter_lines():
-                    if line:
-                        try:
-                            data = json.loads(line.decode())
-                            if "message" in data and "content" in data["message"]:
-                                full_reply += data["message"]["content"]
-                        except:
-                            continue
-                            
-        except requests.exceptions.ConnectionError:
-            full_reply = "❌ Ошибка подключения к Ollama\nУбедитесь, что Ollama запущен: `ollama serve`"
-        except requests.exceptions.Timeout:
-            full_reply = "⏱️ Время ожидания истекло\nПопробуйте еще раз"
-        except Exception as e:
-            full_reply = f"⚠️ Ошибка: {str(e)}"
+            if generation.cancelled:
+                # Остановлено кнопкой: выведенная часть остается ответом, но не озвучивается
+                if reply.strip():
+                    self.finish_response(reply, ai_label, speak_reply=False)
+                else:
+                    self.transcript.remove(ai_label)
+                return
+            
+            self.record_response_timing(generation)
+            self.is_jarvis_speaking = True
+            self.stop_speech_btn.configure(state="normal")  # Включаем кнопку остановки
+            self.finish_response(reply, ai_label)
+        except tk.TclError:
+            pass
+    
+    def show_typewriter_reply(self, generation, ai_label, thinking_label, reply):
+        """Ответ получен целиком (режим печатной машинки) — выводим, если его еще ждут"""
+        if generation not in self.active_generations:
+            return
+        self.hide_thinking_label(thinking_label)
         
-        full_reply = parse_markdown(full_reply)
+        if generation.cancelled:
+            # Остановлено кнопкой до вывода — показывать нечего
+            del self.active_generations[generation]
+            try:
+                self.transcript.remove(ai_label)
+            except tk.TclError:
+                pass
+            return
         
-        # Скрываем анимацию мышления
+        self.record_response_timing(generation)
+        self.animate_response(ai_label, reply, generation)
+    
+    def hide_thinking_label(self, thinking_label):
+        """Скрыть анимацию мышления и удалить ее фрейм"""
         self.hide_thinking_animation()
-        if thinking_label and thinking_label.winfo_exists():
-            thinking_label.master.master.destroy()  # Удаляем фрейм с анимацией
-        
-        # Анимируем вывод
+        try:
+            if thinking_label:
+                self.transcript.remove(thinking_label)  # Удаляем пузырь с анимацией
+        except tk.TclError:
+            pass
+    
+    def finish_response(self, text, ai_label=None, speak_reply=True):
+        """Сохранить готовый ответ, озвучить и записать чат"""
+        # Фиксируем текст в модели ленты, чтобы пузырь можно было переиспользовать
         if ai_label:
-            try:
-                self.after(0, self.animate_response, ai_label, full_reply)
-            except:
-                pass
+            self.transcript.finalize(ai_label, text)
+        
+        # Сохраняем ответ
+        self.current_chat.append({"role": "assistant", "content": text})
+        
+        # Озвучиваем если включено
+        if self.voice_enabled and speak_reply:
+            # Запускаем речь в отдельном потоке
+            def speak_thread():
+                speak(text)
+                self.after(0, lambda: self.stop_speech_btn.configure(state="disabled"))
+                self.is_jarvis_speaking = False
+            
+            threading.Thread(target=speak_thread, daemon=True).start()
+        else:
+            self.stop_speech_btn.configure(state="disabled")
+            self.is_jarvis_speaking = False
+        
+        # Сохраняем чат
+        self.save_chat()
+        
+        # Если ранние реплики выпали из окна, обновим их сводку к следующему вопросу
+        if self.current_chat_id:
+            self.summarizer.schedule(self.current_chat_id, self.system_prompt(), self.pinned_facts())
     
-    def animate_response(self, ai_label, text):
+    def animate_response(self, ai_label, text, generation=None):
         """Анимировать вывод ответа"""
         try:
             if not ai_label or not ai_label.winfo_exists():
@@ -1146,37 +1103,23 @@ class JarvisApp(ctk.CTk):
             self.is_jarvis_speaking = True
             self.stop_speech_btn.configure(state="normal")  # Включаем кнопку остановки
             
-            def type_writer(idx=0):
-                try:
-                    if idx < len(text) and ai_label.winfo_exists():
-                        current = ai_label.cget("text")
-                        ai_label.configure(text=current + text[idx])
-                        self.after(10, type_writer, idx + 1)
-                        # Прокручиваем если есть скролл
-                        self.update_scroll_position()
-                    else:
-                        # Сохраняем ответ
-                        self.current_chat.append({"role": "assistant", "content": text})
-                        
-                        # Озвучиваем если включено
-                        if self.voice_enabled:
-                            # Запускаем речь в отдельном потоке
-                            def speak_thread():
-                                speak(text)
-                                self.after(0, lambda: self.stop_speech_btn.configure(state="disabled"))
-                                self.is_jarvis_speaking = False
-                            
-                            threading.Thread(target=speak_thread, daemon=True).start()
-                        else:
-                            self.stop_speech_btn.configure(state="disabled")
-                            self.is_jarvis_speaking = False
-                        
-                        # Сохраняем чат
-                        self.save_chat()
-                except:
-                    pass
+            # Печатаем пакетами раз в кадр, а не по символу
+            def on_done(reply):
+                if generation is not None and self.active_generations.pop(generation, None) is None:
+                    return  # Чат сменили, пока ответ печатался
+                self.finish_response(reply, ai_label)
             
-            type_writer()
+            renderer = BatchedRenderer(
+                self, ai_label,
+                fps=RENDER_FPS,
+                on_frame=self.update_scroll_position,
+                on_done=on_done,
+                cursor=""
+            )
+            if generation is not None:
+                # Смена чата прервет и печать
+                self.active_generations[generation] = renderer
+            renderer.typewrite(text, chars_per_second=TYPEWRITER_CPS)
             
         except tk.TclError:
             pass
@@ -1185,48 +1128,60 @@ class JarvisApp(ctk.CTk):
     
     def load_chat_history(self):
         """Загрузить историю чатов"""
+        # Показываем последние 10 чатов
+        recent_chats = get_recent_chats(self.memory, 10)
+        self.chat_list.update(list(recent_chats.items()))
+    
+    def on_memory_changed(self, event):
+        """Память изменилась (возможно, не в главном потоке) — обновим сайдбар в следующем кадре"""
+        if event.get("op") in ("set_setting", "add_counters", "upgrade_chat") or self.history_refresh_pending:
+            return
+        self.history_refresh_pending = True
         try:
-            for widget in self.chat_list_scroll.winfo_children():
-                widget.destroy()
-            
-            chats = self.memory.get("chats", {})
-            
-            if not chats:
-                ctk.CTkLabel(
-                    self.chat_list_scroll,
-                    text="Нет сохраненных чатов",
-                    font=("Segoe UI", 11),
-                    text_color=self.colors["TEXT_SECONDARY"]
-                ).pack(pady=20)
-                return
-            
-            # Показываем последние 10 чатов
-            sorted_chats = sorted(
-                chats.items(),
-                key=lambda x: x[1].get("timestamp", ""),
-                reverse=True
-            )[:10]
-            
-            for chat_id, chat_data in sorted_chats:
-                title = chat_data.get("title", "Беседа")
-                
-                btn = ctk.CTkButton(
-                    self.chat_list_scroll,
-                    text=f"💬 {title[:25]}{'...' if len(title) > 25 else ''}",
-                    width=200,
-                    height=36,
-                    fg_color="transparent",
-                    hover_color="#e5e5e5" if self.current_theme == "light" else "#374151",
-                    text_color=self.colors["TEXT_PRIMARY"],
-                    font=("Segoe UI", 11),
-                    anchor="w",
-                    corner_radius=6,
-                    command=lambda cid=chat_id: self.load_chat(cid)
-                )
-                btn.pack(fill="x", pady=2)
-                
-        except tk.TclError:
-            pass
+            self.after(0, self.refresh_chat_history)
+        except (tk.TclError, RuntimeError):
+            self.history_refresh_pending = False
+    
+    def refresh_chat_history(self):
+        """Отложенное обновление сайдбара (несколько изменений — одно обновление)"""
+        self.history_refresh_pending = False
+        self.load_chat_history()
+    
+    def create_chat_row(self, parent, chat_id, chat_data):
+        """Создать кнопку чата в сайдбаре"""
+        return ctk.CTkButton(
+            parent,
+            text=self.format_chat_row_title(chat_data),
+            width=200,
+            height=36,
+            fg_color="transparent",
+            hover_color="#e5e5e5" if self.current_theme == "light" else "#374151",
+            text_color=self.colors["TEXT_PRIMARY"],
+            font=("Segoe UI", 11),
+            anchor="w",
+            corner_radius=6,
+            command=lambda cid=chat_id: self.load_chat(cid)
+        )
+    
+    def update_chat_row(self, btn, chat_id, chat_data):
+        """Обновить надпись кнопки чата"""
+        btn.configure(text=self.format_chat_row_title(chat_data))
+    
+    def format_chat_row_title(self, chat_data):
+        """Текст кнопки чата"""
+        title = chat_data.get("title", "Беседа")
+        return f"💬 {title[:25]}{'...' if len(title) > 25 else ''}"
+    
+    def create_empty_history_label(self, parent):
+        """Заглушка для пустой истории"""
+        label = ctk.CTkLabel(
+            parent,
+            text="Нет сохраненных чатов",
+            font=("Segoe UI", 11),
+            text_color=self.colors["TEXT_SECONDARY"]
+        )
+        label.pack(pady=20)
+        return label
     
     def save_chat(self):
         """Сохранить текущий чат"""
@@ -1241,21 +1196,13 @@ class JarvisApp(ctk.CTk):
             first_msg = next((msg["content"] for msg in self.current_chat if msg["role"] == "user"), "Беседа")
             title = first_msg[:40] + "..." if len(first_msg) > 40 else first_msg
             
-            # Сохраняем
-            if "chats" not in self.memory:
-                self.memory["chats"] = {}
-                
-            self.memory["chats"][self.current_chat_id] = {
-                "id": self.current_chat_id,
-                "title": title,
-                "timestamp": datetime.datetime.now().isoformat(),
-                "messages": self.current_chat.copy(),
-                "think_mode": self.think_mode
-            }
-            
-            save_memory(self.memory)
+            # Сохраняем (в журнал пишутся только новые сообщения)
+            if self.current_chat_id in self.memory.get("chats", {}):
+                update_chat(self.memory, self.current_chat_id, messages=self.current_chat,
+                            title=title, think_mode=self.think_mode)
+            else:
+                add_chat(self.memory, self.current_chat_id, title, self.current_chat, self.think_mode)
             self.chat_title.configure(text=title)
-            self.load_chat_history()
             
         except Exception as e:
             print(f"Ошибка сохранения чата: {e}")
@@ -1263,14 +1210,17 @@ class JarvisApp(ctk.CTk):
     def load_chat(self, chat_id):
         """Загрузить чат"""
         try:
-            if chat_id not in self.memory.get("chats", {}):
+            # Сообщения подгружаются с диска только сейчас (архивный чат возвращается в память)
+            chat_data = get_chat(self.memory, chat_id)
+            if chat_data is None:
                 return
             
-            chat_data = self.memory["chats"][chat_id]
+            # Незаконченный ответ относится к прежнему чату — прерываем его
+            self.cancel_generations()
             
             # Устанавливаем текущий чат
             self.current_chat_id = chat_id
-            self.current_chat = chat_data.get("messages", [])
+            self.current_chat = MessageLog(chat_data.get("messages", []))
             self.think_mode = chat_data.get("think_mode", False)
             
             # Обновляем UI
@@ -1281,13 +1231,6 @@ class JarvisApp(ctk.CTk):
                 text_color="white" if self.think_mode else self.colors["TEXT_SECONDARY"]
             )
             
-            # Очищаем контейнер чата
-            for widget in self.chat_container.winfo_children():
-                try:
-                    widget.destroy()
-                except:
-                    pass
-            
             # Показываем сообщения
             self.show_chat_messages(self.current_chat)
             
@@ -1297,12 +1240,15 @@ class JarvisApp(ctk.CTk):
     def new_chat(self):
         """Новая беседа"""
         try:
+            # Незаконченный ответ относится к старому чату — прерываем его
+            self.cancel_generations()
+            
             # Сохраняем текущий чат
             if self.current_chat:
                 self.save_chat()
             
             # Сбрасываем
-            self.current_chat = []
+            self.current_chat = MessageLog()
             self.current_chat_id = None
             self.think_mode = False
             
@@ -1314,12 +1260,8 @@ class JarvisApp(ctk.CTk):
                 text_color=self.colors["TEXT_SECONDARY"]
             )
             
-            # Очищаем контейнер чата
-            for widget in self.chat_container.winfo_children():
-                try:
-                    widget.destroy()
-                except:
-                    pass
+            # Очищаем ленту чата
+            self.transcript.clear()
             
             self.show_welcome_message()
             
@@ -1333,9 +1275,11 @@ class JarvisApp(ctk.CTk):
                 return
             
             if messagebox.askyesno("Очистка истории", "Удалить всю историю чатов?"):
-                self.memory["chats"] = {}
-                save_memory(self.memory)
-                self.load_chat_history()
+                clear_chats(self.memory)
+                # В кэше лежат ответы из удаленных бесед
+                for cache in (self.ollama.cache, self.ollama.semantic_cache):
+                    if cache is not None:
+                        cache.clear()
                 self.new_chat()
                 
         except Exception as e:
@@ -1345,8 +1289,17 @@ class JarvisApp(ctk.CTk):
         """Обработка закрытия"""
         print("Закрытие приложения...")
         try:
+            self.cancel_generations()
             if self.current_chat:
                 self.save_chat()
+            self.summarizer.stop(timeout=2)
+            self.unsubscribe_memory()
+            # Дожидаемся фоновой записи истории на диск
+            flush_memory(timeout=5)
+            stats = self.ollama.cache_stats()
+            if stats:
+                print(f"Кэш ответов за сеанс: {stats}")
+            self.ollama.close()
             self.quit()
             self.destroy()
         except:
@@ -1,136 +1,442 @@
 # memory.py
+import atexit
+import copy
 import json
 import os
 import datetime
+import threading
+import time
+from collections import OrderedDict
+from core.storage import JsonStorage, SqliteStorage
+from core.search_index import SearchIndex
+from core.recency_index import RecencyIndex
+from core.archive import ArchiveReader, ArchiveWriter, NotAnArchive
+from core.cold_store import ColdStore
+from core.messages import MessageLog
+from core.migrations import CHAT_VERSION, DOCUMENT_VERSION, needs_upgrade, upgrade_chat, upgrade_document
+from core.statistics import (apply_statistics, cache_summary, count_totals, empty_statistics,
+                             latency_summary, message_count)
+from core.writer import BackgroundWriter
 
 MEMORY_FILE = "memory.json"
+JOURNAL_FILE = "memory.journal"  # Журнал изменений после последнего снимка
+JOURNAL_COMPACT_RECORDS = 200  # После стольких записей журнал сворачивается в снимок
+DB_FILE = "memory.db"
+INDEX_FILE = "memory.index"  # Поисковый индекс между запусками
+CHATS_DIR = "memory_chats"  # Сообщения чатов, по файлу на чат
+ARCHIVE_DIR = "memory_archive"  # Чаты сверх max_history: сжатые, по файлу на чат
+ARCHIVE_MAX_CHATS = 50_000  # Сколько чатов хранить в архиве
+IMPORT_FLUSH_EVERY = 50  # При импорте ждем записи на диск каждые N чатов, чтобы очередь не росла
+MAX_LOADED_CHATS = 8  # Сколько чатов держим в RAM с сообщениями (остальные — только метаданные)
+WRITE_DELAY = 0.5  # Окно склейки изменений перед записью на диск (сек)
+MIGRATE_BATCH = 50  # Фоновая миграция поднимает чаты пачками по столько
+MIGRATE_PAUSE = 0.05  # Пауза между пачками, чтобы не мешать UI (сек)
+
+# Хранилище: "json" (снимок + журнал) или "sqlite"
+STORAGE_BACKEND = os.environ.get("JARVIS_STORAGE", "json")
+
+_storage = None
+_search_index = None
+_recency_index = None
+_cold_store = None
+_writer = None
+_store = None
+_migration_thread = None
+_last_memory = None  # Память, которую писатель свернет в снимок при необходимости
+_loaded_chats = OrderedDict()  # Чаты с сообщениями в RAM, от давно открытых к недавним
+_counters = []  # Счетчики ответов (время, кэш), которые уйдут на диск с ближайшим изменением
+
+# Все изменения памяти в RAM идут под этой блокировкой
+_lock = threading.RLock()
+
+def get_storage():
+    """Получаем хранилище памяти (создается один раз на процесс)"""
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND == "sqlite":
+            _storage = SqliteStorage(DB_FILE, lock=_lock, on_reload=_on_external_change)
+        else:
+            _storage = JsonStorage(MEMORY_FILE, JOURNAL_FILE, JOURNAL_COMPACT_RECORDS, lock=_lock,
+                                   chats_dir=CHATS_DIR, on_reload=_on_external_change)
+    return _storage
+
+def get_search_index():
+    """Получаем поисковый индекс (загружается из файла один раз на процесс)"""
+    global _search_index
+    if _search_index is None:
+        _search_index = SearchIndex(INDEX_FILE, lock=_lock, loader=_read_messages)
+        _search_index.load()
+    return _search_index
+
+def get_recency_index():
+    """Получаем индекс чатов по времени активности (строится в RAM при загрузке)"""
+    global _recency_index
+    if _recency_index is None:
+        _recency_index = RecencyIndex()
+    return _recency_index
+
+def get_cold_store():
+    """Получаем архив старых чатов (читается с диска только при первом обращении)"""
+    global _cold_store
+    if _cold_store is None:
+        _cold_store = ColdStore(ARCHIVE_DIR, max_chats=ARCHIVE_MAX_CHATS)
+    return _cold_store
+
+def get_writer():
+    """Получаем фоновый писатель (изменения пишутся на диск вне UI-потока)"""
+    global _writer
+    if _writer is None:
+        _writer = BackgroundWriter(get_storage().write, _after_write, delay=WRITE_DELAY)
+    return _writer
+
+def flush_memory(timeout=None):
+    """Дождаться записи всех изменений на диск (вызывать при выходе)"""
+    if _writer is None:
+        return True
+    return _writer.flush(timeout)
+
+atexit.register(flush_memory, 5)
+
+def _save_archive_index():
+    """Дописываем отложенные изменения индекса архива (при выходе)"""
+    if _cold_store is not None:
+        _cold_store.save_index(force=True)
+
+atexit.register(_save_archive_index)
+
+def _default_memory():
+    """Структура памяти по умолчанию"""
+    return {
+        "schema_version": DOCUMENT_VERSION,
+        "chats": {},  # История чатов
+        "settings": {
+            "voice_enabled": True,
+            "think_mode": False,
+            "theme": "light",
+            "auto_save": True,
+            "max_history": 50,
+            "background_migration": True  # Поднимать схему старых чатов фоном, а не только при открытии
+        },
+        "user_preferences": {},
+        "statistics": empty_statistics()  # Счетчики обновляются с каждым изменением
+    }
 
 def load_memory():
-    """Загружаем память из файла"""
-    if not os.path.exists(MEMORY_FILE):
-        # Создаем структуру по умолчанию
-        default_memory = {
-            "chats": {},  # История чатов
-            "settings": {
-                "voice_enabled": True,
-                "think_mode": False,
-                "theme": "light",
-                "auto_save": True,
-                "max_history": 50
-            },
-            "user_preferences": {},
-            "statistics": {
-                "total_chats": 0,
-                "total_messages": 0,
-                "last_active": None
-            }
-        }
-        save_memory(default_memory)
-        return default_memory
+    """Загружаем память из хранилища"""
+    storage = get_storage()
+    
+    # Читаем с диска только после записи отложенных изменений
+    flush_memory()
     
     try:
-        with open(MEMORY_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            
-            # Миграция старых форматов
-            if "history" in data and "chats" not in data:
-                # Конвертируем старый формат в новый
-                data["chats"] = {}
-                for i, chat in enumerate(data.get("history", [])):
-                    chat_id = f"chat_{i}_{datetime.datetime.now().strftime('%Y%m%d')}"
-                    first_message = next((msg["content"] for msg in chat if msg["role"] == "user"), "")
-                    title = first_message[:40] + "..." if len(first_message) > 40 else first_message
-                    
-                    data["chats"][chat_id] = {
-                        "id": chat_id,
-                        "title": title if title else "Беседа",
-                        "timestamp": datetime.datetime.now().isoformat(),
-                        "messages": chat,
-                        "think_mode": False
-                    }
-                
-                # Обновляем статистику
-                data["statistics"] = {
-                    "total_chats": len(data["chats"]),
-                    "total_messages": sum(len(chat["messages"]) for chat in data["chats"].values()),
-                    "last_active": datetime.datetime.now().isoformat()
-                }
-                
-                # Удаляем старый ключ
-                if "history" in data:
-                    del data["history"]
-                    
-                # Сохраняем мигрированные данные
-                save_memory(data)
-            
-            return data
+        data = storage.load()
+        
+        if data is None and STORAGE_BACKEND == "sqlite" and os.path.exists(MEMORY_FILE):
+            # Переносим данные из JSON в новое хранилище
+            legacy = JsonStorage(MEMORY_FILE, JOURNAL_FILE, chats_dir=CHATS_DIR)
+            data = legacy.load()
+            if data is not None:
+                for chat_id, chat in data.get("chats", {}).items():
+                    chat["messages"] = legacy.load_messages(chat_id)
+                storage.save(data)
+        
+        if data is None:
+            # Создаем структуру по умолчанию
+            default_memory = _default_memory()
+            save_memory(default_memory)
+            return default_memory
+        
+        # Миграции документа дешевые: сообщения чатов не обходят
+        migrated = upgrade_document(data)
+        
+        # Недостающие разделы берем из структуры по умолчанию
+        for key, value in _default_memory().items():
+            data.setdefault(key, value)
+        
+        # Снимок после миграции при фоновой миграции запишет ее поток,
+        # а длинный журнал сворачиваем сразу
+        background = data["settings"].get("background_migration", True)
+        if (migrated and not background) or storage.needs_compaction():
+            save_memory(data)
+            migrated = False
+        
+        # Индекс хранится в файле — переиндексируем только изменившиеся чаты
+        if get_search_index().sync(data.get("chats", {})):
+            get_search_index().save()
+        
+        with _lock:
+            get_recency_index().sync(data.get("chats", {}))
+        
+        # Устаревшие чаты поднимаются лениво при обращении, остальные — фоном
+        if background and (migrated or any(needs_upgrade(chat) for chat in data["chats"].values())):
+            start_background_migration(data, save_snapshot=migrated)
+        
+        return data
     except Exception as e:
         print(f"Ошибка загрузки памяти: {e}")
-        # Возвращаем память по умолчанию в случае ошибки
-        return {
-            "chats": {},
-            "settings": {
-                "voice_enabled": True,
-                "think_mode": False,
-                "theme": "light",
-                "auto_save": True,
-                "max_history": 50
-            },
-            "user_preferences": {},
-            "statistics": {
-                "total_chats": 0,
-                "total_messages": 0,
-                "last_active": None
-            }
-        }
+        # Возвращаем память по умолчанию в случае ошибки. Испорченный снимок
+        # хранилище уже отложило, а прежний при записи уйдет в резервные копии
+        return _default_memory()
 
 def save_memory(memory_data):
-    """Сохраняем память в файл"""
+    """Сохраняем память целиком (снимок)"""
     try:
-        # Обновляем статистику
-        memory_data["statistics"]["total_chats"] = len(memory_data.get("chats", {}))
-        memory_data["statistics"]["total_messages"] = sum(
-            len(chat.get("messages", [])) for chat in memory_data.get("chats", {}).values()
-        )
-        memory_data["statistics"]["last_active"] = datetime.datetime.now().isoformat()
+        # Ограничиваем историю: самые старые чаты уходят в архив
+        _archive_oldest(memory_data)
         
-        # Ограничиваем историю (удаляем старые чаты, если превышен лимит)
-        max_history = memory_data.get("settings", {}).get("max_history", 50)
-        chats = memory_data.get("chats", {})
+        with _lock:
+            get_search_index().sync(memory_data.get("chats", {}))
         
-        if len(chats) > max_history:
-            # Сортируем по дате и оставляем только последние max_history
-            sorted_chats = sorted(
-                chats.items(),
-                key=lambda x: x[1].get("timestamp", ""),
-                reverse=True
-            )[:max_history]
-            
-            memory_data["chats"] = dict(sorted_chats)
+        # Блокировку памяти хранилище берет само и только на время сериализации
+        saved = get_storage().save(memory_data)
         
-        # Сохраняем в файл
-        with open(MEMORY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(memory_data, f, ensure_ascii=False, indent=2)
+        # Снимок — удобный момент сохранить и индекс
+        get_search_index().save()
         
-        return True
+        return saved
     except Exception as e:
         print(f"Ошибка сохранения памяти: {e}")
         return False
 
+def _archive_oldest(memory_data):
+    """Переносим чаты сверх max_history в архив (возвращает их ID)"""
+    max_history = memory_data.get("settings", {}).get("max_history", 50)
+    chats = memory_data.setdefault("chats", {})
+    if len(chats) <= max_history:
+        return []
+    
+    # Сообщения незагруженных чатов читаем с диска — сначала дописываем отложенное
+    flush_memory()
+    
+    with _lock:
+        candidates = []
+        for chat_id in _recency_for(chats).oldest(len(chats) - max_history):
+            chat = dict(chats[chat_id])
+            chat["messages"] = MessageLog(chat["messages"]) if "messages" in chat else _read_messages(chat_id)
+            chat.pop("message_count", None)
+            candidates.append(chat)
+    
+    # Сжатие и запись — без блокировки памяти
+    archive = get_cold_store()
+    archived = set(archive.add(candidates))
+    
+    with _lock:
+        # Чат, который обновили, пока он архивировался, остается в памяти
+        trimmed = [
+            chat["id"] for chat in candidates
+            if chat["id"] in archived and chats.get(chat["id"], {}).get("timestamp") == chat.get("timestamp")
+        ]
+        recency = get_recency_index()
+        if recency.oldest(len(trimmed)) == trimmed:
+            recency.pop_oldest(len(trimmed))  # Одним срезом, а не по чату
+        
+        # Из памяти чаты убираются обычным удалением — через журнал, чтобы
+        # другой процесс при слиянии не вернул их обратно
+        for chat_id in trimmed:
+            _loaded_chats.pop(id(chats[chat_id]), None)
+            _commit(memory_data, {"op": "delete_chat", "id": chat_id})
+    
+    stale = archived.difference(trimmed)
+    if stale:
+        archive.remove(stale)
+    return trimmed
+
+def _commit(memory_data, record):
+    """Применяем изменение в RAM, а на диск его запишет фоновый поток"""
+    global _last_memory
+    
+    with _lock:
+        if _counters:
+            # Своих записей в журнале у счетчиков нет — они едут с этим изменением
+            record["counters"] = _counters[:]
+            _counters.clear()
+        get_storage().prepare(memory_data, record)
+        _index_record(memory_data, record)
+        _last_memory = memory_data
+        
+        if record.get("op") == "put_chat":
+            _touch_chat(memory_data["chats"][record["chat"]["id"]])
+    
+    get_writer().submit(record)
+    
+    chat_id = record["chat"]["id"] if record.get("op") == "put_chat" else record.get("id")
+    _notify(memory_data, {"op": record.get("op"), "chat_id": chat_id})
+    return True
+
+def _notify(memory_data, event):
+    """Сообщаем подписчикам общего хранилища об изменении"""
+    if _store is not None and _store.data is memory_data:
+        _store._emit(event)
+
+def _recency_for(chats):
+    """Индекс давности, сверенный с чатами (перестраивается, только если разошелся)"""
+    recency = get_recency_index()
+    if len(recency) != len(chats):
+        recency.sync(chats)
+    return recency
+
+def _after_write():
+    """После записи пачки изменений: периодически сворачиваем журнал в снимок"""
+    if _last_memory is not None and get_storage().needs_compaction():
+        save_memory(_last_memory)
+
+def _on_external_change(data):
+    """
+    Память на диске изменил другой процесс (например, голосовой цикл рядом с GUI)
+    
+    Хранилище уже слило его изменения с нашими незаписанными — подменяем
+    данные в RAM на месте, чтобы ссылки на общий словарь остались верными.
+    """
+    memory_data = _store.data if _store is not None else _last_memory
+    if memory_data is None:
+        return
+    
+    with _lock:
+        for key, value in _default_memory().items():
+            data.setdefault(key, value)
+        memory_data.clear()
+        memory_data.update(data)
+        
+        _loaded_chats.clear()
+        for chat in memory_data["chats"].values():
+            if "messages" in chat:
+                _loaded_chats[id(chat)] = chat
+        get_recency_index().sync(memory_data["chats"])
+        get_search_index().sync(memory_data["chats"])
+    
+    _notify(memory_data, {"op": "reload", "chat_id": None})
+
+def _read_messages(chat_id):
+    """Читаем сообщения чата с диска (в RAM не кладем)"""
+    return get_storage().load_messages(chat_id)
+
+def _touch_chat(chat):
+    """Отмечаем чат недавно открытым и выгружаем сообщения самых давних"""
+    with _lock:
+        _loaded_chats[id(chat)] = chat
+        _loaded_chats.move_to_end(id(chat))
+        
+        while len(_loaded_chats) > MAX_LOADED_CHATS:
+            _, old_chat = _loaded_chats.popitem(last=False)
+            if "messages" in old_chat:
+                # Число записанных сообщений: дописанное на месте без update_chat на диск не попало
+                old_chat.setdefault("message_count", len(old_chat["messages"]))
+                del old_chat["messages"]
+
+def _ensure_messages(chat):
+    """Подгружаем сообщения чата с диска, если их нет в RAM"""
+    if "messages" not in chat:
+        # Сначала дописываем отложенные изменения, иначе прочтем старую версию
+        flush_memory()
+        messages = _read_messages(chat["id"])
+        with _lock:
+            if "messages" not in chat:
+                chat["messages"] = MessageLog(messages)
+                chat["message_count"] = len(messages)
+    
+    _touch_chat(chat)
+    return chat["messages"]
+
+def _index_record(memory_data, record):
+    """Обновляем поисковый индекс и индекс давности по одному изменению"""
+    index = get_search_index()
+    recency = get_recency_index()
+    op = record.get("op")
+    
+    if op in ("put_chat", "update_chat", "upgrade_chat"):
+        chat_id = record["chat"]["id"] if op == "put_chat" else record["id"]
+        chat = memory_data.get("chats", {}).get(chat_id)
+        if chat is not None:
+            recency.touch(chat_id, chat.get("timestamp", ""))
+    elif op == "delete_chat":
+        recency.remove(record["id"])
+    elif op == "clear_chats":
+        recency.clear()
+    
+    if op == "put_chat":
+        index.index_chat(memory_data["chats"][record["chat"]["id"]])
+    elif op == "update_chat":
+        chat = memory_data.get("chats", {}).get(record["id"])
+        if chat is None:
+            return
+        if "messages" in record or "title" in record:
+            index.index_chat(chat)
+        elif "append" in record:
+            index.add_messages(chat, record["append"])
+    elif op == "upgrade_chat":
+        chat = memory_data.get("chats", {}).get(record["id"])
+        if chat is not None and "title" in record["fields"]:
+            index.index_chat(chat)
+    elif op == "delete_chat":
+        index.remove_chat(record["id"])
+    elif op == "clear_chats":
+        index.clear()
+
+# ================= МИГРАЦИИ =================
+
+def _upgrade_chat(memory_data, chat):
+    """Поднимаем схему чата при первом обращении (изменение идет через журнал)"""
+    with _lock:
+        if not needs_upgrade(chat):
+            return False
+        fields = upgrade_chat(chat)
+    return _commit(memory_data, {"op": "upgrade_chat", "id": chat["id"], "fields": fields})
+
+def migrate_all(memory_data, batch_size=MIGRATE_BATCH, pause=MIGRATE_PAUSE):
+    """Поднимаем схему всех чатов пачками (возвращает число обновленных)"""
+    with _lock:
+        stale = [chat_id for chat_id, chat in memory_data.get("chats", {}).items() if needs_upgrade(chat)]
+    
+    upgraded = 0
+    for start in range(0, len(stale), batch_size):
+        for chat_id in stale[start:start + batch_size]:
+            chat = memory_data.get("chats", {}).get(chat_id)
+            if chat is not None and _upgrade_chat(memory_data, chat):
+                upgraded += 1
+        if pause:
+            time.sleep(pause)
+    return upgraded
+
+def start_background_migration(memory_data, save_snapshot=False):
+    """Запускаем миграцию в фоновом потоке, чтобы не задерживать запуск"""
+    global _migration_thread
+    
+    def run():
+        try:
+            if save_snapshot:
+                save_memory(memory_data)
+            migrate_all(memory_data)
+        except Exception as e:
+            print(f"Ошибка фоновой миграции памяти: {e}")
+    
+    with _lock:
+        if _migration_thread is None or not _migration_thread.is_alive():
+            _migration_thread = threading.Thread(target=run, name="memory-migrate", daemon=True)
+            _migration_thread.start()
+        return _migration_thread
+
+# ================= ОПЕРАЦИИ С ЧАТАМИ =================
+
 def add_chat(memory_data, chat_id, chat_title, messages, think_mode=False):
     """Добавляем новый чат в память"""
     if "chats" not in memory_data:
         memory_data["chats"] = {}
     
-    memory_data["chats"][chat_id] = {
-        "id": chat_id,
-        "title": chat_title,
-        "timestamp": datetime.datetime.now().isoformat(),
-        "messages": messages.copy() if messages else [],
-        "think_mode": think_mode
-    }
+    _commit(memory_data, {
+        "op": "put_chat",
+        "chat": {
+            "id": chat_id,
+            "title": chat_title,
+            "timestamp": datetime.datetime.now().isoformat(),
+            "messages": MessageLog(messages),  # Снимок: буфер общий с вызывающим
+            "think_mode": think_mode,
+            "schema": CHAT_VERSION
+        }
+    })
     
-    return save_memory(memory_data)
+    # Чаты сверх max_history уходят в архив сразу, а не при сворачивании журнала
+    _archive_oldest(memory_data)
+    return True
 
 def update_chat(memory_data, chat_id, messages=None, title=None, think_mode=None):
     """Обновляем существующий чат"""
@@ -138,66 +444,178 @@ def update_chat(memory_data, chat_id, messages=None, title=None, think_mode=None
         return False
     
     chat = memory_data["chats"][chat_id]
+    _upgrade_chat(memory_data, chat)
+    record = {"op": "update_chat", "id": chat_id}
     
     if messages is not None:
-        chat["messages"] = messages.copy()
+        _ensure_messages(chat)
+        with _lock:
+            old_messages = MessageLog(chat.get("messages"))
+            messages = MessageLog(messages)
+            # Разницу считаем от записанного числа сообщений, а не от списка в RAM:
+            # вызывающий мог дописать chat["messages"] на месте и передать его же
+            count = min(chat.get("message_count", len(old_messages)), len(old_messages))
+            # Список в RAM возвращаем к записанному — дальше его меняет само изменение
+            chat["messages"] = old_messages.head(count)
+            # Снимок того же буфера (обычный случай в GUI) проверяется за O(1)
+            if messages.startswith(chat["messages"]):
+                # Обычный случай: к чату добавились сообщения — пишем только их
+                record["append"] = messages[count:]
+            else:
+                record["messages"] = messages
+                if chat.get("summarized"):
+                    # Сообщения переписаны — прежняя сводка им больше не соответствует
+                    record["summary"] = ""
+                    record["summarized"] = 0
     
     if title is not None:
-        chat["title"] = title
+        record["title"] = title
     
     if think_mode is not None:
-        chat["think_mode"] = think_mode
+        record["think_mode"] = think_mode
+    
+    record["timestamp"] = datetime.datetime.now().isoformat()  # Обновляем время
     
-    chat["timestamp"] = datetime.datetime.now().isoformat()  # Обновляем время
+    return _commit(memory_data, record)
+
+def set_chat_summary(memory_data, chat_id, summary, summarized, expected=None):
+    """
+    Сохраняем сводку первых summarized сообщений чата (время чата не меняется)
     
-    return save_memory(memory_data)
+    expected — сколько сообщений покрывала сводка, от которой считали новую:
+    если ее успели заменить или сбросить, устаревший результат не пишем.
+    """
+    with _lock:
+        chat = memory_data.get("chats", {}).get(chat_id)
+        if chat is None or get_message_count(chat) < summarized:
+            return False
+        if expected is not None and chat.get("summarized", 0) != expected:
+            return False
+        return _commit(memory_data, {"op": "update_chat", "id": chat_id, "summary": summary, "summarized": summarized})
 
 def delete_chat(memory_data, chat_id):
-    """Удаляем чат из памяти"""
+    """Удаляем чат из памяти (или из архива)"""
     if chat_id in memory_data.get("chats", {}):
-        del memory_data["chats"][chat_id]
-        return save_memory(memory_data)
+        return _commit(memory_data, {"op": "delete_chat", "id": chat_id})
+    if chat_id in get_cold_store():
+        get_cold_store().remove([chat_id])
+        _notify(memory_data, {"op": "delete_chat", "chat_id": chat_id})
+        return True
     return False
 
+def clear_chats(memory_data):
+    """Удаляем все чаты, включая архив"""
+    get_cold_store().clear()
+    return _commit(memory_data, {"op": "clear_chats"})
+
+def set_setting(memory_data, key, value):
+    """Сохраняем одну настройку"""
+    return _commit(memory_data, {"op": "set_setting", "key": key, "value": value})
+
 def get_chat(memory_data, chat_id):
-    """Получаем чат по ID"""
-    return memory_data.get("chats", {}).get(chat_id)
+    """Получаем чат по ID (сообщения подгружаются с диска, архивный чат возвращается в память)"""
+    chat = memory_data.get("chats", {}).get(chat_id)
+    if chat is not None:
+        _upgrade_chat(memory_data, chat)
+        _ensure_messages(chat)
+    elif chat_id in get_cold_store():
+        chat = restore_chat(memory_data, chat_id)
+    return chat
+
+def restore_chat(memory_data, chat_id):
+    """Возвращаем чат из архива в основную память (он становится самым свежим)"""
+    chat = get_cold_store().load_chat(chat_id)
+    if chat is None:
+        return None
+    
+    # Со старым временем чат ушел бы в архив при следующем же сохранении
+    chat["timestamp"] = datetime.datetime.now().isoformat()
+    chat.update(upgrade_chat(chat))
+    _commit(memory_data, {"op": "put_chat", "chat": chat})
+    get_cold_store().remove([chat_id])
+    _archive_oldest(memory_data)
+    return memory_data["chats"].get(chat_id)
+
+def get_archived_chats(memory_data, limit=None):
+    """Получаем чаты из архива (только метаданные, новые первыми)"""
+    chats = memory_data.get("chats", {})
+    return {meta["id"]: meta for meta in get_cold_store().recent(limit) if meta["id"] not in chats}
+
+def get_message_count(chat):
+    """Количество сообщений в чате без загрузки самих сообщений"""
+    return message_count(chat)
 
 def get_recent_chats(memory_data, limit=10):
-    """Получаем последние чаты"""
+    """Получаем последние чаты (новые первыми, O(limit))"""
     chats = memory_data.get("chats", {})
     
-    # Сортируем по дате (новые первыми)
-    sorted_chats = sorted(
-        chats.items(),
-        key=lambda x: x[1].get("timestamp", ""),
-        reverse=True
-    )[:limit]
-    
-    return {chat_id: chat_data for chat_id, chat_data in sorted_chats}
-
-def search_chats(memory_data, query):
-    """Ищем чаты по тексту"""
-    results = {}
-    query_lower = query.lower()
-    
-    for chat_id, chat_data in memory_data.get("chats", {}).items():
-        # Ищем в заголовке
-        if query_lower in chat_data.get("title", "").lower():
-            results[chat_id] = chat_data
-            continue
-        
-        # Ищем в сообщениях
-        for message in chat_data.get("messages", []):
-            if query_lower in message.get("content", "").lower():
-                results[chat_id] = chat_data
-                break
+    with _lock:
+        chat_ids = _recency_for(chats).newest(limit)
     
-    return results
+    return {chat_id: chats[chat_id] for chat_id in chat_ids if chat_id in chats}
+
+def search_chats(memory_data, query, limit=None, include_archived=False):
+    """
+    Ищем чаты по тексту (по убыванию релевантности)
+    
+    С include_archived=True после чатов из памяти идут найденные в архиве
+    (метаданные с пометкой "archived"; открываются через get_chat).
+    """
+    chats = memory_data.get("chats", {})
+    with _lock:
+        chat_ids = get_search_index().search(query, chats, limit)
+    found = {chat_id: chats[chat_id] for chat_id in chat_ids if chat_id in chats}
+    
+    if include_archived and (limit is None or len(found) < limit):
+        archive = get_cold_store()
+        rest = limit - len(found) if limit else None
+        for chat_id in archive.search(query, rest):
+            if chat_id not in found:
+                found[chat_id] = archive.get(chat_id)
+    return found
+
+def record_latency(memory_data, model, first_token, total):
+    """Учитываем время ответа модели (до первого токена и полное, в секундах)"""
+    return _count(memory_data, {
+        "op": "add_latency",
+        "model": model,
+        "first_token": round(first_token, 3),
+        "total": round(total, 3),
+        "timestamp": datetime.datetime.now().isoformat()
+    })
+
+def record_cache_lookup(memory_data, layer):
+    """Учитываем, откуда взят ответ: "exact", "semantic" или None — сгенерирован моделью"""
+    return _count(memory_data, {"op": "add_cache_lookup", "layer": layer})
+
+def _count(memory_data, counter):
+    """Откладываем счетчик до ближайшего изменения памяти (отдельной записи в журнал нет)"""
+    global _last_memory
+    
+    with _lock:
+        _counters.append(counter)
+        _last_memory = memory_data
+    return True
+
+def _flush_counters():
+    """При выходе записываем счетчики, которым не досталось изменения"""
+    with _lock:
+        memory_data = _last_memory if _counters else None
+    if memory_data is not None:
+        _commit(memory_data, {"op": "add_counters"})
+
+# Выполняется раньше flush_memory, зарегистрированной выше
+atexit.register(_flush_counters)
 
 def get_statistics(memory_data):
-    """Получаем статистику"""
+    """Получаем статистику (из счетчиков, без обхода истории)"""
     stats = memory_data.get("statistics", {})
+    with _lock:
+        if _counters:
+            # Отложенные счетчики показываем сразу, не дожидаясь записи
+            stats = copy.deepcopy(stats)
+            for counter in _counters:
+                apply_statistics({"statistics": stats}, counter)
     
     # Рассчитываем среднее количество сообщений в чате
     total_chats = stats.get("total_chats", 0)
@@ -208,50 +626,282 @@ def get_statistics(memory_data):
     return {
         **stats,
         "avg_messages_per_chat": round(avg_messages, 1),
-        "active_chats": len(memory_data.get("chats", {}))
+        "active_chats": len(memory_data.get("chats", {})),
+        "archived_chats": len(get_cold_store()),
+        "latency_by_model": latency_summary(stats),
+        "cache_hits": cache_summary(stats)
     }
 
-def export_memory(export_path="memory_backup.json"):
-    """Экспортируем всю память в файл"""
-    memory_data = load_memory()
+def verify_statistics(memory_data, rebuild=False):
+    """
+    Сверяем счетчики статистики с чатами (O(число чатов))
+    
+    Возвращает расхождения {ключ: (в счетчике, на самом деле)};
+    с rebuild=True счетчики исправляются и память сохраняется.
+    """
+    with _lock:
+        stats = memory_data.setdefault("statistics", empty_statistics())
+        actual = count_totals(memory_data.get("chats", {}))
+        mismatches = {key: (stats.get(key), value) for key, value in actual.items() if stats.get(key) != value}
+        if mismatches and rebuild:
+            stats.update(actual)
+    
+    if mismatches and rebuild:
+        save_memory(memory_data)
+    return mismatches
+
+def export_memory(export_path="memory_backup.jsonl", progress=None, compression=None):
+    """
+    Экспортируем всю память в архив потоком, по одному чату
+    
+    Сжатие выбирается по расширению (.gz — gzip, .zst — zstd) или
+    параметром compression. progress(готово чатов, всего чатов).
+    """
+    memory_data = get_memory_store().data
     
     try:
-        with open(export_path, 'w', encoding='utf-8') as f:
-            json.dump(memory_data, f, ensure_ascii=False, indent=2)
+        # Сообщения незагруженных чатов читаются с диска — дописываем отложенное
+        flush_memory()
+        
+        with _lock:
+            header = json.loads(json.dumps({key: value for key, value in memory_data.items() if key != "chats"}))
+            chat_ids = list(memory_data.get("chats", {}))
+        archived_ids = [meta["id"] for meta in get_cold_store().recent() if meta["id"] not in chat_ids]
+        total = len(chat_ids) + len(archived_ids)
+        
+        with ArchiveWriter(export_path, compression) as archive:
+            archive.write_header(header)
+            
+            for done, chat_id in enumerate(chat_ids, 1):
+                with _lock:
+                    chat = memory_data.get("chats", {}).get(chat_id)
+                    if chat is None:
+                        continue  # Удален во время экспорта
+                    chat = dict(chat)
+                    messages = MessageLog(chat["messages"]) if "messages" in chat else None
+                
+                chat["messages"] = messages if messages is not None else _read_messages(chat_id)
+                chat.pop("message_count", None)
+                archive.write_chat(chat)
+                
+                if progress:
+                    progress(done, total)
+            
+            # Чаты из архива экспортируются наравне с остальными
+            for done, chat_id in enumerate(archived_ids, len(chat_ids) + 1):
+                chat = get_cold_store().load_chat(chat_id)
+                if chat is not None:
+                    archive.write_chat(chat)
+                if progress:
+                    progress(done, total)
         return True
     except Exception as e:
         print(f"Ошибка экспорта: {e}")
         return False
 
-def import_memory(import_path):
-    """Импортируем память из файла"""
+def import_memory(import_path, progress=None):
+    """
+    Импортируем чаты из архива потоком, по одному чату
+    
+    Чаты сливаются по ID: существующий чат заменяется, только если
+    в архиве он новее. Понимает и старый экспорт одним JSON-файлом.
+    progress(прочитано байт, размер файла).
+    """
+    memory_data = get_memory_store().data
+    
     try:
-        with open(import_path, 'r', encoding='utf-8') as f:
-            imported_data = json.load(f)
+        merged = 0
+        for chat_data in _iter_import(import_path, progress):
+            if _merge_chat(memory_data, chat_data):
+                merged += 1
+                if merged % IMPORT_FLUSH_EVERY == 0:
+                    flush_memory()
         
-        # Объединяем с существующей памятью
-        current_memory = load_memory()
-        
-        # Объединяем чаты
-        for chat_id, chat_data in imported_data.get("chats", {}).items():
-            if chat_id not in current_memory["chats"]:
-                current_memory["chats"][chat_id] = chat_data
-            else:
-                # Если чат уже существует, обновляем его
-                current_memory["chats"][chat_id].update(chat_data)
-        
-        # Сохраняем объединенные данные
-        save_memory(current_memory)
+        # Сворачиваем импорт в снимок
+        save_memory(memory_data)
         return True
     except Exception as e:
         print(f"Ошибка импорта: {e}")
         return False
 
+def _iter_import(import_path, progress=None):
+    """Чаты из архива или из старого экспорта"""
+    try:
+        reader = ArchiveReader(import_path)
+    except NotAnArchive:
+        # Старый формат: весь файл — один JSON (читается целиком)
+        with open(import_path, 'r', encoding='utf-8') as f:
+            imported_data = json.load(f)
+        chats = list(imported_data.get("chats", {}).items())
+        for done, (chat_id, chat_data) in enumerate(chats, 1):
+            yield dict(chat_data, id=chat_id)
+            if progress:
+                progress(done, len(chats))
+        return
+    
+    with reader:
+        yield from reader.chats(progress)
+
+def _merge_chat(memory_data, chat_data):
+    """Сливаем один импортированный чат: побеждает более свежая версия"""
+    chat_id = chat_data.get("id")
+    if not chat_id:
+        return False
+    
+    existing = memory_data.get("chats", {}).get(chat_id) or get_cold_store().get(chat_id)
+    if existing is not None and existing.get("timestamp", "") >= chat_data.get("timestamp", ""):
+        return False
+    
+    chat = dict(chat_data)
+    chat.pop("message_count", None)
+    chat.setdefault("messages", [])
+    chat.update(upgrade_chat(chat))  # Экспорт мог быть сделан старой версией
+    _commit(memory_data, {"op": "put_chat", "chat": chat})
+    
+    # Более свежая версия заменяет архивную; старая сама уйдет в архив по max_history
+    if existing is not None and existing.get("archived"):
+        get_cold_store().remove([chat_id])
+    return True
+
 def clear_all_memory():
     """Очищаем всю память"""
     try:
-        os.remove(MEMORY_FILE)
+        flush_memory()
+        get_storage().clear()
+        with _lock:
+            _loaded_chats.clear()
+            _counters.clear()
+        get_search_index().clear()
+        get_recency_index().clear()
+        get_cold_store().clear()
+        if os.path.exists(INDEX_FILE):
+            os.remove(INDEX_FILE)
+        
+        # Общую память очищаем на месте — ссылки на нее остаются верными
+        if _store is not None:
+            with _lock:
+                _store.data.clear()
+                _store.data.update(_default_memory())
+            _store._emit({"op": "reset", "chat_id": None})
         return True
     except Exception as e:
         print(f"Ошибка очистки памяти: {e}")
-        return False
\ No newline at end of file
+        return False
+
+# ================= ОБЩЕЕ ХРАНИЛИЩЕ =================
+
+class MemoryStore:
+    """
+    Единственная в процессе копия памяти с подпиской на изменения
+    
+    GUI, менеджер истории, экспорт и импорт работают с одним и тем же
+    словарем data, поэтому не перечитывают файл и не затирают изменения
+    друг друга. Подписчики вызываются в потоке, который внес изменение.
+    """
+    
+    def __init__(self, data):
+        self.data = data
+        self._listeners = []
+        self._listeners_lock = threading.Lock()
+    
+    def subscribe(self, callback):
+        """Подписаться на изменения: callback({"op": ..., "chat_id": ...}); возвращает функцию отписки"""
+        with self._listeners_lock:
+            self._listeners.append(callback)
+        
+        def unsubscribe():
+            with self._listeners_lock:
+                if callback in self._listeners:
+                    self._listeners.remove(callback)
+        
+        return unsubscribe
+    
+    def _emit(self, event):
+        with self._listeners_lock:
+            listeners = list(self._listeners)
+        for callback in listeners:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Ошибка подписчика памяти: {e}")
+    
+    # Операции — те же функции модуля, но всегда над общей памятью
+    
+    def add_chat(self, chat_id, chat_title, messages, think_mode=False):
+        return add_chat(self.data, chat_id, chat_title, messages, think_mode)
+    
+    def update_chat(self, chat_id, messages=None, title=None, think_mode=None):
+        return update_chat(self.data, chat_id, messages, title, think_mode)
+    
+    def set_chat_summary(self, chat_id, summary, summarized, expected=None):
+        return set_chat_summary(self.data, chat_id, summary, summarized, expected)
+    
+    def delete_chat(self, chat_id):
+        return delete_chat(self.data, chat_id)
+    
+    def clear_chats(self):
+        return clear_chats(self.data)
+    
+    def set_setting(self, key, value):
+        return set_setting(self.data, key, value)
+    
+    def get_setting(self, key, default=None):
+        return self.data.get("settings", {}).get(key, default)
+    
+    def has_chat(self, chat_id):
+        return chat_id in self.data.get("chats", {})
+    
+    def get_chat(self, chat_id):
+        return get_chat(self.data, chat_id)
+    
+    def get_recent_chats(self, limit=10):
+        return get_recent_chats(self.data, limit)
+    
+    def search_chats(self, query, limit=None, include_archived=False):
+        return search_chats(self.data, query, limit, include_archived)
+    
+    def restore_chat(self, chat_id):
+        return restore_chat(self.data, chat_id)
+    
+    def get_archived_chats(self, limit=None):
+        return get_archived_chats(self.data, limit)
+    
+    def record_latency(self, model, first_token, total):
+        return record_latency(self.data, model, first_token, total)
+    
+    def record_cache_lookup(self, layer):
+        return record_cache_lookup(self.data, layer)
+    
+    def get_statistics(self):
+        return get_statistics(self.data)
+
+def get_memory_store():
+    """Получаем общее хранилище памяти (загружается с диска один раз на процесс)"""
+    global _store
+    if _store is None:
+        data = load_memory()
+        with _lock:
+            if _store is None:
+                _store = MemoryStore(data)
+    return _store
+
+if __name__ == "__main__":
+    # python memory.py migrate | verify-stats [--rebuild]
+    import sys
+    
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate":
+        memory_data = get_memory_store().data
+        if _migration_thread is not None:
+            _migration_thread.join()
+        print(f"Обновлено чатов: {migrate_all(memory_data, pause=0)}")
+        save_memory(memory_data)
+        flush_memory()
+    elif len(sys.argv) > 1 and sys.argv[1] == "verify-stats":
+        problems = verify_statistics(get_memory_store().data, rebuild="--rebuild" in sys.argv)
+        if not problems:
+            print("Статистика сходится")
+        for key, (stored, actual) in problems.items():
+            print(f"{key}: в счетчике {stored}, на самом деле {actual}")
+        flush_memory()
+    else:
+        print("Использование: python memory.py migrate | verify-stats [--rebuild]")
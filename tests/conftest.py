@@ -0,0 +1,54 @@
+# tests/conftest.py
+"""
+Общие настройки тестов
+
+Запуск из корня проекта: python -m pytest
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import memory  # noqa: E402
+
+
+def reset_memory():
+    """Забыть все, что модуль памяти держит в RAM, как при новом запуске процесса"""
+    if memory._writer is not None:
+        memory._writer.stop(5)
+    memory._storage = None
+    memory._search_index = None
+    memory._recency_index = None
+    memory._cold_store = None
+    memory._writer = None
+    memory._store = None
+    memory._migration_thread = None
+    memory._last_memory = None
+    memory._loaded_chats.clear()
+    memory._counters.clear()
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def backend(request, tmp_path, monkeypatch):
+    """Пустая память в отдельном каталоге для каждого хранилища"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(memory, "STORAGE_BACKEND", request.param)
+    monkeypatch.setattr(memory, "WRITE_DELAY", 0)
+    reset_memory()
+    yield request.param
+    reset_memory()
+
+
+@pytest.fixture
+def restart():
+    """Записать все на диск и загрузить память заново, как после перезапуска"""
+    def restart():
+        memory.flush_memory(5)
+        reset_memory()
+        return memory.load_memory()
+    return restart
@@ -0,0 +1,55 @@
+# tests/test_cold_store.py
+"""Тесты холодного хранилища: сжатые чаты, каталог, поиск и лимит"""
+
+from core.cold_store import ColdStore
+from core.messages import MessageLog
+
+
+def chat(chat_id, timestamp, *texts):
+    return {"id": chat_id, "title": f"Чат {chat_id}", "timestamp": timestamp,
+            "messages": MessageLog({"role": "user", "content": text} for text in texts)}
+
+
+def test_chat_round_trip(tmp_path):
+    store = ColdStore(str(tmp_path / "archive"), compression="gzip")
+    assert store.add([chat("c1", "2024-01-01", "привет", "как дела")]) == ["c1"]
+
+    reopened = ColdStore(str(tmp_path / "archive"))
+    assert "c1" in reopened
+    assert reopened.get("c1")["message_count"] == 2
+    assert reopened.get("c1")["archived"] is True
+    loaded = reopened.load_chat("c1")
+    assert loaded["title"] == "Чат c1"
+    assert [m["content"] for m in loaded["messages"]] == ["привет", "как дела"]
+
+
+def test_recent_search_and_remove(tmp_path):
+    store = ColdStore(str(tmp_path / "archive"))
+    store.add([chat("old", "2024-01-01", "рецепт борща"), chat("new", "2024-02-01", "настройка роутера")])
+
+    assert [meta["id"] for meta in store.recent()] == ["new", "old"]
+    assert [meta["id"] for meta in store.recent(1)] == ["new"]
+    assert store.search("борща") == ["old"]
+
+    store.remove(["old"])
+    assert "old" not in ColdStore(str(tmp_path / "archive"))
+    assert store.search("борща") == []
+    assert store.load_chat("old") is None
+
+
+def test_oldest_are_dropped_over_limit(tmp_path):
+    store = ColdStore(str(tmp_path / "archive"), max_chats=2)
+    for i in range(4):
+        store.add([chat(f"c{i}", f"2024-01-0{i + 1}", f"текст {i}")])
+
+    assert sorted(meta["id"] for meta in store.recent()) == ["c2", "c3"]
+    assert len(list((tmp_path / "archive" / "chats").iterdir())) == 2
+
+
+def test_write_of_another_process_is_visible(tmp_path):
+    first, second = ColdStore(str(tmp_path / "archive")), ColdStore(str(tmp_path / "archive"))
+    assert len(second) == 0
+
+    first.add([chat("c1", "2024-01-01", "привет")])
+    assert "c1" in second
+    assert second.load_messages("c1")[0]["content"] == "привет"
@@ -0,0 +1,63 @@
+# tests/test_context.py
+"""Тесты окна контекста: бюджет токенов, сводка и закрепленные факты"""
+
+from core.context import (EARLIER_HEADER, PINNED_HEADER, ContextWindow, estimate_tokens,
+                          message_tokens, truncate_to_tokens)
+
+
+def history(count, words=40):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"реплика {i} " + "слово " * words}
+            for i in range(count)]
+
+
+def total_tokens(messages):
+    return sum(map(message_tokens, messages))
+
+
+def test_short_history_goes_verbatim():
+    window = ContextWindow(1000)
+    messages = window.build(history(3), "system")
+    assert [m["content"] for m in messages[1:]] == [m["content"] for m in history(3)]
+    assert window.window_start(history(3), "system") == 0
+
+
+def test_long_history_stays_within_budget():
+    window = ContextWindow(600)
+    chat = history(100)
+    messages = window.build(chat, "system", pinned=["зовут Иван"])
+
+    assert total_tokens(messages) <= window.budget
+    assert messages[-1]["content"] == chat[-1]["content"]
+    assert PINNED_HEADER + "- зовут Иван" in messages[0]["content"]
+    assert EARLIER_HEADER in messages[0]["content"]
+    assert len(messages) - 1 == len(chat) - window.window_start(chat, "system", ["зовут Иван"])
+
+
+def test_saved_summary_replaces_early_turns():
+    window = ContextWindow(600)
+    chat = history(100)
+    messages = window.build(chat, "system", summary="обсуждали отпуск", summarized=80)
+    assert "обсуждали отпуск" in messages[0]["content"]
+    assert total_tokens(messages) <= window.budget
+
+
+def test_oversized_last_message_is_truncated():
+    window = ContextWindow(200)
+    messages = window.build([{"role": "user", "content": "слово " * 1000}])
+    assert total_tokens(messages) <= window.budget
+    assert messages[-1]["content"].endswith("…")
+
+
+def test_fit_keeps_prepared_messages_within_budget():
+    window = ContextWindow(300)
+    fitted = window.fit([{"role": "system", "content": "system"}] + history(50))
+    assert fitted[0]["content"].startswith("system")
+    assert total_tokens(fitted) <= window.budget
+
+
+def test_token_estimates():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abcd") == 1
+    assert estimate_tokens("абвг") == 2
+    assert truncate_to_tokens("короткий", 100) == "короткий"
+    assert estimate_tokens(truncate_to_tokens("слово " * 100, 10)) <= 10
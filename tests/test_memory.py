@@ -0,0 +1,149 @@
+# tests/test_memory.py
+"""Тесты памяти: запись на диск и загрузка после перезапуска на обоих хранилищах"""
+
+import memory
+
+
+def user(text):
+    return {"role": "user", "content": text}
+
+
+def contents(chat):
+    return [message["content"] for message in chat["messages"]]
+
+
+def test_chat_survives_restart(backend, restart):
+    data = memory.load_memory()
+    memory.add_chat(data, "c1", "Первый", [user("привет")])
+    memory.update_chat(data, "c1", messages=[user("привет"), user("как дела")], title="Переименован")
+
+    data = restart()
+    chat = memory.get_chat(data, "c1")
+    assert chat["title"] == "Переименован"
+    assert contents(chat) == ["привет", "как дела"]
+    assert memory.verify_statistics(data) == {}
+
+
+def test_in_place_append_is_persisted(backend, restart):
+    data = memory.load_memory()
+    memory.add_chat(data, "c1", "Чат", [user(f"сообщение {i}") for i in range(8)])
+
+    # Вызывающий дописывает список чата на месте и передает его же
+    chat = memory.get_chat(data, "c1")
+    chat["messages"].append(user("новое"))
+    memory.update_chat(data, "c1", messages=chat["messages"])
+
+    assert len(memory.get_chat(data, "c1")["messages"]) == 9
+    assert memory.verify_statistics(data) == {}
+
+    data = restart()
+    assert contents(memory.get_chat(data, "c1"))[-1] == "новое"
+    assert len(memory.get_chat(data, "c1")["messages"]) == 9
+    assert memory.verify_statistics(data) == {}
+
+
+def test_rewritten_messages_reset_summary(backend, restart):
+    data = memory.load_memory()
+    memory.add_chat(data, "c1", "Чат", [user("а"), user("б"), user("в")])
+    memory.set_chat_summary(data, "c1", "сводка", 2)
+    memory.update_chat(data, "c1", messages=[user("другое")])
+
+    data = restart()
+    chat = memory.get_chat(data, "c1")
+    assert contents(chat) == ["другое"]
+    assert chat.get("summarized", 0) == 0
+    assert memory.verify_statistics(data) == {}
+
+
+def test_unloaded_chats_keep_messages_on_disk(backend, restart, monkeypatch):
+    monkeypatch.setattr(memory, "MAX_LOADED_CHATS", 2)
+    data = memory.load_memory()
+    for i in range(5):
+        memory.add_chat(data, f"c{i}", f"Чат {i}", [user(f"вопрос {i}")])
+
+    assert sum("messages" in chat for chat in data["chats"].values()) == 2
+    assert contents(memory.get_chat(data, "c0")) == ["вопрос 0"]
+
+    data = restart()
+    assert [contents(memory.get_chat(data, f"c{i}")) for i in range(5)] == [[f"вопрос {i}"] for i in range(5)]
+
+
+def test_delete_and_settings_survive_restart(backend, restart):
+    data = memory.load_memory()
+    memory.add_chat(data, "c1", "Первый", [user("а")])
+    memory.add_chat(data, "c2", "Второй", [user("б")])
+    memory.delete_chat(data, "c1")
+    memory.set_setting(data, "theme", "dark")
+
+    data = restart()
+    assert set(data["chats"]) == {"c2"}
+    assert data["settings"]["theme"] == "dark"
+    assert data["statistics"]["total_chats"] == 1
+
+
+def test_search_after_restart(backend, restart):
+    data = memory.load_memory()
+    memory.add_chat(data, "c1", "Погода", [user("зонтик нужен?")])
+    memory.add_chat(data, "c2", "Код", [user("как отсортировать список")])
+
+    data = restart()
+    assert list(memory.search_chats(data, "отсортировать")) == ["c2"]
+
+
+def test_counters_ride_with_next_change(backend, restart):
+    data = memory.load_memory()
+    memory.add_chat(data, "c1", "Чат", [user("вопрос")])
+    memory.flush_memory(5)
+    records = len(memory.get_storage()._unwritten)
+
+    memory.record_cache_lookup(data, None)
+    memory.record_latency(data, "model", 0.2, 1.0)
+    memory.record_cache_lookup(data, "exact")
+
+    # Счетчики видны сразу, но отдельных записей не порождают
+    assert len(memory.get_storage()._unwritten) == records
+    stats = memory.get_statistics(data)
+    assert stats["cache_hits"]["responses"] == 2
+    assert stats["latency_by_model"]
+
+    memory.update_chat(data, "c1", messages=[user("вопрос"), user("еще")])
+    data = restart()
+    stats = memory.get_statistics(data)
+    assert stats["cache_hits"]["responses"] == 2
+    assert stats["cache_hits"]["exact_rate"] == 0.5
+    assert list(stats["latency_by_model"]) == ["model"]
+
+
+def test_counters_without_change_are_written_at_exit(backend, restart):
+    data = memory.load_memory()
+    memory.record_cache_lookup(data, "semantic")
+    memory._flush_counters()
+
+    data = restart()
+    assert memory.get_statistics(data)["cache_hits"]["semantic_rate"] == 1.0
+
+
+def test_add_chat_archives_oldest(backend, restart):
+    data = memory.load_memory()
+    memory.set_setting(data, "max_history", 3)
+    for i in range(5):
+        memory.add_chat(data, f"c{i}", f"Чат {i}", [user(f"вопрос {i}")])
+
+    assert set(data["chats"]) == {"c2", "c3", "c4"}
+    assert set(memory.get_archived_chats(data)) == {"c0", "c1"}
+
+    # Перенос в архив записан в журнал: после перезапуска чаты не возвращаются
+    data = restart()
+    assert set(data["chats"]) == {"c2", "c3", "c4"}
+    assert memory.verify_statistics(data) == {}
+    assert "c0" in memory.search_chats(data, "вопрос", include_archived=True)
+
+    # Открытый архивный чат возвращается в память, а самый старый уходит в архив
+    chat = memory.get_chat(data, "c0")
+    assert contents(chat) == ["вопрос 0"]
+    assert set(data["chats"]) == {"c0", "c3", "c4"}
+    assert set(memory.get_archived_chats(data)) == {"c1", "c2"}
+
+    data = restart()
+    assert contents(memory.get_chat(data, "c2")) == ["вопрос 2"]
+    assert memory.verify_statistics(data) == {}
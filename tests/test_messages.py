@@ -0,0 +1,114 @@
+# tests/test_messages.py
+"""Тесты MessageLog: снимки, общий буфер и проверка префикса"""
+
+import gc
+
+from core.messages import SHARED_CONTENT_SIZE, Message, MessageLog, _shared_contents
+
+
+def make_log(count):
+    return MessageLog({"role": "user", "content": f"сообщение {i}"} for i in range(count))
+
+
+def test_snapshot_is_not_changed_by_append():
+    log = make_log(3)
+    snapshot = log.snapshot()
+    log.append({"role": "assistant", "content": "ответ"})
+
+    assert len(snapshot) == 3
+    assert len(log) == 4
+    assert list(snapshot) == list(log)[:3]
+
+
+def test_snapshots_diverge_without_touching_each_other():
+    base = make_log(2)
+    first, second = base.snapshot(), base.snapshot()
+    first.append({"role": "user", "content": "первый"})
+    second.append({"role": "user", "content": "второй"})
+
+    assert first[-1].content == "первый"
+    assert second[-1].content == "второй"
+    assert len(base) == 2
+
+
+def test_append_of_same_message_shares_buffer():
+    log = make_log(2)
+    message = Message("assistant", "ответ")
+    log.append(message)
+    head = log.head(2)
+    head.append(message)
+
+    assert head._items is log._items
+    assert head == log
+
+
+def test_head_is_clamped():
+    log = make_log(3)
+    assert len(log.head(10)) == 3
+    assert len(log.head(-1)) == 0
+    assert list(log.head(2)) == list(log)[:2]
+
+
+def test_startswith_compares_messages():
+    log = make_log(3)
+    assert log.startswith(log.head(2))
+    assert log.startswith([{"role": "user", "content": "сообщение 0"}])
+    assert not log.startswith(make_log(4))
+    assert not log.startswith([{"role": "user", "content": "другое"}])
+
+
+def test_startswith_shared_buffer_checks_length():
+    log = make_log(2)
+    snapshot = log.snapshot()
+    log.append({"role": "user", "content": "новое"})
+
+    assert log.startswith(snapshot)
+    assert not snapshot.startswith(log)
+
+
+class UnreadableBuffer(list):
+    """Буфер, который нельзя обходить: проверка префикса не должна сравнивать сообщения"""
+
+    def __iter__(self):
+        raise AssertionError("сообщения обходятся")
+
+    def __getitem__(self, index):
+        raise AssertionError("сообщения читаются")
+
+
+def test_startswith_same_buffer_is_constant_time():
+    log = make_log(3)
+    log.append({"role": "user", "content": "дописано на месте"})
+    head = log.head(3)
+    log._items = head._items = UnreadableBuffer(list.__iter__(log._items))
+
+    assert log.startswith(head)
+    assert not head.startswith(log)
+
+
+def test_startswith_foreign_buffer_compares_messages():
+    log = make_log(3)
+    assert log.startswith(make_log(2))
+    other = make_log(2)
+    other.append({"role": "user", "content": "другое"})
+    assert not log.startswith(other)
+
+
+def test_messages_read_like_dicts():
+    message = Message("user", "привет")
+    assert message["role"] == "user"
+    assert message.get("missing", "x") == "x"
+    assert message == {"role": "user", "content": "привет"}
+    assert message.to_dict() == {"role": "user", "content": "привет"}
+
+
+def test_long_texts_are_shared_and_released():
+    text = "вставленный файл " * SHARED_CONTENT_SIZE
+    first = Message("user", text)
+    second = Message("assistant", "".join(text.split("|")))
+    assert second.content is first.content
+
+    # Текст не бессмертен: без сообщений его не держит и таблица общих текстов
+    del first, second
+    gc.collect()
+    assert text not in _shared_contents
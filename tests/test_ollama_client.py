@@ -0,0 +1,212 @@
+# tests/test_ollama_client.py
+"""Тесты клиента Ollama на поддельном сервере: промпт, кэши и эмбеддинги"""
+
+import json
+import threading
+
+import pytest
+
+from core.ollama_client import OllamaClient
+from core.response_cache import ResponseCache
+from core.semantic_cache import NUMPY_AVAILABLE, SemanticCache
+
+needs_numpy = pytest.mark.skipif(not NUMPY_AVAILABLE, reason="кэш по смыслу требует numpy")
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, lines=(), body=None):
+        self.status_code = status_code
+        self._lines = lines
+        self._body = body or {}
+        self.raw = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+    def iter_lines(self):
+        for line in self._lines:
+            yield json.dumps(line).encode()
+
+    def json(self):
+        return self._body
+
+    def close(self):
+        pass
+
+
+class FakeServer:
+    """Подменяет OllamaClient._request и запоминает запросы"""
+
+    def __init__(self, reply="ответ", embedding=(1.0, 0.0), embedding_status=200):
+        self.reply = reply
+        self.embedding = embedding
+        self.embedding_status = embedding_status
+        self.requests = []
+
+    def __call__(self, method, endpoint, path, **kwargs):
+        self.requests.append((path, kwargs.get("json")))
+        if path == "/api/embeddings":
+            return FakeResponse(self.embedding_status, body={"embedding": list(self.embedding)})
+        return FakeResponse(lines=[{"message": {"content": self.reply}}, {"done": True}])
+
+    def paths(self):
+        return [path for path, _ in self.requests]
+
+    def chat_payloads(self):
+        return [payload for path, payload in self.requests if path == "/api/chat"]
+
+
+def make_client(monkeypatch, server, **kwargs):
+    client = OllamaClient(model="test", **kwargs)
+    monkeypatch.setattr(client, "_request", server)
+    return client
+
+
+def long_history(count=200):
+    return [{"role": "user" if i % 2 else "assistant", "content": "слово " * 50} for i in range(count)]
+
+
+def test_client_fits_history_with_context_tokens(monkeypatch):
+    server = FakeServer()
+    client = make_client(monkeypatch, server, context_tokens=1000)
+    assert "".join(client.generate_response(long_history())) == "ответ"
+
+    payload = server.chat_payloads()[0]
+    assert len(payload["messages"]) < 200
+    assert payload["options"]["num_ctx"] == client.context.num_ctx
+
+
+def test_client_keeps_prepared_prompt_with_num_ctx(monkeypatch):
+    # Окно уже собрал вызывающий — клиент только сообщает серверу размер контекста
+    server = FakeServer()
+    client = make_client(monkeypatch, server, num_ctx=4096)
+    history = long_history()
+    assert "".join(client.generate_response(history)) == "ответ"
+
+    payload = server.chat_payloads()[0]
+    assert len(payload["messages"]) == len(history) + 1
+    assert payload["options"]["num_ctx"] == 4096
+    assert client.context is None
+
+
+def ask(client, text, **kwargs):
+    generation = client.generate_response([{"role": "user", "content": text}], **kwargs)
+    return "".join(generation), generation
+
+
+def test_exact_cache_replays_answer(monkeypatch):
+    server = FakeServer(reply="четыре")
+    client = make_client(monkeypatch, server, cache=ResponseCache())
+
+    assert ask(client, "сколько будет 2+2")[0] == "четыре"
+    text, generation = ask(client, "сколько будет 2+2")
+    assert text == "четыре"
+    assert generation.cached == "exact"
+    assert len(server.chat_payloads()) == 1
+
+
+@needs_numpy
+def test_semantic_miss_does_not_wait_for_embedding(monkeypatch):
+    server = FakeServer(reply="столица — Париж")
+    semantic = SemanticCache()
+    client = make_client(monkeypatch, server, semantic_cache=semantic)
+
+    text, generation = ask(client, "какая столица Франции")
+    assert text == "столица — Париж"
+    assert generation.cached is None
+    # В пустой области искать нечего — до генерации эмбеддинг не запрашивается
+    assert server.paths()[0] == "/api/chat"
+
+    # Вектор для кэша считается в фоне; close() дожидается его
+    client.close()
+    assert len(semantic) == 1
+
+
+@needs_numpy
+def test_semantic_hit_replays_paraphrase(monkeypatch):
+    server = FakeServer(reply="столица — Париж")
+    semantic = SemanticCache()
+    client = make_client(monkeypatch, server, semantic_cache=semantic)
+    ask(client, "какая столица Франции")
+    client.close()
+
+    server.reply = "другой ответ"
+    text, generation = ask(client, "назови столицу Франции")
+    assert text == "столица — Париж"
+    assert generation.cached == "semantic"
+    assert generation.timing is not None
+    # Попадание находится до запроса к модели — /api/chat не вызывается
+    assert len(server.chat_payloads()) == 1
+    assert server.paths()[-1] == "/api/embeddings"
+    client.close()
+
+
+@needs_numpy
+def test_slow_embedding_falls_through_to_model(monkeypatch):
+    server = FakeServer(reply="столица — Париж")
+    semantic = SemanticCache()
+    client = make_client(monkeypatch, server, semantic_cache=semantic)
+    ask(client, "какая столица Франции")
+    client.close()
+
+    # Вектор не успел — отвечает модель, а вектор потом запоминает ответ
+    release = threading.Event()
+    embed = client.embed
+    monkeypatch.setattr(client, "embed", lambda *args: release.wait() and embed(*args))
+    monkeypatch.setattr(client, "_embed_wait", lambda: 0.01)
+    server.reply = "Париж"
+    text, generation = ask(client, "назови столицу Франции")
+    assert text == "Париж"
+    assert generation.cached is None
+    assert len(server.chat_payloads()) == 2
+
+    release.set()
+    client.close()
+    assert len(semantic) == 2
+    assert server.paths().count("/api/embeddings") == 2
+
+
+@needs_numpy
+def test_uncacheable_question_skips_caches(monkeypatch):
+    server = FakeServer()
+    semantic = SemanticCache()
+    client = make_client(monkeypatch, server, cache=ResponseCache(), semantic_cache=semantic)
+
+    ask(client, "который час", cacheable=False)
+    ask(client, "который час", cacheable=False)
+    client.close()
+    assert len(server.chat_payloads()) == 2
+    assert "/api/embeddings" not in server.paths()
+    assert len(semantic) == 0
+
+
+def test_embedding_error_is_reported_once(monkeypatch, capsys):
+    server = FakeServer(embedding_status=500)
+    client = make_client(monkeypatch, server)
+
+    assert client.embed("раз", "embed-model") is None
+    assert client.embed("два", "embed-model") is None
+    assert capsys.readouterr().out.count("Ошибка получения эмбеддинга") == 1
+
+    # После успешного запроса о новой ошибке снова сообщаем
+    server.embedding_status = 200
+    assert client.embed("три", "embed-model") == [1.0, 0.0]
+    server.embedding_status = 500
+    client.embed("четыре", "embed-model")
+    assert capsys.readouterr().out.count("Ошибка получения эмбеддинга") == 1
+
+
+def test_missing_embedding_model_is_not_asked_again(monkeypatch):
+    server = FakeServer(embedding_status=404)
+    client = make_client(monkeypatch, server)
+
+    assert client.embed("раз", "missing") is None
+    assert client.embed("два", "missing") is None
+    assert server.paths().count("/api/embeddings") == 1
@@ -0,0 +1,122 @@
+# tests/test_response_cache.py
+"""Тесты кэша ответов: вытеснение, срок жизни, журнал на диске"""
+
+import pytest
+
+import core.response_cache as response_cache
+from core.response_cache import ResponseCache, is_time_sensitive, request_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Управляемые часы кэша"""
+    now = [1_000_000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    return now
+
+
+def test_get_and_stats():
+    cache = ResponseCache()
+    assert cache.get("k") is None
+    cache.put("k", "ответ")
+    assert cache.get("k") == "ответ"
+    assert cache.stats() == {"entries": 1, "hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_least_recently_used_is_evicted():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    cache.get("a")
+    cache.put("c", "3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
+
+
+def test_size_limit():
+    cache = ResponseCache(max_bytes=10)
+    cache.put("big", "x" * 11)
+    assert len(cache) == 0
+
+    cache.put("a", "12345")
+    cache.put("b", "67890")
+    cache.put("c", "!")
+    assert cache.get("a") is None
+    assert cache.get("b") == "67890"
+
+
+def test_expired_entries_are_dropped(clock, tmp_path):
+    path = str(tmp_path / "cache.jsonl")
+    cache = ResponseCache(path, ttl=60)
+    cache.put("k", "ответ")
+    clock[0] += 30
+    assert cache.get("k") == "ответ"
+
+    clock[0] += 31
+    assert cache.get("k") is None
+    assert len(ResponseCache(path, ttl=60)) == 0
+
+
+def test_journal_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.jsonl")
+    cache = ResponseCache(path)
+    cache.put("a", "первый")
+    cache.put("b", "второй")
+
+    reopened = ResponseCache(path)
+    assert reopened.get("a") == "первый"
+    assert reopened.get("b") == "второй"
+
+
+def test_torn_line_is_skipped(tmp_path):
+    path = tmp_path / "cache.jsonl"
+    ResponseCache(str(path)).put("a", "первый")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"key": "b", "text": "обор')
+
+    assert ResponseCache(str(path)).get("a") == "первый"
+
+
+def test_journal_is_compacted(tmp_path, monkeypatch):
+    monkeypatch.setattr(response_cache, "COMPACT_MIN_BYTES", 0)
+    path = tmp_path / "cache.jsonl"
+    cache = ResponseCache(str(path), max_entries=2)
+    for i in range(20):
+        cache.put(f"k{i}", f"ответ {i}")
+
+    # Вытесненные записи не копятся в файле
+    assert len(path.read_text(encoding="utf-8").splitlines()) <= 3
+    assert ResponseCache(str(path), max_entries=2).get("k19") == "ответ 19"
+
+
+def test_write_of_another_process_is_visible(tmp_path):
+    path = str(tmp_path / "cache.jsonl")
+    first, second = ResponseCache(path), ResponseCache(path)
+    assert second.get("k") is None
+
+    first.put("k", "ответ")
+    assert second.get("k") == "ответ"
+
+    first.clear()
+    assert second.get("k") is None
+
+
+def test_request_key():
+    payload = {"model": "m", "messages": [{"role": "user", "content": "привет"}], "options": {"temperature": 0.7}}
+    assert request_key(payload) == request_key(dict(payload, stream=False))
+    assert request_key(payload) != request_key(dict(payload, options={"temperature": 0.1}))
+    assert request_key(payload) != request_key(dict(payload, model="other"))
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Какая погода в Москве?", True),
+    ("Что сейчас в новостях", True),
+    ("what time is it", True),
+    ("Latest release notes?", True),
+    ("Как отсортировать список в Python?", False),
+    ("Explain recursion", False),
+])
+def test_is_time_sensitive(text, expected):
+    assert is_time_sensitive(text) is expected
@@ -0,0 +1,71 @@
+# tests/test_search_index.py
+"""Тесты поискового индекса: слова, префиксы, фразы и сохранение между запусками"""
+
+from core.search_index import SearchIndex
+
+
+def chat(chat_id, title, *texts, timestamp="2024-01-01"):
+    return {"id": chat_id, "title": title, "timestamp": timestamp,
+            "messages": [{"role": "user", "content": text} for text in texts]}
+
+
+def make_index(*chats):
+    index = SearchIndex(None)
+    data = {c["id"]: c for c in chats}
+    index.sync(data)
+    return index, data
+
+
+def test_all_words_must_match():
+    index, chats = make_index(chat("a", "Рецепты", "борщ со сметаной"),
+                              chat("b", "Кухня", "борщ без сметаны"))
+    assert sorted(index.search("борщ", chats)) == ["a", "b"]
+    assert index.search("борщ сметаной ", chats) == ["a"]
+    assert index.search("пельмени", chats) == []
+
+
+def test_prefix_and_title_weight():
+    index, chats = make_index(chat("a", "Программирование", "текст"),
+                              chat("b", "Заметки", "программа на Python"))
+    # Последнее слово ищется по префиксу, совпадение в заголовке весит больше
+    assert index.search("програм", chats) == ["a", "b"]
+    assert index.search("прог* python", chats) == ["b"]
+
+
+def test_phrase_and_yo():
+    index, chats = make_index(chat("a", "Ёлка", "зеленая ёлка"), chat("b", "Лес", "ёлка зеленая"))
+    assert index.search('"зеленая елка"', chats) == ["a"]
+    assert sorted(index.search("елка", chats)) == ["a", "b"]
+
+
+def test_sync_reindexes_only_changed():
+    index, chats = make_index(chat("a", "Первый", "раз"), chat("b", "Второй", "два"))
+    assert index.sync(chats) == 0
+
+    chats["a"] = chat("a", "Первый", "раз", "три", timestamp="2024-01-02")
+    del chats["b"]
+    assert index.sync(chats) == 1
+    assert index.search("три", chats) == ["a"]
+    assert index.search("два", chats) == []
+
+
+def test_add_messages_and_remove():
+    index, chats = make_index(chat("a", "Чат", "начало"))
+    index.add_messages(chats["a"], [{"role": "user", "content": "продолжение"}])
+    assert index.search("продолжение", chats) == ["a"]
+
+    index.remove_chat("a")
+    assert index.search("начало", chats) == []
+
+
+def test_saved_index_survives_restart(tmp_path):
+    path = str(tmp_path / "memory.index")
+    chats = {"a": chat("a", "Погода", "зонтик")}
+    index = SearchIndex(path)
+    index.sync(chats)
+    index.save()
+
+    reopened = SearchIndex(path)
+    assert reopened.load()
+    assert reopened.sync(chats) == 0
+    assert reopened.search("зонтик", chats) == ["a"]
@@ -0,0 +1,66 @@
+# tests/test_semantic_cache.py
+"""Тесты кэша по смыслу: поиск по близости внутри области и журнал векторов"""
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from core.semantic_cache import SemanticCache, semantic_query, semantic_scope  # noqa: E402
+
+
+def payload(*messages, model="m"):
+    return {"model": model, "messages": list(messages), "options": {"temperature": 0.7}}
+
+
+def user(text):
+    return {"role": "user", "content": text}
+
+
+def test_semantic_query_only_for_standalone_questions():
+    system = {"role": "system", "content": "Ты Джарвис"}
+    assert semantic_query(payload(system, user("  что такое DNS  "))) == "что такое DNS"
+    assert semantic_query(payload(user("а почему?"), {"role": "assistant", "content": "..."},
+                                  user("почему"))) is None
+    assert semantic_query(payload(user("   "))) is None
+
+
+def test_scope_separates_models_and_system_prompts():
+    question = user("что такое DNS")
+    base = semantic_scope(payload(question), "embed")
+    assert base == semantic_scope(payload(user("другой вопрос")), "embed")
+    assert base != semantic_scope(payload(question, model="other"), "embed")
+    assert base != semantic_scope(payload({"role": "system", "content": "x"}, question), "embed")
+    assert base != semantic_scope(payload(question), "other-embed")
+
+
+def test_close_question_hits_within_scope():
+    cache = SemanticCache(threshold=0.9)
+    cache.add("scope", "что такое DNS", [1.0, 0.0, 0.0], "система доменных имен")
+
+    assert cache.has_scope("scope")
+    assert not cache.has_scope("other")
+    assert cache.find("scope", [0.95, 0.1, 0.0]) == "система доменных имен"
+    assert cache.find("scope", [0.0, 1.0, 0.0]) is None
+    assert cache.find("other", [1.0, 0.0, 0.0]) is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_best_match_wins():
+    cache = SemanticCache(threshold=0.5)
+    cache.add("scope", "первый", [1.0, 0.0], "ответ 1")
+    cache.add("scope", "второй", [0.0, 1.0], "ответ 2")
+    assert cache.find("scope", [0.2, 0.9]) == "ответ 2"
+
+
+def test_mismatched_dimensions_are_ignored():
+    cache = SemanticCache(threshold=0.5)
+    cache.add("scope", "вопрос", [1.0, 0.0], "ответ")
+    assert cache.find("scope", [1.0, 0.0, 0.0]) is None
+
+
+def test_vectors_survive_restart(tmp_path):
+    path = str(tmp_path / "semantic.jsonl")
+    SemanticCache(path).add("scope", "что такое DNS", [0.6, 0.8], "система доменных имен")
+
+    reopened = SemanticCache(path)
+    assert reopened.find("scope", [0.6, 0.8]) == "система доменных имен"
@@ -0,0 +1,196 @@
+# tests/test_storage.py
+"""Тесты хранилищ: журнал и снимок JSON, триггеры SQLite, слияние изменений двух процессов"""
+
+import json
+import sqlite3
+
+import pytest
+
+from core.blobs import content_hash
+from core.messages import SHARED_CONTENT_SIZE
+from core.statistics import empty_statistics
+from core.storage import JsonStorage, SqliteStorage
+
+LONG_TEXT = "вставленный файл " * (SHARED_CONTENT_SIZE // 8)
+
+
+def empty_data():
+    return {"chats": {}, "settings": {}, "statistics": empty_statistics()}
+
+
+def message(text, role="user"):
+    return {"role": role, "content": text}
+
+
+def put_chat(chat_id, *texts):
+    return {"op": "put_chat", "chat": {"id": chat_id, "title": chat_id, "timestamp": "2024-01-01T00:00:00",
+                                       "messages": [message(text) for text in texts]}}
+
+
+def commit(storage, data, record):
+    storage.prepare(data, record)
+    storage.write([record])
+
+
+def open_json(path, **kwargs):
+    return JsonStorage(str(path / "memory.json"), str(path / "memory.journal"),
+                       chats_dir=str(path / "chats"), **kwargs)
+
+
+def open_sqlite(path, **kwargs):
+    return SqliteStorage(str(path / "memory.db"), **kwargs)
+
+
+def open_storage(kind, path, **kwargs):
+    storage = open_json(path, **kwargs) if kind == "json" else open_sqlite(path, **kwargs)
+    data = storage.load()
+    if data is None:
+        data = empty_data()
+        storage.save(data)
+    return storage, data
+
+
+# ================= ЖУРНАЛ И СНИМОК JSON =================
+
+def test_json_journal_replays_after_restart(tmp_path):
+    storage, data = open_storage("json", tmp_path)
+    commit(storage, data, put_chat("c1", "привет"))
+    commit(storage, data, {"op": "update_chat", "id": "c1", "append": [message("ответ", "assistant")]})
+    commit(storage, data, {"op": "set_setting", "key": "theme", "value": "dark"})
+
+    reopened, loaded = open_storage("json", tmp_path)
+    assert loaded["chats"]["c1"]["message_count"] == 2
+    assert loaded["settings"]["theme"] == "dark"
+    assert "messages" not in loaded["chats"]["c1"]
+    assert reopened.load_messages("c1") == [message("привет"), message("ответ", "assistant")]
+
+
+def test_json_journal_compacts_into_snapshot(tmp_path):
+    storage, data = open_storage("json", tmp_path, compact_records=3)
+    for i in range(3):
+        commit(storage, data, put_chat(f"c{i}", f"вопрос {i}"))
+    assert storage.needs_compaction()
+
+    storage.save(data)
+    assert not storage.needs_compaction()
+    assert not (tmp_path / "memory.journal").exists()
+
+    _, loaded = open_storage("json", tmp_path)
+    assert set(loaded["chats"]) == {"c0", "c1", "c2"}
+
+
+def test_json_skips_torn_journal_line(tmp_path):
+    storage, data = open_storage("json", tmp_path)
+    commit(storage, data, put_chat("c1", "привет"))
+    with open(tmp_path / "memory.journal", "a", encoding="utf-8") as f:
+        f.write('{"op": "put_chat", "chat": {"id": "c2"')
+
+    _, loaded = open_storage("json", tmp_path)
+    assert set(loaded["chats"]) == {"c1"}
+
+
+def test_json_recovers_corrupt_snapshot_from_backup(tmp_path):
+    storage, data = open_storage("json", tmp_path)
+    commit(storage, data, put_chat("c1", "привет"))
+    storage.save(data)
+    storage.save(data)
+    (tmp_path / "memory.json").write_text("{обрезано", encoding="utf-8")
+
+    _, loaded = open_storage("json", tmp_path)
+    assert set(loaded["chats"]) == {"c1"}
+    assert list(tmp_path.glob("memory.json.corrupt-*"))
+
+
+def test_json_shared_text_is_stored_once(tmp_path):
+    storage, data = open_storage("json", tmp_path)
+    commit(storage, data, put_chat("c1", LONG_TEXT))
+    commit(storage, data, put_chat("c2", LONG_TEXT, "короткий"))
+    assert len(storage.blobs) == 1
+
+    commit(storage, data, {"op": "delete_chat", "id": "c1"})
+    assert len(storage.blobs) == 1
+    assert storage.load_messages("c2")[0]["content"] == LONG_TEXT
+
+    commit(storage, data, {"op": "delete_chat", "id": "c2"})
+    assert len(storage.blobs) == 0
+
+
+# ================= SQLITE =================
+
+def blob_refs(path):
+    with sqlite3.connect(str(path / "memory.db")) as conn:
+        return dict(conn.execute("SELECT hash, refs FROM blobs"))
+
+
+def test_sqlite_triggers_count_blob_refs(tmp_path):
+    storage, data = open_storage("sqlite", tmp_path)
+    blob = content_hash(LONG_TEXT)
+    commit(storage, data, put_chat("c1", LONG_TEXT))
+    commit(storage, data, put_chat("c2", LONG_TEXT, LONG_TEXT))
+    assert blob_refs(tmp_path) == {blob: 3}
+
+    # Переписанные сообщения освобождают прежние ссылки
+    commit(storage, data, {"op": "update_chat", "id": "c2", "messages": [message("короткий")]})
+    assert blob_refs(tmp_path) == {blob: 1}
+
+    commit(storage, data, {"op": "update_chat", "id": "c1", "append": [message(LONG_TEXT)]})
+    assert blob_refs(tmp_path) == {blob: 2}
+    assert storage.load_messages("c1") == [message(LONG_TEXT), message(LONG_TEXT)]
+
+    commit(storage, data, {"op": "delete_chat", "id": "c1"})
+    assert blob_refs(tmp_path) == {}
+
+
+def test_sqlite_full_save_keeps_refs(tmp_path):
+    storage, data = open_storage("sqlite", tmp_path)
+    commit(storage, data, put_chat("c1", LONG_TEXT))
+    data["chats"]["c1"]["messages"].append(message(LONG_TEXT))
+    storage.save(data)
+    assert blob_refs(tmp_path) == {content_hash(LONG_TEXT): 2}
+
+
+def test_sqlite_statistics_written_with_batch(tmp_path):
+    storage, data = open_storage("sqlite", tmp_path)
+    commit(storage, data, put_chat("c1", "а", "б"))
+
+    _, loaded = open_storage("sqlite", tmp_path)
+    assert loaded["statistics"]["total_chats"] == 1
+    assert loaded["statistics"]["total_messages"] == 2
+
+
+# ================= ДВА ПРОЦЕССА =================
+
+@pytest.mark.parametrize("kind", ["json", "sqlite"])
+def test_rebase_on_external_change(tmp_path, kind):
+    reloaded = []
+    first, first_data = open_storage(kind, tmp_path)
+    second, second_data = open_storage(kind, tmp_path, on_reload=reloaded.append)
+
+    commit(first, first_data, put_chat("c1", "от первого"))
+
+    # Второй процесс меняет память, не зная о записи первого
+    record = put_chat("c2", "от второго")
+    second.prepare(second_data, record)
+    second.write([record])
+
+    # Перед записью второй перечитал диск и положил свое изменение поверх
+    assert len(reloaded) == 1
+    assert set(reloaded[0]["chats"]) == {"c1", "c2"}
+    assert reloaded[0]["statistics"]["total_chats"] == 2
+
+    _, loaded = open_storage(kind, tmp_path)
+    assert set(loaded["chats"]) == {"c1", "c2"}
+
+
+def test_json_rebase_recounts_appended_messages(tmp_path):
+    first, first_data = open_storage("json", tmp_path)
+    commit(first, first_data, put_chat("c1", "вопрос"))
+    second, second_data = open_storage("json", tmp_path, on_reload=lambda data: None)
+
+    commit(first, first_data, {"op": "update_chat", "id": "c1", "append": [message("первый")]})
+    commit(second, second_data, {"op": "update_chat", "id": "c1", "append": [message("второй")]})
+
+    reopened, loaded = open_storage("json", tmp_path)
+    assert loaded["chats"]["c1"]["message_count"] == 3
+    assert [m["content"] for m in reopened.load_messages("c1")] == ["вопрос", "первый", "второй"]
+    assert json.loads((tmp_path / "memory.journal").read_text(encoding="utf-8").splitlines()[-1])["message_count"] == 3
@@ -8,7 +8,9 @@ import uuid
 import customtkinter as ctk
 import tkinter as tk
 from typing import Dict, List, Any, Optional
-from memory import load_memory, save_memory
+from utils.sidebar import SidebarList
+from memory import (get_memory_store, add_chat, update_chat, delete_chat, clear_chats, search_chats, get_chat,
+                    get_message_count, get_recent_chats)
 
 class ChatHistoryManager:
     def __init__(self, sidebar_frame, chat_list_frame, chat_title_label, theme_colors):
@@ -26,61 +28,90 @@ class ChatHistoryManager:
         self.chat_title_label = chat_title_label
         self.colors = theme_colors
         
-        self.memory = load_memory()
-        self.chat_buttons = {}
+        # Общая память процесса — та же, что у главного окна
+        self.store = get_memory_store()
+        self.memory = self.store.data
         self.active_chat_frame = None
+        self._refresh_pending = False
+        self._row_labels = {}  # chat_id -> (кнопка чата, строка с временем)
+        
+        # Строки сайдбара обновляются по разнице, а не пересоздаются
+        self.sidebar_list = SidebarList(
+            self.chat_list_frame,
+            create_row=self._add_chat_to_sidebar,
+            update_row=self._update_chat_row,
+            signature=self._row_signature,
+            create_empty=self._create_empty_label,
+            pack_options={"fill": "x", "pady": 1}
+        )
+        self.chat_buttons = self.sidebar_list.rows  # chat_id -> фрейм строки
         
         if "chats" not in self.memory:
             self.memory["chats"] = {}
+        
+        # Сайдбар обновляется при любом изменении чатов, кто бы его ни внес
+        self.unsubscribe = self.store.subscribe(self._on_memory_changed)
+    
+    def _on_memory_changed(self, event: Dict[str, Any]):
+        """Память изменилась (возможно, не в главном потоке) — обновим сайдбар в следующем кадре"""
+        if event.get("op") in ("set_setting", "add_counters", "upgrade_chat") or self._refresh_pending:
+            return
+        self._refresh_pending = True
+        try:
+            self.chat_list_frame.after(0, self._refresh_history)
+        except (tk.TclError, RuntimeError):
+            self._refresh_pending = False
+    
+    def _refresh_history(self):
+        self._refresh_pending = False
+        self.load_chat_history()
     
     def load_chat_history(self):
         """Загрузить историю чатов в сайдбар"""
-        # Очищаем текущий список
-        for widget in self.chat_list_frame.winfo_children():
-            widget.destroy()
+        # Последние чаты (новые сверху), не больше 15
+        recent_chats = get_recent_chats(self.memory, 15)
+        self.sidebar_list.update(list(recent_chats.items()))
         
-        # Получаем список чатов
-        chats = self.memory.get("chats", {})
-        
-        if not chats:
-            # Показываем сообщение, если нет истории
-            empty_label = ctk.CTkLabel(
-                self.chat_list_frame,
-                text="Нет сохраненных чатов",
-                font=("Segoe UI", 11),
-                text_color=self.colors["TEXT_SECONDARY"]
-            )
-            empty_label.pack(pady=20)
-            return
-        
-        # Сортируем чаты по дате (новые сверху)
-        sorted_chats = sorted(
-            chats.items(),
-            key=lambda x: x[1].get("timestamp", ""),
-            reverse=True
+        # Забываем виджеты удаленных строк
+        for chat_id in [cid for cid in self._row_labels if cid not in self.chat_buttons]:
+            del self._row_labels[chat_id]
+    
+    def _create_empty_label(self, parent):
+        """Показываем сообщение, если нет истории"""
+        empty_label = ctk.CTkLabel(
+            parent,
+            text="Нет сохраненных чатов",
+            font=("Segoe UI", 11),
+            text_color=self.colors["TEXT_SECONDARY"]
         )
-        
-        # Ограничиваем количество отображаемых чатов
-        for chat_id, chat_data in sorted_chats[:15]:
-            self._add_chat_to_sidebar(chat_id, chat_data)
+        empty_label.pack(pady=20)
+        return empty_label
     
-    def _add_chat_to_sidebar(self, chat_id: str, chat_data: Dict[str, Any]):
-        """Добавить чат в сайдбар"""
+    def _row_signature(self, chat_data: Dict[str, Any]):
+        """Что показывает строка чата (если не изменилось — строку не трогаем)"""
+        return (chat_data.get("title", "Беседа"), chat_data.get("timestamp", ""), get_message_count(chat_data))
+    
+    def _row_texts(self, chat_data: Dict[str, Any]):
+        """Тексты кнопки и строки с информацией"""
         title = chat_data.get("title", "Беседа")
-        timestamp = chat_data.get("timestamp", "")
-        message_count = len(chat_data.get("messages", []))
-        
-        # Форматируем время
-        time_str = self._format_timestamp(timestamp)
+        time_str = self._format_timestamp(chat_data.get("timestamp", ""))
+        message_count = get_message_count(chat_data)
+        return (
+            f"💬 {title[:25]}{'...' if len(title) > 25 else ''}",
+            f"{time_str} • {message_count} сообщ."
+        )
+    
+    def _add_chat_to_sidebar(self, parent, chat_id: str, chat_data: Dict[str, Any]):
+        """Создать строку чата в сайдбаре"""
+        button_text, info_text = self._row_texts(chat_data)
         
         # Создаем фрейм для кнопки чата
-        chat_btn_frame = ctk.CTkFrame(self.chat_list_frame, fg_color="transparent", height=44)
-        chat_btn_frame.pack(fill="x", pady=1)
+        chat_btn_frame = ctk.CTkFrame(parent, fg_color="transparent", height=44)
         
         # Основная кнопка чата
         chat_btn = ctk.CTkButton(
             chat_btn_frame,
-            text=f"💬 {title[:25]}{'...' if len(title) > 25 else ''}",
+            text=button_text,
             width=200,
             height=36,
             fg_color="transparent",
@@ -111,15 +142,23 @@ class ChatHistoryManager:
         info_frame = ctk.CTkFrame(chat_btn_frame, fg_color="transparent")
         info_frame.pack(fill="x", padx=(10, 0))
         
-        ctk.CTkLabel(
+        info_label = ctk.CTkLabel(
             info_frame,
-            text=f"{time_str} • {message_count} сообщ.",
+            text=info_text,
             font=("Segoe UI", 9),
             text_color=self.colors["TEXT_SECONDARY"]
-        ).pack(anchor="w")
+        )
+        info_label.pack(anchor="w")
         
-        # Сохраняем ссылку на кнопку
-        self.chat_buttons[chat_id] = chat_btn_frame
+        self._row_labels[chat_id] = (chat_btn, info_label)
+        return chat_btn_frame
+    
+    def _update_chat_row(self, chat_btn_frame, chat_id: str, chat_data: Dict[str, Any]):
+        """Обновить надписи строки чата"""
+        button_text, info_text = self._row_texts(chat_data)
+        chat_btn, info_label = self._row_labels[chat_id]
+        chat_btn.configure(text=button_text)
+        info_label.configure(text=info_text)
     
     def _format_timestamp(self, timestamp: str) -> str:
         """Форматировать временную метку"""
@@ -165,27 +204,21 @@ class ChatHistoryManager:
             )
             title = self.generate_chat_title(first_user_msg)
         
-        # Сохраняем чат
-        self.memory["chats"][chat_id] = {
-            "id": chat_id,
-            "title": title,
-            "timestamp": datetime.datetime.now().isoformat(),
-            "messages": messages.copy(),
-            "think_mode": think_mode
-        }
-        
-        # Сохраняем в файл
-        save_memory(self.memory)
+        # Сохраняем чат (в журнал пишутся только изменения)
+        if chat_id in self.memory["chats"]:
+            update_chat(self.memory, chat_id, messages=messages, title=title, think_mode=think_mode)
+        else:
+            add_chat(self.memory, chat_id, title, messages, think_mode)
         
         return chat_id
     
     def load_saved_chat(self, chat_id: str) -> Optional[Dict[str, Any]]:
         """Загрузить сохраненный чат"""
-        if chat_id not in self.memory["chats"]:
+        # Сообщения подгружаются с диска только сейчас (архивный чат возвращается в память)
+        chat_data = get_chat(self.memory, chat_id)
+        if chat_data is None:
             return None
         
-        chat_data = self.memory["chats"][chat_id]
-        
         # Обновляем заголовок
         self.chat_title_label.configure(text=chat_data.get("title", "Загруженный чат"))
         
@@ -211,15 +244,8 @@ class ChatHistoryManager:
     def delete_chat(self, chat_id: str) -> bool:
         """Удалить чат из истории"""
         if chat_id in self.memory["chats"]:
-            # Удаляем из памяти
-            del self.memory["chats"][chat_id]
-            
-            # Сохраняем изменения
-            save_memory(self.memory)
-            
-            # Обновляем сайдбар
-            self.load_chat_history()
-            
+            # Удаляем из памяти; сайдбар обновится по уведомлению
+            delete_chat(self.memory, chat_id)
             return True
         return False
     
@@ -228,13 +254,8 @@ class ChatHistoryManager:
         if not self.memory["chats"]:
             return False
         
-        self.memory["chats"] = {}
-        save_memory(self.memory)
-        
-        # Обновляем UI
-        self.chat_buttons.clear()
-        self.load_chat_history()
-        
+        # Сайдбар обновится по уведомлению
+        clear_chats(self.memory)
         return True
     
     def get_chat_count(self) -> int:
@@ -242,20 +263,5 @@ class ChatHistoryManager:
         return len(self.memory.get("chats", {}))
     
     def search_chats(self, query: str) -> List[Dict[str, Any]]:
-        """Поиск чатов по тексту"""
-        results = []
-        query_lower = query.lower()
-        
-        for chat_id, chat_data in self.memory.get("chats", {}).items():
-            # Ищем в заголовке
-            if query_lower in chat_data.get("title", "").lower():
-                results.append(chat_data)
-                continue
-            
-            # Ищем в сообщениях
-            for message in chat_data.get("messages", []):
-                if query_lower in message.get("content", "").lower():
-                    results.append(chat_data)
-                    break
-        
-        return results
\ No newline at end of file
+        """Поиск чатов по тексту (включая архив)"""
+        return list(search_chats(self.memory, query, include_archived=True).values())
\ No newline at end of file
@@ -0,0 +1,154 @@
+# utils/file_utils.py
+"""
+Надежная запись файлов: временный файл + fsync + атомарная замена
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import List, Optional
+
+# Межпроцессная блокировка: fcntl на POSIX, msvcrt на Windows
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+def fsync_directory(path: str):
+    """Сбросить на диск запись каталога (переименования), где это возможно"""
+    if os.name != "posix":
+        return
+    directory = os.path.dirname(os.path.abspath(path))
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def atomic_write_text(path: str, text: str, encoding: str = "utf-8"):
+    """
+    Атомарно записать текст в файл
+
+    Файл либо остается старым, либо целиком заменяется новым —
+    сбой посреди записи не оставит его обрезанным.
+    """
+    _atomic_write(path, 'w', text, encoding)
+
+def atomic_write_bytes(path: str, data: bytes):
+    """Атомарно записать байты в файл (например, сжатые данные)"""
+    _atomic_write(path, 'wb', data, None)
+
+def _atomic_write(path: str, mode: str, content, encoding):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, mode, encoding=encoding) as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    fsync_directory(path)
+
+def backup_paths(path: str, count: int) -> List[str]:
+    """Пути резервных копий: path.1 (новейшая) ... path.count"""
+    return [f"{path}.{i}" for i in range(1, count + 1)]
+
+def rotate_backups(path: str, count: int):
+    """
+    Сдвинуть резервные копии и сохранить текущий файл как path.1
+
+    Вызывается перед заменой файла новой версией.
+    """
+    if count <= 0 or not os.path.exists(path):
+        return
+
+    backups = backup_paths(path, count)
+    for older, newer in zip(reversed(backups[1:]), reversed(backups[:-1])):
+        if os.path.exists(newer):
+            os.replace(newer, older)
+
+    # Жесткая ссылка ничего не копирует; если ФС не умеет — копируем
+    try:
+        os.link(path, backups[0])
+    except OSError:
+        shutil.copy2(path, backups[0])
+
+
+class FileLock:
+    def __init__(self, path: str, timeout: Optional[float] = None):
+        """
+        Рекомендательная блокировка между процессами на отдельном файле
+
+        Блокировка снимается сама, если процесс завершится. Внутри процесса
+        ее можно брать повторно (считается вложенность).
+
+        Args:
+            path: Файл блокировки (создается при необходимости)
+            timeout: Сколько ждать чужую блокировку (None — без ограничения)
+        """
+        self.path = path
+        self.timeout = timeout
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd: Optional[int] = None
+
+    def acquire(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                self._fd = self._lock_file()
+            except BaseException:
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            fd, self._fd = self._fd, None
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                else:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            finally:
+                os.close(fd)
+        self._thread_lock.release()
+
+    def _lock_file(self) -> int:
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while True:
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                return fd
+            except OSError:
+                if deadline is not None and time.monotonic() >= deadline:
+                    os.close(fd)
+                    raise TimeoutError(f"{self.path} занят другим процессом")
+                time.sleep(0.05)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
@@ -6,6 +6,7 @@
 import customtkinter as ctk
 import tkinter as tk
 from typing import Optional, Dict, List, Any, Callable
+from core.messages import MessageLog
 
 class MessageManager:
     def __init__(self, chat_scroll_frame, theme_colors):
@@ -18,7 +19,7 @@ class MessageManager:
         """
         self.chat_scroll = chat_scroll_frame
         self.colors = theme_colors
-        self.current_chat = []
+        self.current_chat = MessageLog()
     
     def add_user_message(self, text: str, from_history: bool = False):
         """Добавить сообщение пользователя"""
@@ -103,17 +104,17 @@ class MessageManager:
         try:
             for widget in self.chat_scroll.winfo_children():
                 widget.destroy()
-            self.current_chat = []
+            self.current_chat = MessageLog()
         except tk.TclError:
             pass
     
-    def get_current_chat(self) -> List[Dict[str, str]]:
-        """Получить текущий чат"""
-        return self.current_chat.copy()
+    def get_current_chat(self) -> MessageLog:
+        """Получить текущий чат (снимок за O(1))"""
+        return self.current_chat.snapshot()
     
     def set_current_chat(self, messages: List[Dict[str, str]]):
         """Установить текущий чат"""
-        self.current_chat = messages.copy()
+        self.current_chat = MessageLog(messages)
     
     def add_message(self, role: str, content: str, from_history: bool = False):
         """Добавить сообщение с указанной ролью"""
@@ -0,0 +1,126 @@
+# utils/renderer.py
+"""
+Пакетный вывод текста ответа в Label с ограничением частоты кадров
+"""
+
+import threading
+import tkinter as tk
+from typing import Callable, List, Optional
+
+class BatchedRenderer:
+    def __init__(self, scheduler, label, fps: int = 60,
+                 on_frame: Optional[Callable[[], None]] = None,
+                 on_done: Optional[Callable[[str], None]] = None,
+                 transform: Optional[Callable[[str], str]] = None,
+                 cursor: str = "▌"):
+        """
+        Инициализация рендерера
+
+        Args:
+            scheduler: Объект с методом after(ms, func) (обычно окно Tk)
+            label: Виджет с методом configure(text=...)
+            fps: Частота кадров
+            on_frame: Вызывается не чаще раза в кадр после обновления текста (прокрутка)
+            on_done: Вызывается с итоговым текстом по завершении
+            transform: Преобразование итогового текста (например, parse_markdown)
+            cursor: Курсор, который показывается, пока ответ не завершен
+        """
+        self.scheduler = scheduler
+        self.label = label
+        self.frame_ms = max(1, int(1000 / fps))
+        self.on_frame = on_frame
+        self.on_done = on_done
+        self.transform = transform
+        self.cursor = cursor
+
+        self._lock = threading.Lock()
+        self._pending: List[str] = []
+        self._finished = False
+        self._cancelled = False
+        self._text = ""
+
+        # Режим печатной машинки: исходный текст и скорость раскрытия
+        self._source = ""
+        self._source_pos = 0
+        self._chars_per_frame = 0
+
+    @property
+    def text(self) -> str:
+        """Уже выведенный текст"""
+        return self._text
+
+    def feed(self, chunk: str):
+        """Добавить часть текста (можно вызывать из любого потока)"""
+        if not chunk:
+            return
+        with self._lock:
+            self._pending.append(chunk)
+
+    def finish(self):
+        """Отметить, что больше частей не будет (можно вызывать из любого потока)"""
+        with self._lock:
+            self._finished = True
+
+    def cancel(self):
+        """Остановить вывод без вызова on_done"""
+        with self._lock:
+            self._cancelled = True
+
+    def typewrite(self, text: str, chars_per_second: int = 100):
+        """Вывести готовый текст с эффектом печати, но пакетами раз в кадр"""
+        self._source = text
+        self._source_pos = 0
+        self._chars_per_frame = max(1, round(chars_per_second * self.frame_ms / 1000))
+        self.finish()
+        self.start()
+
+    def start(self):
+        """Запустить кадровый цикл (из главного потока)"""
+        self.scheduler.after(0, self._loop)
+
+    def _loop(self):
+        if self.tick():
+            self.scheduler.after(self.frame_ms, self._loop)
+
+    def tick(self) -> bool:
+        """
+        Обработать один кадр
+
+        Returns:
+            True, если нужны следующие кадры
+        """
+        with self._lock:
+            if self._cancelled:
+                return False
+            chunks = self._pending
+            self._pending = []
+            finished = self._finished
+
+        if self._source_pos < len(self._source):
+            end = self._source_pos + self._chars_per_frame
+            chunks.append(self._source[self._source_pos:end])
+            self._source_pos = end
+
+        done = finished and self._source_pos >= len(self._source)
+
+        try:
+            if done:
+                self._text += "".join(chunks)
+                final = self.transform(self._text) if self.transform else self._text
+                self.label.configure(text=final)
+                if self.on_frame:
+                    self.on_frame()
+                if self.on_done:
+                    self.on_done(final)
+                return False
+
+            if chunks:
+                self._text += "".join(chunks)
+                self.label.configure(text=self._text + self.cursor)
+                if self.on_frame:
+                    self.on_frame()
+        except tk.TclError:
+            # Виджет уже уничтожен
+            return False
+
+        return True
@@ -0,0 +1,114 @@
+# utils/sidebar.py
+"""
+Список чатов в сайдбаре, обновляемый по разнице, а не пересозданием
+"""
+
+import tkinter as tk
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+class SidebarList:
+    def __init__(self, parent,
+                 create_row: Callable[[Any, str, Any], Any],
+                 update_row: Optional[Callable[[Any, str, Any], None]] = None,
+                 signature: Optional[Callable[[Any], Hashable]] = None,
+                 create_empty: Optional[Callable[[Any], Any]] = None,
+                 pack_options: Optional[Dict[str, Any]] = None):
+        """
+        Инициализация списка
+
+        Args:
+            parent: Контейнер для строк (обычно CTkScrollableFrame)
+            create_row: Создает виджет строки (parent, key, item), упаковывать не нужно
+            update_row: Обновляет надписи существующей строки (widget, key, item)
+            signature: То, что строка показывает; строка обновляется, только если оно изменилось
+            create_empty: Создает заглушку для пустого списка (parent)
+            pack_options: Параметры pack для строк
+        """
+        self.parent = parent
+        self.create_row = create_row
+        self.update_row = update_row
+        self.signature = signature or (lambda item: item)
+        self.create_empty = create_empty
+        self.pack_options = pack_options or {"fill": "x", "pady": 2}
+
+        self.rows: Dict[str, Any] = {}  # key -> виджет строки
+        self._order: List[str] = []  # Порядок строк на экране
+        self._signatures: Dict[str, Hashable] = {}
+        self._empty_widget = None
+
+    def update(self, items: List[Tuple[str, Any]]):
+        """
+        Показать новый список строк
+
+        Удаляются, создаются, переставляются и обновляются только те
+        строки, которые изменились — остальные виджеты не трогаются.
+
+        Args:
+            items: Пары (key, item) в порядке отображения
+        """
+        try:
+            self._apply(items)
+        except tk.TclError:
+            pass
+
+    def clear(self):
+        """Удалить все строки"""
+        self.update([])
+
+    def _apply(self, items: List[Tuple[str, Any]]):
+        new_keys = [key for key, _ in items]
+        keep = set(new_keys)
+
+        # Удаляем исчезнувшие строки
+        for key in [key for key in self._order if key not in keep]:
+            self.rows.pop(key).destroy()
+            self._signatures.pop(key, None)
+        self._order = [key for key in self._order if key in keep]
+
+        self._set_empty(not items)
+
+        for index, (key, item) in enumerate(items):
+            signature = self.signature(item)
+            widget = self.rows.get(key)
+
+            if widget is None:
+                widget = self.rows[key] = self.create_row(self.parent, key, item)
+                self._signatures[key] = signature
+                self._place(widget, index)
+                self._order.insert(index, key)
+                continue
+
+            if self._signatures.get(key) != signature:
+                if self.update_row:
+                    self.update_row(widget, key, item)
+                else:
+                    # Обновлять на месте не умеем — пересоздаем одну строку
+                    widget.destroy()
+                    widget = self.rows[key] = self.create_row(self.parent, key, item)
+                    self._order.remove(key)
+                    self._place(widget, index)
+                    self._order.insert(index, key)
+                self._signatures[key] = signature
+
+            if self._order[index] != key:
+                # Строка сдвинулась: переставляем ее, не пересоздавая
+                self._order.remove(key)
+                self._place(widget, index)
+                self._order.insert(index, key)
+
+    def _place(self, widget, index: int):
+        """Упаковать строку так, чтобы она оказалась на позиции index"""
+        if index < len(self._order):
+            widget.pack(**self.pack_options, before=self.rows[self._order[index]])
+        elif self._order:
+            widget.pack(**self.pack_options, after=self.rows[self._order[-1]])
+        else:
+            widget.pack(**self.pack_options)
+
+    def _set_empty(self, empty: bool):
+        """Показать или убрать заглушку пустого списка"""
+        if empty and self._empty_widget is None and self.create_empty:
+            self._empty_widget = self.create_empty(self.parent)
+        elif not empty and self._empty_widget is not None:
+            self._empty_widget.destroy()
+            self._empty_widget = None
@@ -0,0 +1,403 @@
+# utils/transcript.py
+"""
+Виртуализированная лента сообщений чата
+
+Хранит модель всех сообщений, а виджеты создает только для видимой
+области (плюс небольшой запас) и переиспользует их при прокрутке.
+"""
+
+import bisect
+import math
+import customtkinter as ctk
+import tkinter as tk
+from typing import Dict, List, Any, Optional
+
+# Примерные метрики для оценки высоты еще не созданных пузырей
+LINE_HEIGHT = 18
+CHAR_WIDTH = 7
+BUBBLE_PADDING = 24 + 4  # pady=12 сверху и снизу + рамка
+
+# Внешние отступы (сверху, снизу) для каждого типа сообщения
+MESSAGE_PADDING = {
+    "user": (10, 5),
+    "assistant": (5, 10),
+    "thinking": (5, 10),
+}
+
+class ChatTranscript(ctk.CTkFrame):
+    OVERSCAN = 4  # Сколько сообщений держать за пределами экрана
+    PADX = 20
+
+    def __init__(self, master, theme_colors: Dict[str, str], wraplength: int = 500,
+                 scrollbar_button_color: Optional[str] = None,
+                 scrollbar_button_hover_color: Optional[str] = None, **kwargs):
+        """
+        Инициализация ленты
+
+        Args:
+            master: Родительский виджет
+            theme_colors: Цвета темы
+            wraplength: Ширина переноса текста в пузыре
+        """
+        super().__init__(master, fg_color=theme_colors["CHAT_BG"], **kwargs)
+        self.colors = theme_colors
+        self.wraplength = wraplength
+
+        self.canvas = tk.Canvas(
+            self,
+            bg=theme_colors["CHAT_BG"],
+            highlightthickness=0,
+            bd=0,
+            yscrollincrement=20
+        )
+        scrollbar_kwargs = {}
+        if scrollbar_button_color:
+            scrollbar_kwargs["button_color"] = scrollbar_button_color
+        if scrollbar_button_hover_color:
+            scrollbar_kwargs["button_hover_color"] = scrollbar_button_hover_color
+        self.scrollbar = ctk.CTkScrollbar(self, command=self.canvas.yview, **scrollbar_kwargs)
+        self.canvas.configure(yscrollcommand=self._on_yscroll)
+
+        self.scrollbar.pack(side="right", fill="y")
+        self.canvas.pack(side="left", fill="both", expand=True)
+
+        self._items: List[Dict[str, Any]] = []
+        self._offsets: List[int] = []
+        self._total_height = 0
+        self._materialized: List[Dict[str, Any]] = []
+        self._pools: Dict[str, List[Dict[str, Any]]] = {role: [] for role in MESSAGE_PADDING}
+        self._placeholder = None
+        self._placeholder_window = None
+        self._render_pending = False
+        self._width = 1
+
+        self.canvas.bind("<Configure>", self._on_configure)
+        self._bind_wheel(self.canvas)
+
+    # ================= PUBLIC API =================
+
+    def set_messages(self, messages: List[Dict[str, str]]):
+        """Показать сообщения из истории (виджеты создаются только для видимых)"""
+        self.clear()
+        for msg in messages:
+            role = msg.get("role")
+            if role in ("user", "assistant"):
+                self._items.append(self._make_item(role, msg.get("content", "")))
+        self._relayout()
+        self.scroll_to_bottom()
+
+    def add_message(self, role: str, text: str = "", live: bool = False) -> Optional[ctk.CTkLabel]:
+        """
+        Добавить сообщение в конец ленты
+
+        Args:
+            role: user, assistant или thinking
+            text: Текст сообщения
+            live: Текст будет меняться (стриминг) — пузырь не переиспользуется
+
+        Returns:
+            Label пузыря
+        """
+        self._remove_placeholder()
+
+        item = self._make_item(role, text, live)
+        self._items.append(item)
+        self._relayout(len(self._items) - 1)
+
+        try:
+            self._acquire(item)
+            self._measure([item])
+            self.scroll_to_bottom()
+            return item["bubble"]["label"]
+        except tk.TclError:
+            return None
+
+    def finalize(self, label, text: str):
+        """Зафиксировать итоговый текст «живого» сообщения"""
+        item = self._find_by_label(label)
+        if item is None:
+            return
+        item["text"] = text
+        item["live"] = False
+        self.refresh()
+
+    def remove(self, label):
+        """Удалить сообщение по его Label (например, анимацию мышления)"""
+        item = self._find_by_label(label)
+        if item is None:
+            return
+        self._release(item)
+        self._items.pop(item["index"])
+        self._relayout(item["index"])
+        self._reposition()
+        self._schedule_render()
+
+    def refresh(self):
+        """Перемерить «живые» сообщения, высота которых могла измениться"""
+        live = [item for item in self._materialized if item["live"]]
+        if live:
+            self._measure(live)
+
+    def scroll_to_bottom(self):
+        """Прокрутить к последнему сообщению"""
+        try:
+            self.refresh()
+            self.canvas.yview_moveto(1.0)
+            self._schedule_render()
+        except tk.TclError:
+            pass
+
+    def clear(self):
+        """Удалить все сообщения"""
+        for item in list(self._materialized):
+            self._release(item)
+        self._items = []
+        self._remove_placeholder()
+        self._relayout()
+
+    def set_placeholder(self, widget):
+        """Показать виджет (приветствие) вместо пустой ленты"""
+        self._remove_placeholder()
+        self._placeholder = widget
+        self._placeholder_window = self.canvas.create_window(
+            self.PADX, 0, anchor="nw", window=widget, width=self._content_width()
+        )
+
+    def __len__(self):
+        return len(self._items)
+
+    # ================= LAYOUT =================
+
+    def _make_item(self, role: str, text: str, live: bool = False) -> Dict[str, Any]:
+        return {
+            "role": role,
+            "text": text,
+            "live": live,
+            "height": self._estimate_height(role, text),
+            "index": 0,
+            "bubble": None,
+        }
+
+    def _estimate_height(self, role: str, text: str) -> int:
+        """Оценить высоту пузыря без создания виджетов"""
+        chars_per_line = max(1, self.wraplength // CHAR_WIDTH)
+        lines = sum(max(1, math.ceil(len(line) / chars_per_line)) for line in text.split("\n"))
+        top, bottom = MESSAGE_PADDING[role]
+        return top + bottom + BUBBLE_PADDING + lines * LINE_HEIGHT
+
+    def _relayout(self, start: int = 0):
+        """Пересчитать смещения сообщений начиная с start"""
+        del self._offsets[start:]
+        y = self._offsets[-1] + self._items[start - 1]["height"] if start > 0 else 0
+        for index in range(start, len(self._items)):
+            item = self._items[index]
+            item["index"] = index
+            self._offsets.append(y)
+            y += item["height"]
+        self._total_height = y
+
+        try:
+            self.canvas.configure(scrollregion=(0, 0, self._width, max(y, 1)))
+        except tk.TclError:
+            pass
+
+    def _content_width(self) -> int:
+        return max(1, self._width - 2 * self.PADX)
+
+    def _item_y(self, item: Dict[str, Any]) -> int:
+        return self._offsets[item["index"]] + MESSAGE_PADDING[item["role"]][0]
+
+    def _reposition(self):
+        """Переставить созданные пузыри по актуальным смещениям"""
+        for item in self._materialized:
+            self.canvas.coords(item["bubble"]["window"], self.PADX, self._item_y(item))
+
+    def _visible_range(self):
+        top = self.canvas.canvasy(0)
+        bottom = top + self.canvas.winfo_height()
+        first = max(0, bisect.bisect_right(self._offsets, top) - 1 - self.OVERSCAN)
+        last = min(len(self._items), bisect.bisect_left(self._offsets, bottom) + self.OVERSCAN)
+        return first, last
+
+    def _measure(self, items: List[Dict[str, Any]]):
+        """Заменить оценку высоты на реальную для созданных пузырей"""
+        self.canvas.update_idletasks()
+        first_changed = None
+        for item in items:
+            if not item["bubble"]:
+                continue
+            top, bottom = MESSAGE_PADDING[item["role"]]
+            height = item["bubble"]["frame"].winfo_reqheight() + top + bottom
+            if height != item["height"]:
+                item["height"] = height
+                if first_changed is None or item["index"] < first_changed:
+                    first_changed = item["index"]
+
+        if first_changed is not None:
+            self._relayout(first_changed)
+            self._reposition()
+
+    def _render(self):
+        """Создать пузыри для видимой области и освободить остальные"""
+        self._render_pending = False
+        try:
+            if not self._items:
+                return
+
+            first, last = self._visible_range()
+
+            for item in list(self._materialized):
+                if not item["live"] and not first <= item["index"] < last:
+                    self._release(item)
+
+            new_items = []
+            for index in range(first, last):
+                item = self._items[index]
+                if not item["bubble"]:
+                    self._acquire(item)
+                    new_items.append(item)
+
+            if new_items:
+                self._measure(new_items)
+        except tk.TclError:
+            pass
+
+    def _schedule_render(self):
+        if not self._render_pending:
+            self._render_pending = True
+            self.after_idle(self._render)
+
+    # ================= BUBBLES =================
+
+    def _acquire(self, item: Dict[str, Any]):
+        """Взять пузырь из пула (или создать) и показать в нем сообщение"""
+        pool = self._pools[item["role"]]
+        bubble = pool.pop() if pool else self._create_bubble(item["role"])
+        bubble["label"].configure(text=item["text"])
+        self.canvas.coords(bubble["window"], self.PADX, self._item_y(item))
+        self.canvas.itemconfigure(bubble["window"], state="normal", width=self._content_width())
+        item["bubble"] = bubble
+        self._materialized.append(item)
+
+    def _release(self, item: Dict[str, Any]):
+        """Спрятать пузырь сообщения и вернуть его в пул"""
+        bubble = item["bubble"]
+        if not bubble:
+            return
+        item["bubble"] = None
+        self._materialized.remove(item)
+        try:
+            self.canvas.itemconfigure(bubble["window"], state="hidden")
+            self._pools[item["role"]].append(bubble)
+        except tk.TclError:
+            pass
+
+    def _find_by_label(self, label) -> Optional[Dict[str, Any]]:
+        for item in self._materialized:
+            if item["bubble"]["label"] is label:
+                return item
+        return None
+
+    def _create_bubble(self, role: str) -> Dict[str, Any]:
+        """Создать виджеты пузыря (как в JarvisApp.add_*_message)"""
+        side = "right" if role == "user" else "left"
+
+        # Контейнер для сообщения
+        message_frame = ctk.CTkFrame(self.canvas, fg_color=self.colors["CHAT_BG"])
+
+        # Контейнер для выравнивания
+        align_frame = ctk.CTkFrame(message_frame, fg_color="transparent")
+        align_frame.pack(side=side, anchor="e" if role == "user" else "w")
+
+        # Аватар
+        avatar_frame = ctk.CTkFrame(align_frame, fg_color="transparent", width=40)
+        avatar_frame.pack(side=side, padx=(10, 0) if role == "user" else (0, 10))
+
+        avatar_label = ctk.CTkLabel(
+            avatar_frame,
+            text="👤" if role == "user" else "🤖",
+            font=("Segoe UI", 20),
+            text_color=self.colors["TEXT_PRIMARY"],
+            width=30,
+            height=30
+        )
+        avatar_label.pack()
+
+        # Фрейм пузыря
+        text_frame = ctk.CTkFrame(
+            align_frame,
+            fg_color=self.colors["USER_BUBBLE"] if role == "user" else self.colors["AI_BUBBLE"],
+            corner_radius=12,
+            border_width=0
+        )
+        text_frame.pack(side=side)
+
+        # Текст сообщения
+        text_label = ctk.CTkLabel(
+            text_frame,
+            text="",
+            wraplength=self.wraplength,
+            justify="left",
+            font=("Segoe UI", 13, "italic") if role == "thinking" else ("Segoe UI", 13),
+            text_color=self.colors["USER_TEXT"] if role == "user" else self.colors["AI_TEXT"],
+            padx=16,
+            pady=12
+        )
+        text_label.pack(anchor="w")
+
+        for widget in (message_frame, align_frame, avatar_label, text_frame, text_label):
+            self._bind_wheel(widget)
+
+        window = self.canvas.create_window(
+            self.PADX, 0, anchor="nw", window=message_frame,
+            width=self._content_width(), state="hidden"
+        )
+        return {"frame": message_frame, "label": text_label, "window": window}
+
+    def _remove_placeholder(self):
+        if self._placeholder is not None:
+            try:
+                self.canvas.delete(self._placeholder_window)
+                self._placeholder.destroy()
+            except tk.TclError:
+                pass
+            self._placeholder = None
+            self._placeholder_window = None
+
+    # ================= EVENTS =================
+
+    def _bind_wheel(self, widget):
+        widget.bind("<MouseWheel>", self._on_mousewheel, add="+")
+        widget.bind("<Button-4>", self._on_mousewheel, add="+")
+        widget.bind("<Button-5>", self._on_mousewheel, add="+")
+
+    def _on_mousewheel(self, event):
+        if getattr(event, "num", None) == 4:
+            delta = -1
+        elif getattr(event, "num", None) == 5:
+            delta = 1
+        else:
+            delta = -1 if event.delta > 0 else 1
+        self.canvas.yview_scroll(delta * 3, "units")
+        return "break"
+
+    def _on_yscroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self._schedule_render()
+
+    def _on_configure(self, event):
+        if event.width == self._width:
+            self._schedule_render()
+            return
+
+        self._width = event.width
+        width = self._content_width()
+        for pool in self._pools.values():
+            for bubble in pool:
+                self.canvas.itemconfigure(bubble["window"], width=width)
+        for item in self._materialized:
+            self.canvas.itemconfigure(item["bubble"]["window"], width=width)
+        if self._placeholder_window is not None:
+            self.canvas.itemconfigure(self._placeholder_window, width=width)
+        self._relayout()
+        self._schedule_render()